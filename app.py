@@ -1,28 +1,82 @@
-from flask import Flask, render_template, request, redirect
+import os
+import secrets
+
+from flask import Flask, render_template, request, redirect, jsonify, make_response
 
 from yenepay.PaymentHandler import PaymentHandler, ProcessType, PDT, Item, IPN
+from yenepay.Checkout import MerchantConfig, Checkout
+from yenepay.Cache import PDTCache, SQLiteCache, TTLCache
+from yenepay.CartStore import SQLiteCartStore
+from yenepay.Catalog import Catalog
+from yenepay.Idempotency import SQLiteIPNStore
+from yenepay.IPNQueue import IPNQueue, IPNWorkerPool
+from yenepay.Resilience import CallPolicy
+from yenepay.Exceptions import ValidationError, YenePayError
+from yenepay.Ledger import Ledger
+from yenepay.Metrics import CONTENT_TYPE, PrometheusMetrics
+from yenepay.OrderId import OrderIdGenerator
+from yenepay.Transport import RequestsTransport, SANDBOX_HOST, PROD_HOST
 
 app = Flask(__name__)
 
 # you can get your merchant code and pdt token from your yenepay dashboard
-MERCHANT_CODE = "YOUR MERCHANT CODE"        
-PDT_TOKEN = "YOUR PDT TOKEN"
+MERCHANT_CODE = os.environ.get("YENEPAY_MERCHANT_CODE", "YOUR MERCHANT CODE")
+PDT_TOKEN = os.environ.get("YENEPAY_PDT_TOKEN", "YOUR PDT TOKEN")
 
 USE_SANDBOX = True              # whether we are using yenepay production or sandbox server - 
                                 # set to true if testing
 
-# create PaymentHandler object
-handler = PaymentHandler(MERCHANT_CODE, useSandbox=USE_SANDBOX)
-
-# fill required attributes
-handler.success_url = "http://localhost:5000/success"
-handler.failure_url = "http://localhost:5000/failure"
-handler.cancel_url = "http://localhost:5000/cancel"
-handler.ipn_url = "http://localhost:5000/ipn"
-
-handler.checkout_process = ProcessType.Express
-handler.expires_after = 600
-handler.merchant_order_id = "order-001"
+# sandbox requests go to YENEPAY_SANDBOX_HOST when set, e.g. the stand-in server of benchmarks/load_test.py
+SANDBOX = os.environ.get("YENEPAY_SANDBOX_HOST", SANDBOX_HOST)
+
+# where yenepay sends customers and ipns back to
+APP_URL = os.environ.get("APP_URL", "http://localhost:5000")
+
+# pooled keep-alive connections to yenepay with explicit timeouts (in seconds)
+transport = RequestsTransport(poolSize=10, connectTimeout=3.05, readTimeout=10)
+
+# latency, status and result of every yenepay call, scraped from /metrics
+metrics = PrometheusMetrics()
+
+# merchant settings shared (read only) by every request
+config = MerchantConfig(
+    MERCHANT_CODE,
+    useSandbox=USE_SANDBOX,
+    successUrl=APP_URL + "/success",
+    failureUrl=APP_URL + "/failure",
+    cancelUrl=APP_URL + "/cancel",
+    ipnUrl=APP_URL + "/ipn",
+    process=ProcessType.Express,
+    expiresAfter=600,
+    vatRate=0.15,
+    # double submitted checkouts (same form, same order id, see form_order_id) reuse the url generated
+    # first instead of calling yenepay again
+    checkoutCache=TTLCache(maxEntries=10000, maxBytes=16 * 1024 * 1024, ttl=600),
+    # refreshing /success or /cancel doesn't query yenepay again once the payment is Paid or Canceled
+    # the sqlite backend shares results between worker processes
+    pdtCache=PDTCache(maxEntries=10000, pendingTtl=5, shared=SQLiteCache("yenepay_cache.db", table="pdt")),
+    # retried ipn deliveries that were already verified are answered without calling yenepay
+    ipnStore=SQLiteIPNStore("yenepay_cache.db"),
+    # retry pdt and ipn verification, and fail fast while yenepay is unhealthy
+    callPolicy=CallPolicy(maxAttempts=3, backoff=0.1, hedgeDelay=1.0, failureThreshold=5, resetTimeout=30),
+    # every checkout gets a unique time ordered order id, each worker process leases its own worker id
+    # on the node, set YENEPAY_NODE_ID (0-15) to a different value on every machine when running several
+    orderIds=OrderIdGenerator(prefix="order-"),
+    # report checkout, pdt and ipn calls to the metrics
+    instrumentation=metrics.instrumentation(),
+    transport=transport,
+    sandboxHost=SANDBOX,
+)
+
+# order state: checkouts, pdt and ipn events and the resulting order status
+ledger = Ledger("yenepay_orders.db")
+
+# carts of visitors by session, shared by worker processes (use MemoryCartStore for a single process)
+carts = SQLiteCartStore("yenepay_cache.db", maxCarts=100000, ttl=3600)
+
+# order id of each (form token, item) of the home page, a resubmitted form gets the order it created first
+# kept per worker process, like the checkout cache
+formOrders = TTLCache(maxEntries=10000, ttl=600)
 
 # items to sell
 # Item(id, name, price, quantity)
@@ -31,6 +85,14 @@ plane = Item("item-1", "Plane", 120, 1)
 
 items = [car, plane]
 
+# express checkout payloads of the items, VAT included, compiled once at startup
+# invalid merchant settings (e.g. the placeholder merchant code above) are reported here and on checkout
+catalog = Catalog(config, items)
+try:
+    catalog.compile()
+except ValidationError as e:
+    app.logger.warning("Catalog not compiled: %s", e)
+
 @app.route("/", methods=["GET","POST"])
 def home():
     if request.method == "POST":
@@ -39,22 +101,89 @@ def home():
         index = int(request.form.get("index"))
         item = items[index]
 
-        # add item to order
-        handler.add_item(item)
+        try:
+            # create a checkout for this request only, with the form's merchant order id
+            # its payload comes from the item's precompiled template, VAT is computed from the configured rate
+            handler = catalog.express_checkout(item.item_id, merchantOrderId=form_order_id(index))
 
-        # set additional fees
-        handler.total_delivery_fee = 0
-        handler.total_handling_fee = 0
-        handler.total_discount = 0
-        handler.total_vat = item.unit_price * item.item_quantity * 0.15
+            # generate yenepay checkout url, giving up after 5 seconds
+            url = handler.get_checkout_url(deadline=5)
+        except ValidationError as e:
+            # rejected locally, yenepay was not called
+            return str(e), 400
+        except YenePayError:
+            return "Payment service unavailable, please try again", 503
 
-        # generate yenepay checkout url
-        url = handler.get_checkout_url()
+        # record the new order
+        ledger.record_checkout(handler.merchant_order_id, url, catalog.total(item.item_id))
 
         # redirect user to yenepay payment url to complete payment
         return redirect(url)
 
-    return render_template("index.html")
+    # every rendering of the page gets its own token, resubmitting it pays for the same order
+    return render_template("index.html", token=secrets.token_urlsafe(16))
+
+
+# order id of the submitted home page form, None (a new order id) without a token
+def form_order_id(index):
+    token = request.form.get("token")
+
+    if not token:
+        return None
+
+    return formOrders.get_or_load((token, index), config.orderIds.next)
+
+
+# session id of the visitor from its cookie, or a new one
+def session_id():
+    return request.cookies.get("session_id") or secrets.token_urlsafe(16)
+
+# adds the selected item to the visitor's cart
+@app.route("/cart/add", methods=["POST"])
+def cart_add():
+    sid = session_id()
+    item = items[int(request.form.get("index"))]
+
+    try:
+        carts.add(sid, item, config.vatRate, config.totRate)
+    except ValueError as e:
+        # the cart is full, when the store is given a maxItems
+        return str(e), 400
+
+    response = make_response(redirect("/"))
+    response.set_cookie("session_id", sid, httponly=True, samesite="Lax")
+    return response
+
+# pays for everything in the visitor's cart
+@app.route("/cart/checkout", methods=["POST"])
+def cart_checkout():
+    sid = session_id()
+    cart = carts.get(sid)
+
+    if cart is None or len(cart) == 0:
+        return redirect("/")
+
+    # the stored cart becomes the checkout items as it is
+    handler = Checkout(config)
+    handler.process = ProcessType.Cart
+    handler.items = cart
+
+    try:
+        url = handler.get_checkout_url(deadline=5)
+    except ValidationError as e:
+        return str(e), 400
+    except YenePayError:
+        return "Payment service unavailable, please try again", 503
+
+    ledger.record_checkout(handler.merchant_order_id, url, handler.total)
+    carts.delete(sid)
+
+    return redirect(url)
+
+# carts live, evictions and bytes used
+@app.route("/cart/stats")
+def cart_stats():
+    return jsonify(carts.stats())
 
 
 # on payment success yenepay redirects here
@@ -70,11 +199,17 @@ def success():
     pdt.merchant_order_id = request.args.get("MerchantOrderId")
     pdt.transaction_id = request.args.get("TransactionId")
 
-    resp = handler.request_pdt(pdt)
+    try:
+        resp = Checkout(config).request_pdt(pdt, deadline=5)
+    except YenePayError:
+        resp = None
+
+    if resp is not None:
+        record_pdt(resp)
 
-    if resp["result"] == "SUCCESS" and resp["Status"] == "Paid":
+    if resp is not None and resp.is_paid:
         # This means the payment is completed
-        # You can mark the order as paid here and start delivery
+        # The order is marked as paid in the ledger, you can start delivery here
         return "ok"
     
     else:
@@ -92,11 +227,17 @@ def cancel():
     pdt.merchant_order_id = request.args.get("MerchantOrderId")
     pdt.transaction_id = request.args.get("TransactionId")
 
-    resp = handler.request_pdt(pdt)
+    try:
+        resp = Checkout(config).request_pdt(pdt, deadline=5)
+    except YenePayError:
+        resp = None
+
+    if resp is not None:
+        record_pdt(resp)
 
-    if resp["result"] == "SUCCESS" and resp["Status"] == "Canceled":
+    if resp is not None and resp.is_canceled:
         # This means the payment is canceled
-        # You can mark the order as Canceled here
+        # The order is marked as canceled in the ledger
         return "canceled"
     
     else:
@@ -104,12 +245,45 @@ def cancel():
         return "Pdt request failed"
 
 
+# records a pdt result in the ledger, a ledger error is logged instead of failing the page
+def record_pdt(result):
+    try:
+        ledger.record_pdt(result)
+    except Exception:
+        app.logger.exception("Pdt result of %s not recorded", result.merchantOrderId)
+
+
 # on failure we are redirected here
 @app.route("/failure")
 def failure():
     return "failure"
 
-# accepts Instant payment notification from yenepay and validates it
+# called by the ipn workers once an ipn has been verified with yenepay
+def on_ipn_verified(ipn, authentic):
+    # the ledger applies the ipn status only if it is authentic
+    ledger.record_ipn(ipn, authentic)
+
+    if authentic:
+        # This means the payment is completed
+        # The order is marked as "Paid" or "Completed" in the ledger, you can start the delivery process here
+        pass
+
+    else:
+        # this means the ipn is not authentic
+        pass
+
+# received ipns are stored in a durable queue and verified in the background
+# verified ipns are purged from the queue after a day
+ipn_queue = IPNQueue("yenepay_queue.db")
+ipn_workers = IPNWorkerPool(ipn_queue, Checkout(config).is_ipn_authentic, on_ipn_verified, workers=4, keepDone=86400)
+ipn_workers.start()
+
+metrics.add_gauge("yenepay_ipn_queue_depth", "IPNs waiting to be verified", ipn_queue.depth)
+metrics.add_gauge("yenepay_ipn_queue_lag_seconds", "Age of the oldest IPN waiting to be verified", ipn_queue.lag)
+metrics.add_gauge("yenepay_carts", "Carts of visitors not expired", lambda: carts.stats()["carts"])
+
+# accepts Instant payment notification from yenepay
+# it is queued and acknowledged at once, verification happens in the background
 @app.route("/ipn", methods=["POST"])
 def ipn():
     # get yenepay response as dictionary
@@ -119,17 +293,29 @@ def ipn():
     ipn = IPN()
 
     # fill ipn attributes from dictionary(response)
-    ipn.from_dict(response)
+    try:
+        ipn.from_dict(response)
+    except ValueError:
+        # a required ipn field is missing
+        return "Invalid ipn", 400
 
-    if handler.is_ipn_authentic(ipn):
-        # This means the payment is completed
-	    # You can now mark the order as "Paid" or "Completed" here and start the delivery process
-        return "ipn authentic"
-    
-    else:
-        # this means the payment failed
-        return "Invalid ipn"
+    ipn_queue.enqueue(ipn)
+
+    return "ipn received"
+
+# ipn queue depth, lag and latencies
+@app.route("/ipn/stats")
+def ipn_stats():
+    return jsonify(ipn_workers.stats())
+
+# yenepay call metrics in the prometheus text format
+@app.route("/metrics")
+def metrics_():
+    return metrics.render(), 200, {"Content-Type": CONTENT_TYPE}
 
 
 if __name__ == "__main__":
+    # open a connection to yenepay before the first checkout
+    transport.prewarm([SANDBOX if USE_SANDBOX else PROD_HOST])
+
     app.run(debug=True)
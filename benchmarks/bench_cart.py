@@ -0,0 +1,79 @@
+# compares building and emptying a cart of N distinct items with the previous
+# linear list scan against the indexed Cart used by PaymentHandler
+#
+#   python benchmarks/bench_cart.py [N]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from yenepay.Cart import Cart
+from yenepay.Models import Item
+
+
+# previous PaymentHandler.add_item / remove_item behaviour
+def list_add(items, item):
+
+    item = item.as_dict()
+
+    for i in items:
+        if i["itemId"] == item["itemId"]:
+            i["quantity"] += item["quantity"]
+            break
+    else:
+        items.append(item)
+
+
+def list_remove(items, id_):
+
+    i = 0
+    while (i < len(items)):
+        if items[i]["itemId"] == id_:
+            del items[i]
+            break
+        i += 1
+
+
+def bench_list(products):
+
+    items = []
+
+    start = time.perf_counter()
+    for p in products:
+        list_add(items, p)
+    for p in products:
+        list_add(items, p)
+    for p in reversed(products):
+        list_remove(items, p.item_id)
+
+    return time.perf_counter() - start
+
+
+def bench_cart(products):
+
+    cart = Cart()
+
+    start = time.perf_counter()
+    cart.add_items(products)
+    cart.add_items(products)
+    for p in reversed(products):
+        cart.remove(p.item_id)
+
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    products = [Item(f"item-{i}", f"Item {i}", 10.5, 1) for i in range(n)]
+
+    list_time = bench_list(products)
+    cart_time = bench_cart(products)
+
+    print(f"{n} items: add, merge, remove")
+    print(f"  list scan   {list_time * 1000:10.1f} ms")
+    print(f"  indexed     {cart_time * 1000:10.1f} ms")
+    print(f"  speedup     {list_time / cart_time:10.1f}x")
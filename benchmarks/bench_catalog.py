@@ -0,0 +1,85 @@
+# Express checkout payloads from precompiled catalog templates vs building and encoding a checkout
+#
+#   python benchmarks/bench_catalog.py [skus] [requests]
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from yenepay.Catalog import Catalog
+from yenepay.Checkout import Checkout, MerchantConfig
+from yenepay.Models import Item
+from yenepay.PaymentHandler import ProcessType
+from yenepay.Serializer import BACKEND, encode_checkout
+
+
+config = MerchantConfig(
+    "0000",
+    successUrl="http://localhost:5000/success",
+    failureUrl="http://localhost:5000/failure",
+    cancelUrl="http://localhost:5000/cancel",
+    ipnUrl="http://localhost:5000/ipn",
+    process=ProcessType.Express,
+    expiresAfter=600,
+    vatRate=0.15,
+)
+
+
+# the current path: a checkout built field by field and encoded
+def build(item, order_id, quantity):
+
+    handler = Checkout(config)
+    handler.merchant_order_id = order_id
+    handler.add_item(Item(item.itemId, item.itemName, item.unitPrice, quantity))
+
+    return encode_checkout(handler)
+
+
+def run(label, fn, requests, baseline=None):
+
+    start = time.perf_counter()
+    for i, (item, quantity) in enumerate(requests):
+        fn(item, f"order-{i}", quantity)
+    elapsed = time.perf_counter() - start
+
+    per_call = elapsed / len(requests) * 1e6
+    speedup = f"  {baseline / per_call:.1f}x" if baseline else ""
+    print(f"  {label:32} {per_call:7.2f} us/payload{speedup}")
+
+    return per_call
+
+
+if __name__ == "__main__":
+
+    skus = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+
+    rnd = random.Random(1)
+    items = [Item(f"sku-{i}", f"Product {i}", round(rnd.uniform(1, 5000), 2), 1) for i in range(skus)]
+
+    start = time.perf_counter()
+    catalog = Catalog(config, items)
+    catalog.compile()
+    elapsed = time.perf_counter() - start
+
+    # memory measured on a separate catalog of a tenth of the items, tracing slows compiling down
+    tracemalloc.start()
+    sample = Catalog(config, items[:skus // 10])
+    sample.compile()
+    memory = tracemalloc.get_traced_memory()[0] / len(sample)
+    tracemalloc.stop()
+
+    print(f"{skus:,} skus compiled in {elapsed:.2f}s, ~{memory:.0f} bytes per sku ({BACKEND})")
+
+    requests = [(rnd.choice(items), 1 if rnd.random() < 0.8 else rnd.randint(2, 5)) for _ in range(n)]
+
+    for item, quantity in requests[:1000]:
+        assert catalog.express_payload(item.itemId, "order-x", quantity) == build(item, "order-x", quantity)
+
+    print(f"{n:,} requests, 80% quantity 1")
+    baseline = run("checkout + encode_checkout", build, requests)
+    run("catalog.express_payload", lambda item, order, q: catalog.express_payload(item.itemId, order, q), requests, baseline)
@@ -0,0 +1,69 @@
+# overhead of the instrumentation hooks on pdt requests through a stub transport
+#
+#   python benchmarks/bench_instrumentation.py [calls]
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from yenepay.Metrics import Instrumentation, PrometheusMetrics
+from yenepay.Models import PDT
+from yenepay.PaymentHandler import PaymentHandler
+from yenepay.Transport import Response
+
+
+# yenepay answers a pdt request with the url encoded result as a json string
+PDT_BODY = b'"result=SUCCESS&TotalAmount=100.00&BuyerId=1&MerchantOrderId=order-1&MerchantCode=0000&MerchantId=1&TransactionCode=TX1&TransactionId=1&Status=Paid&Currency=ETB"'
+
+
+# answers every request at once, so only client side costs are measured
+class StubTransport:
+
+    def post(self, url, data, headers, timeout=None):
+
+        return Response(200, PDT_BODY, (0.0, 0.0, 0.0))
+
+
+def run(label, fn, calls, baseline=None):
+
+    pdt = PDT("token")
+    pdt.transactionId = "1"
+    pdt.merchantOrderId = "order-1"
+
+    for _ in range(1000):
+        fn(pdt)
+
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn(pdt)
+    elapsed = time.perf_counter() - start
+
+    per_call = elapsed / calls * 1e6
+    overhead = f"  {per_call - baseline:+.2f} us" if baseline is not None else ""
+    print(f"  {label:36} {per_call:7.2f} us/call{overhead}")
+
+    return per_call
+
+
+if __name__ == "__main__":
+
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    handler = PaymentHandler("0000", transport=StubTransport())
+
+    print(f"{calls:,} pdt requests, stub transport")
+    baseline = run("uninstrumented (_request_pdt)", lambda pdt: handler._request_pdt(pdt, None), calls)
+    run("instrumentation disabled", handler.request_pdt, calls, baseline)
+
+    handler.instrumentation = Instrumentation()
+    run("instrumentation without hooks", handler.request_pdt, calls, baseline)
+
+    metrics = PrometheusMetrics()
+    handler.instrumentation = metrics.instrumentation()
+    run("prometheus metrics", handler.request_pdt, calls, baseline)
+
+    start = time.perf_counter()
+    text = metrics.render()
+    print(f"  render: {len(text.splitlines())} lines in {(time.perf_counter() - start) * 1e3:.2f} ms")
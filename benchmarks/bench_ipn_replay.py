@@ -0,0 +1,87 @@
+# replays a retry heavy stream of ipn deliveries through is_ipn_authentic
+# and counts the remote verification calls with and without an ipn store
+#
+#   python benchmarks/bench_ipn_replay.py [unique ipns]
+
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from yenepay.Idempotency import MemoryIPNStore, SQLiteIPNStore
+from yenepay.Models import IPN
+from yenepay.PaymentHandler import PaymentHandler
+from yenepay.Transport import Response
+
+
+# stands in for yenepay's verify endpoint
+class StubTransport:
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def post(self, url, data, headers):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        return Response(200, b"")
+
+
+# every ipn is delivered once, then retried a geometric number of times
+# (mean 2 retries), some retries arrive concurrently with the first delivery
+def deliveries(n, seed=1):
+
+    rng = random.Random(seed)
+    stream = []
+
+    for i in range(n):
+        ipn = IPN()
+        ipn.transaction_id = f"txn-{i}"
+        ipn.payment_signature = f"sig-{i}"
+        ipn.payment_status = "Paid"
+        stream.append(ipn)
+        while rng.random() < 2 / 3:
+            stream.append(ipn)
+
+    rng.shuffle(stream)
+    return stream
+
+
+def replay(stream, store, latency=0.002, workers=16):
+
+    transport = StubTransport(latency)
+    handler = PaymentHandler("0000", transport=transport)
+    handler.ipn_store = store
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(handler.is_ipn_authentic, stream))
+    elapsed = time.perf_counter() - start
+
+    return transport.calls, elapsed
+
+
+if __name__ == "__main__":
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    stream = deliveries(n)
+
+    print(f"{len(stream)} deliveries of {n} unique ipns")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stores = [
+            ("no store", None),
+            ("memory", MemoryIPNStore()),
+            ("sqlite", SQLiteIPNStore(os.path.join(tmp, "ipn.db"))),
+        ]
+
+        for name, store in stores:
+            calls, elapsed = replay(stream, store)
+            print(f"  {name:9} {calls:7} verification calls   {len(stream) / elapsed:9,.0f} deliveries/s")
@@ -0,0 +1,51 @@
+# sustained ledger write throughput with many writer threads (group commit)
+#
+#   python benchmarks/bench_ledger.py [threads] [events per thread]
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from yenepay.Ledger import Ledger
+from yenepay.Models import IPN
+
+
+def writer(ledger, thread, n):
+
+    for i in range(n):
+        order = f"order-{thread}-{i}"
+        ledger.record_checkout(order, f"https://checkout/{order}", 115)
+
+        ipn = IPN()
+        ipn.merchant_order_id = order
+        ipn.transaction_id = f"txn-{thread}-{i}"
+        ipn.payment_status = "Paid"
+        ledger.record_ipn(ipn, True)
+
+
+if __name__ == "__main__":
+
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    per_thread = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ledger = Ledger(os.path.join(tmp, "ledger.db"))
+
+        workers = [threading.Thread(target=writer, args=(ledger, t, per_thread)) for t in range(threads)]
+
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+
+        ledger.close()
+
+        print(f"{ledger.events} committed events from {threads} threads in {elapsed:.2f}s")
+        print(f"  {ledger.events / elapsed:,.0f} events/s, {ledger.events / ledger.commits:.1f} events per commit")
+        assert ledger.get("order-0-0").status == "Paid"
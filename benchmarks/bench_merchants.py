@@ -0,0 +1,145 @@
+# a noisy merchant flooding a shared connection pool, with and without per merchant quotas,
+# and the cost of routing ipns to their merchant by merchant code
+#
+#   python benchmarks/bench_merchants.py [merchants]
+
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from yenepay.Checkout import MerchantConfig
+from yenepay.Exceptions import CircuitOpenError, QuotaExceeded, YenePayError
+from yenepay.Merchants import MerchantRegistry
+from yenepay.Models import IPN
+from yenepay.Resilience import CallPolicy
+from yenepay.Transport import Response
+
+
+# a pool of 10 connections to a server answering in 20ms, requests wait for a free connection
+class PoolStub:
+
+    def __init__(self, size=10, latency=0.02):
+
+        self.connections = threading.BoundedSemaphore(size)
+        self.latency = latency
+
+    def post(self, url, data, headers, timeout=None):
+
+        with self.connections:
+            time.sleep(self.latency)
+
+        return Response(200, b"")
+
+
+def registry_file(directory, merchants, maxConcurrent):
+
+    path = os.path.join(directory, f"merchants-{maxConcurrent}.json")
+
+    with open(path, "w") as f:
+        json.dump({
+            "defaults": {"maxConcurrent": maxConcurrent, "ipnUrl": "http://localhost:5000/ipn"},
+            "merchants": [{"merchantId": f"{1000 + i}", "pdtToken": f"token-{i}"} for i in range(merchants)],
+        }, f)
+
+    return path
+
+
+def ipn_for(code):
+
+    ipn = IPN()
+    ipn.merchantCode = code
+    ipn.transactionId = "txn-1"
+
+    return ipn
+
+
+# p50 and p99 ms of ipn verifications of a quiet merchant while another one floods the pool
+def noisy_neighbour(registry, seconds=3.0):
+
+    stop = time.monotonic() + seconds
+    quiet = []
+
+    def flood():
+        while time.monotonic() < stop:
+            try:
+                registry.is_ipn_authentic(ipn_for("1000"))
+            except YenePayError:
+                pass
+
+    def calm():
+        while time.monotonic() < stop:
+            start = time.perf_counter()
+            registry.is_ipn_authentic(ipn_for("1001"))
+            quiet.append(time.perf_counter() - start)
+            time.sleep(0.01)
+
+    with ThreadPoolExecutor(41) as executor:
+        for _ in range(40):
+            executor.submit(flood)
+        executor.submit(calm)
+
+    quiet.sort()
+
+    return statistics.median(quiet) * 1e3, quiet[int(len(quiet) * 0.99)] * 1e3
+
+
+# a merchant exhausting its quota must not open the circuit breaker every merchant shares
+def quota_breaker(directory):
+
+    base = MerchantConfig("0000", transport=PoolStub(latency=0.5), callPolicy=CallPolicy(failureThreshold=3, resetTimeout=30))
+    registry = MerchantRegistry(registry_file(directory, 2, 1), base, quotaWait=0.01)
+
+    def noisy():
+        try:
+            registry.is_ipn_authentic(ipn_for("1000"))
+        except QuotaExceeded:
+            return 1
+        return 0
+
+    with ThreadPoolExecutor(6) as executor:
+        rejected = sum(executor.map(lambda _: noisy(), range(6)))
+
+    assert rejected >= 3, f"only {rejected} calls over quota"
+
+    try:
+        registry.is_ipn_authentic(ipn_for("1001"))
+    except CircuitOpenError:
+        raise AssertionError(f"{rejected} QuotaExceeded of one merchant opened the breaker for the others")
+
+    print(f"{rejected} calls of one merchant over its quota, the other merchant's call still goes through\n")
+
+
+if __name__ == "__main__":
+
+    merchants = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    with tempfile.TemporaryDirectory() as directory:
+        quota_breaker(directory)
+
+        transport = PoolStub()
+        base = MerchantConfig("0000", transport=transport)
+
+        for quota, label in ((10, "no quota (pool size)"), (4, "quota of 4 per merchant")):
+            registry = MerchantRegistry(registry_file(directory, 2, quota), base, quotaWait=5.0)
+            p50, p99 = noisy_neighbour(registry)
+            print(f"quiet merchant, {label:24} p50 {p50:6.1f} ms  p99 {p99:6.1f} ms")
+
+        path = registry_file(directory, merchants, 4)
+
+        start = time.perf_counter()
+        registry = MerchantRegistry(path, base)
+        print(f"\n{merchants:,} merchants loaded in {(time.perf_counter() - start) * 1e3:.0f} ms")
+
+        ipns = [ipn_for(f"{1000 + i}") for i in range(merchants)]
+
+        start = time.perf_counter()
+        for ipn in ipns:
+            registry.for_ipn(ipn)
+        print(f"for_ipn: {(time.perf_counter() - start) / merchants * 1e9:.0f} ns per ipn")
@@ -0,0 +1,81 @@
+# per-object memory and throughput of the Item, PDT and IPN models
+#
+#   python benchmarks/bench_models.py
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from yenepay.Models import IPN, PDT, Item
+
+
+IPN_FIELDS = {
+    "TotalAmount": "115.00",
+    "BuyerId": "buyer-1",
+    "MerchantOrderId": "order-001",
+    "MerchantId": "merchant-1",
+    "MerchantCode": "0000",
+    "TransactionId": "txn-1",
+    "TransactionCode": "code-1",
+    "Status": "Paid",
+    "Currency": "ETB",
+    "Signature": "c2lnbmF0dXJl",
+}
+
+
+def new_item():
+
+    return Item("item-0", "Car", 100, 1)
+
+
+def new_pdt():
+
+    pdt = PDT("token")
+    pdt.transaction_id = "txn-1"
+    pdt.merchant_order_id = "order-001"
+    return pdt
+
+
+def new_ipn():
+
+    ipn = IPN()
+    ipn.from_dict(IPN_FIELDS)
+    return ipn
+
+
+# average bytes allocated per object, attributes included
+def bytes_per_object(factory, n=10000):
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    objects = [factory() for _ in range(n)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    size -= sys.getsizeof(objects)
+
+    return size / n
+
+
+def ops_per_sec(stmt, number=200000):
+
+    return number / timeit.timeit(stmt, number=number)
+
+
+if __name__ == "__main__":
+
+    item, pdt, ipn = new_item(), new_pdt(), new_ipn()
+
+    rows = [
+        ("Item", bytes_per_object(new_item), ops_per_sec(new_item), ops_per_sec(item.as_dict)),
+        ("PDT", bytes_per_object(new_pdt), ops_per_sec(new_pdt), ops_per_sec(pdt.as_dict)),
+        ("IPN", bytes_per_object(new_ipn), ops_per_sec(new_ipn), ops_per_sec(ipn.as_dict)),
+    ]
+
+    print(f"{'model':6} {'bytes/obj':>10} {'create/s':>12} {'as_dict/s':>12}")
+    for name, size, create, as_dict in rows:
+        print(f"{name:6} {size:10.0f} {create:12,.0f} {as_dict:12,.0f}")
@@ -0,0 +1,124 @@
+# order id generator throughput, and a collision check across threads and processes
+#
+#   python benchmarks/bench_order_ids.py [processes] [ids per process]
+
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from yenepay.OrderId import SLOT_BITS, OrderIdGenerator
+
+
+def throughput(call, n):
+
+    start = time.perf_counter()
+    for _ in range(n):
+        call()
+    return n / (time.perf_counter() - start)
+
+
+# generator created before forking, inherited by the pool processes
+shared = None
+
+
+# ids of one process, from the generator inherited over fork (worker id re-derived in the child)
+def inherited(n):
+
+    return [shared.next() for _ in range(n)]
+
+
+# generator of a pool process, with the worker id leased from its node
+def lease():
+
+    global shared
+    shared = OrderIdGenerator(prefix="order-")
+
+
+# (worker id, ids) of one pool process
+def leased(n):
+
+    return shared.workerId, inherited(n)
+
+
+# ids per second and ids of one process with an explicit worker id
+def explicit(args):
+
+    workerId, n = args
+    generator = OrderIdGenerator(workerId=workerId, prefix="order-")
+
+    start = time.perf_counter()
+    ids = [generator.next() for _ in range(n)]
+
+    return n / (time.perf_counter() - start), ids
+
+
+def check(name, batches):
+
+    ids = [i for batch in batches for i in batch]
+    assert len(set(ids)) == len(ids), f"{name}: {len(ids) - len(set(ids))} duplicate ids"
+    assert all(batch == sorted(batch) for batch in batches), f"{name}: ids not time ordered"
+    print(f"  {name}: {len(ids):,} ids, no collisions, ordered within each generator")
+
+
+if __name__ == "__main__":
+
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    per_process = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+
+    n = 1000000
+
+    print("single thread")
+    for encoding in ("decimal", "hex", "base36"):
+        generator = OrderIdGenerator(workerId=1, prefix="order-", encoding=encoding)
+        print(f"  next() {encoding:8} {throughput(generator.next, n):>12,.0f} ids/s   e.g. {generator.next()}")
+    generator = OrderIdGenerator(workerId=1)
+    print(f"  next_int()        {throughput(generator.next_int, n):>12,.0f} ids/s")
+
+    print("collisions")
+    generator = OrderIdGenerator(workerId=2, prefix="order-")
+    batches = [[] for _ in range(8)]
+    threads = [threading.Thread(target=lambda b=b: b.extend(generator.next() for _ in range(per_process))) for b in batches]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    check("8 threads, one generator", batches)
+
+    if hasattr(os, "fork"):
+        shared = OrderIdGenerator(prefix="order-")
+        with multiprocessing.get_context("fork").Pool(processes) as pool:
+            check(f"{processes} forked processes, inherited generator", pool.map(inherited, [per_process] * processes))
+
+    # every process of the node sees the same environment
+    os.environ["YENEPAY_NODE_ID"] = "7"
+    with multiprocessing.get_context("spawn").Pool(processes, initializer=lease) as pool:
+        results = pool.map(leased, [per_process] * processes, chunksize=1)
+    workers = {workerId for workerId, _ in results}
+    assert all(workerId >> SLOT_BITS == 7 for workerId in workers), "leased worker ids outside node 7"
+    check(f"{processes} processes, YENEPAY_NODE_ID=7, {len(workers)} leased worker ids", [ids for _, ids in results])
+
+    # closed generators give their slot back, and the next owner of the slot doesn't repeat their ids
+    batches = []
+    for _ in range(200):
+        with OrderIdGenerator(prefix="order-") as generator:
+            batches.append([generator.next() for _ in range(1000)])
+    check("200 generators closed one after another, 64 slots", batches)
+
+    # one worker id for every process of the node is refused instead of repeating ids
+    os.environ["YENEPAY_WORKER_ID"] = "7"
+    try:
+        OrderIdGenerator()
+    except ValueError:
+        print("  YENEPAY_WORKER_ID refused")
+    else:
+        raise AssertionError("YENEPAY_WORKER_ID accepted")
+    del os.environ["YENEPAY_WORKER_ID"], os.environ["YENEPAY_NODE_ID"]
+
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        results = pool.map(explicit, [(w, per_process) for w in range(processes)])
+    check(f"{processes} processes, explicit worker ids", [ids for _, ids in results])
+    print(f"  aggregate {sum(rate for rate, _ in results):,.0f} ids/s across {processes} processes")
@@ -0,0 +1,119 @@
+# checks that both json backends produce the golden checkout, pdt and ipn
+# payloads byte for byte, and that those are the json.dumps bytes sent before
+# (non-ascii escaped) without the whitespace, then measures serialization throughput
+#
+#   python benchmarks/bench_serializer.py
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from yenepay import Serializer
+from yenepay.Models import IPN, PDT, Item
+from yenepay.PaymentHandler import PaymentHandler, ProcessType
+
+
+GOLDEN_CHECKOUT = (
+    b'{"merchantId":"0000","process":"Cart","merchantOrderId":"order-001",'
+    b'"items":[{"itemId":"item-0","itemName":"Car","unitPrice":100,"quantity":2},'
+    b'{"itemId":"item-1","itemName":"\\u12e8\\u1294 \\u1218\\u12aa\\u1293","unitPrice":120.5,"quantity":1}],'
+    b'"ipnUrl":"http://localhost:5000/ipn","successUrl":"http://localhost:5000/success",'
+    b'"cancelUrl":"http://localhost:5000/cancel","failureUrl":"http://localhost:5000/failure",'
+    b'"expiresAfter":600,"totalItemsDeliveryFee":0,"totalItemsHandlingFee":10.25,'
+    b'"totalItemsDiscount":0,"totalItemsTax1":48.08}'
+)
+
+GOLDEN_PDT = b'{"requestType":"PDT","pdtToken":"token","transactionId":"txn-1","merchantOrderId":"order-001"}'
+
+GOLDEN_IPN = (
+    b'{"totalAmount":"115.00","buyerId":"buyer-1","merchantOrderId":"order-001","merchantId":"merchant-1",'
+    b'"merchantCode":"0000","transactionId":"txn-1","transactionCode":"code-1","status":"Paid",'
+    b'"currency":"ETB","signature":"c2lnbmF0dXJl"}'
+)
+
+
+class NoTransport:
+
+    def post(self, url, data, headers):
+        raise RuntimeError("no network in benchmarks")
+
+
+def checkout(n_items=2, name="የኔ መኪና"):
+
+    handler = PaymentHandler("0000", transport=NoTransport())
+    handler.checkout_process = ProcessType.Cart
+    handler.merchant_order_id = "order-001"
+    handler.ipn_url = "http://localhost:5000/ipn"
+    handler.success_url = "http://localhost:5000/success"
+    handler.cancel_url = "http://localhost:5000/cancel"
+    handler.failure_url = "http://localhost:5000/failure"
+    handler.expires_after = 600
+    handler.vat_rate = 0.15
+    handler.add_item(Item("item-0", "Car", 100, 2))
+    handler.add_item(Item("item-1", name, 120.5, 1))
+    for i in range(2, n_items):
+        handler.add_item(Item(f"item-{i}", f"Item {i}", 10, 1), vat_rate=0)
+    handler.total_delivery_fee = 0
+    handler.total_handling_fee = 10.25
+    handler.total_discount = 0
+    return handler
+
+
+def pdt():
+
+    p = PDT("token")
+    p.transaction_id = "txn-1"
+    p.merchant_order_id = "order-001"
+    return p
+
+
+def ipn():
+
+    i = IPN()
+    i.from_dict({
+        "TotalAmount": "115.00", "BuyerId": "buyer-1", "MerchantOrderId": "order-001",
+        "MerchantId": "merchant-1", "MerchantCode": "0000", "TransactionId": "txn-1",
+        "TransactionCode": "code-1", "Status": "Paid", "Currency": "ETB", "Signature": "c2lnbmF0dXJl",
+    })
+    return i
+
+
+def check_golden():
+
+    backends = {"json": Serializer._std_dumps}
+    if Serializer.BACKEND == "orjson":
+        backends["orjson"] = Serializer._orjson_dumps
+
+    cases = [
+        ("checkout", checkout().as_dict(), GOLDEN_CHECKOUT),
+        ("pdt", pdt().as_dict(), GOLDEN_PDT),
+        ("ipn", ipn().as_dict(), GOLDEN_IPN),
+    ]
+
+    for backend, dumps in backends.items():
+        for name, payload, golden in cases:
+            if dumps(payload) != golden:
+                raise SystemExit(f"{backend} {name} payload differs from golden output:\n{dumps(payload)!r}")
+
+            # json.dumps of as_dict as it used to be sent, only the separators' whitespace removed
+            if golden != json.dumps(payload, separators=(",", ":")).encode("utf-8"):
+                raise SystemExit(f"{name} golden output differs from json.dumps")
+
+    print(f"golden payloads match ({', '.join(backends)})")
+
+
+if __name__ == "__main__":
+
+    check_golden()
+
+    number = 20000
+    # orjson only encodes ascii payloads, the others are escaped by json
+    for n_items in (2, 100):
+        for text, name in (("ascii", "My car"), ("amharic", "የኔ መኪና")):
+            handler = checkout(n_items, name)
+            legacy = number / timeit.timeit(lambda: json.dumps(handler.as_dict()).encode("utf-8"), number=number)
+            fast = number / timeit.timeit(lambda: Serializer.encode_checkout(handler), number=number)
+            print(f"checkout {n_items:4} items, {text:7}  json.dumps {legacy:10,.0f}/s   {Serializer.BACKEND} {fast:10,.0f}/s")
@@ -0,0 +1,141 @@
+# checks local ipn signature verification offline with locally generated key pairs (requires cryptography),
+# then measures local verification against the remote verify call it replaces
+#
+#   python benchmarks/bench_signature.py
+
+import logging
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from yenepay.Models import IPN
+from yenepay.PaymentHandler import PaymentHandler
+from yenepay.Signature import SignatureVerifier, sign_ipn
+from yenepay.Transport import Response
+
+
+# answers every ipn verification as authentic and counts the calls
+class CountingTransport:
+
+    def __init__(self):
+        self.calls = 0
+
+    def post(self, url, data, headers, timeout=None):
+        self.calls += 1
+        return Response(200, b"")
+
+
+# (private pem, public pem) of a new rsa key pair
+def key_pair():
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    public = key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+
+    return private, public
+
+
+def ipn(privatePem):
+
+    i = IPN()
+    i.from_dict({
+        "TotalAmount": "115.00", "BuyerId": "buyer-1", "MerchantOrderId": "order-001",
+        "MerchantId": "merchant-1", "MerchantCode": "0000", "TransactionId": "txn-1",
+        "TransactionCode": "code-1", "Status": "Paid", "Currency": "ETB", "Signature": "",
+    })
+    i.signature = sign_ipn(i, privatePem)
+    return i
+
+
+def check_roundtrip():
+
+    current, currentPublic = key_pair()
+    rotated, rotatedPublic = key_pair()
+
+    verifier = SignatureVerifier([currentPublic])
+
+    if not verifier.verify(ipn(current)):
+        raise SystemExit("valid signature rejected")
+
+    for field, value in (("totalAmount", "99999.00"), ("status", "Canceled"), ("merchantOrderId", "order-002")):
+        tampered = ipn(current)
+        setattr(tampered, field, value)
+
+        if verifier.verify(tampered):
+            raise SystemExit(f"ipn with a tampered {field} accepted")
+
+    # yenepay signs with the next key before the merchant added it, then both keys are active
+    if verifier.verify(ipn(rotated)):
+        raise SystemExit("signature of an unknown key accepted")
+
+    verifier.add_key(rotatedPublic)
+
+    if not (verifier.verify(ipn(rotated)) and verifier.verify(ipn(current))):
+        raise SystemExit("signatures of the old or the added key rejected after add_key")
+
+    # without a remote fallback a signature that doesn't match is rejected without asking yenepay
+    tampered = ipn(current)
+    tampered.status = "Canceled"
+
+    for remoteFallback, calls in ((False, 0), (True, 1)):
+        transport = CountingTransport()
+        handler = PaymentHandler("0000", transport=transport)
+        handler.signature_verifier = SignatureVerifier([currentPublic], remoteFallback=remoteFallback)
+
+        if not handler.is_ipn_authentic(ipn(current)) or transport.calls:
+            raise SystemExit(f"remoteFallback={remoteFallback}: valid signature not accepted locally")
+
+        if handler.is_ipn_authentic(tampered) is not remoteFallback or transport.calls != calls:
+            raise SystemExit(f"remoteFallback={remoteFallback}: tampered ipn made {transport.calls} remote calls")
+
+    # the key file is replaced during a rotation, verification goes on with the loaded keys meanwhile
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "yenepay.pem")
+
+        with open(path, "wb") as f:
+            f.write(currentPublic)
+
+        fileVerifier = SignatureVerifier(keyFile=path)
+        logging.getLogger("yenepay").disabled = True
+
+        for content in (None, b"-----BEGIN PUBLIC KEY-----\ntruncated"):
+            if content is None:
+                os.remove(path)
+            else:
+                with open(path, "wb") as f:
+                    f.write(content)
+
+            if not fileVerifier.verify(ipn(current)):
+                raise SystemExit("loaded key dropped while the key file was " + ("missing" if content is None else "invalid"))
+
+        logging.getLogger("yenepay").disabled = False
+
+        with open(path, "wb") as f:
+            f.write(rotatedPublic)
+
+        # a new mtime even on file systems with coarse timestamps
+        os.utime(path, (time.time() + 1, time.time() + 1))
+
+        if not fileVerifier.verify(ipn(rotated)) or fileVerifier.verify(ipn(current)):
+            raise SystemExit("rotated key file not reloaded")
+
+    print("signature round trip: valid, tampered, key rotation, key file and remoteFallback checks pass")
+
+    return verifier, ipn(rotated)
+
+
+if __name__ == "__main__":
+
+    verifier, signed = check_roundtrip()
+
+    number = 2000
+    seconds = timeit.timeit(lambda: verifier.verify(signed), number=number)
+    print(f"local verification with 2 keys: {seconds / number * 1e6:.0f} us per ipn "
+          f"(a remote verify call is a round trip to yenepay, tens to hundreds of ms)")
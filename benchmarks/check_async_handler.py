@@ -0,0 +1,198 @@
+# runs the same checks against PaymentHandler and AsyncPaymentHandler on the local yenepay stand-in
+# (benchmarks/yenepay_standin.py): checkout urls, validation and checkout errors, pdt, ipn verification,
+# the checkout cache, ipn stores, call policy retries and deadlines, and the async handlers' shared connection pool
+# exits with status 1 if a check fails
+#
+#   python benchmarks/check_async_handler.py
+
+import asyncio
+import os
+import sys
+import tempfile
+from urllib.parse import parse_qsl, urlparse
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from yenepay.AsyncPaymentHandler import AsyncPaymentHandler
+from yenepay.Cache import TTLCache
+from yenepay.Exceptions import CheckoutError, ServerError, ValidationError, YenePayError
+from yenepay.Idempotency import MemoryIPNStore, SQLiteIPNStore
+from yenepay.Models import IPN, PDT, Item
+from yenepay.PaymentHandler import PaymentHandler
+from yenepay.Resilience import CallPolicy
+from yenepay.Transport import default_async_transport
+
+from yenepay_standin import Fault, Latency, StandIn
+
+
+PDT_TOKEN = "standin-token"
+
+
+def handler_for(cls, standin, orderId):
+
+    handler = cls("0000")
+    handler.sandboxHost = standin.url
+    handler.merchant_order_id = orderId
+    handler.success_url = "http://shop.test/success"
+    handler.cancel_url = "http://shop.test/cancel"
+    handler.ipn_url = "http://shop.test/ipn"
+    handler.add_item(Item("item-0", "Car", 100, 2))
+
+    return handler
+
+
+# pays a checkout url on the stand-in, returns the fields the customer is redirected back with
+def pay(url):
+
+    response = requests.get(url, allow_redirects=False, timeout=10)
+
+    return dict(parse_qsl(urlparse(response.headers["Location"]).query))
+
+
+def raises(error, call):
+
+    try:
+        call()
+    except error:
+        return True
+
+    return False
+
+
+# name of every failed check of one handler class
+# call resolves what a handler method returned: the value itself, or the awaited coroutine
+def run_checks(cls, standin, call, directory):
+
+    failed = []
+    prefix = cls.__name__
+
+    def check(name, ok):
+        print(f"{prefix:20} {name:36} {'ok' if ok else 'FAIL'}")
+        if not ok:
+            failed.append(f"{prefix} {name}")
+
+    handler = handler_for(cls, standin, f"{prefix}-1")
+    url = call(handler.get_checkout_url())
+    check("checkout url", url.startswith(standin.url + "Home/Process/?Token="))
+
+    fields = pay(url)
+    check("payment redirect", fields.get("Status") == "Paid" and fields.get("MerchantOrderId") == f"{prefix}-1")
+
+    pdt = PDT(PDT_TOKEN)
+    pdt.transaction_id = fields["TransactionId"]
+    pdt.merchant_order_id = f"{prefix}-1"
+    result = call(handler.request_pdt(pdt))
+    check("pdt of a paid order", result is not None and result.is_paid and result.transaction_id == fields["TransactionId"])
+
+    pdt.merchant_order_id = "someone-else"
+    result = call(handler.request_pdt(pdt))
+    check("pdt of another order", result is not None and not result.is_success)
+
+    ipn = IPN()
+    ipn.from_dict(dict(fields, Signature=""))
+    check("authentic ipn", call(handler.is_ipn_authentic(ipn)) is True)
+
+    ipn.status = "Canceled"
+    check("tampered ipn", call(handler.is_ipn_authentic(ipn)) is False)
+    ipn.status = "Paid"
+
+    for store in (MemoryIPNStore(), SQLiteIPNStore(os.path.join(directory, f"{prefix}-ipn.db"))):
+        name = type(store).__name__
+        stored = handler_for(cls, standin, f"{prefix}-1")
+        stored.ipn_store = store
+        sent = standin.requests["ipn"]
+        results = [call(stored.is_ipn_authentic(ipn)) for _ in range(3)]
+        check(f"{name} answers redeliveries", results == [True] * 3 and standin.requests["ipn"] == sent + 1)
+
+        # same transaction id and signature as the verified ipn, other amount
+        forged = IPN()
+        forged.from_dict(dict(fields, Signature="", TotalAmount="99999.00"))
+        check(f"{name} verifies changed ipns", call(stored.is_ipn_authentic(forged)) is False
+              and standin.requests["ipn"] == sent + 2)
+
+    invalid = handler_for(cls, standin, f"{prefix}-2")
+    invalid.clear()
+    sent = standin.requests["checkout"]
+    check("invalid checkout not sent", raises(ValidationError, lambda: call(invalid.get_checkout_url()))
+          and standin.requests["checkout"] == sent)
+
+    rejected = handler_for(cls, standin, f"{prefix}-3")
+    rejected.payload = b'{"merchantId": "0000"}'
+    check("rejected checkout", raises(CheckoutError, lambda: call(rejected.get_checkout_url())))
+
+    cached = handler_for(cls, standin, f"{prefix}-4")
+    cached.checkout_cache = TTLCache(ttl=60)
+    sent = standin.requests["checkout"]
+    first, second = call(cached.get_checkout_url()), call(cached.get_checkout_url())
+    check("checkout cache", first == second and standin.requests["checkout"] == sent + 1)
+
+    standin.faults["pdt"] = Fault(errorRate=1.0, errorStatus=503)
+    retried = handler_for(cls, standin, f"{prefix}-5")
+    retried.call_policy = CallPolicy(maxAttempts=3, backoff=0.01)
+    sent = standin.requests["pdt"]
+    check("pdt retried on server errors", raises(ServerError, lambda: call(retried.request_pdt(pdt)))
+          and standin.requests["pdt"] == sent + 3)
+
+    standin.faults["pdt"] = Fault(latency=Latency("fixed:1"))
+    check("pdt past its deadline", raises(YenePayError, lambda: call(handler.request_pdt(pdt, deadline=0.2))))
+    standin.faults["pdt"] = Fault()
+
+    return failed
+
+
+if __name__ == "__main__":
+
+    standin = StandIn(ipnCopies=0).start()
+    loop = asyncio.new_event_loop()
+    directory = tempfile.TemporaryDirectory()
+
+    try:
+        failed = run_checks(PaymentHandler, standin, lambda value: value, directory.name)
+        failed += run_checks(AsyncPaymentHandler, standin, loop.run_until_complete, directory.name)
+
+        async def shared():
+            a, b = AsyncPaymentHandler("0000"), AsyncPaymentHandler("0000")
+            pool = default_async_transport().current()
+            await a.aclose()
+            return a.transport is b.transport and default_async_transport().current() is pool
+
+        # concurrent deliveries of one ipn share a verification
+        async def coalesced():
+            handler = handler_for(AsyncPaymentHandler, standin, "coalesced")
+            handler.ipn_store = MemoryIPNStore()
+            fields = pay(await handler.get_checkout_url())
+            ipn = IPN()
+            ipn.from_dict(dict(fields, Signature=""))
+            sent = standin.requests["ipn"]
+            results = await asyncio.gather(*(handler.is_ipn_authentic(ipn) for _ in range(5)))
+            return results == [True] * 5 and standin.requests["ipn"] == sent + 1
+
+        # concurrent identical checkouts share one call to yenepay
+        async def checkouts():
+            handler = handler_for(AsyncPaymentHandler, standin, "coalesced-checkout")
+            handler.checkout_cache = TTLCache(ttl=60)
+            sent = standin.requests["checkout"]
+            urls = await asyncio.gather(*(handler.get_checkout_url() for _ in range(5)))
+            return len(set(urls)) == 1 and standin.requests["checkout"] == sent + 1
+
+        for name, check in (("handlers share one pool", shared), ("concurrent ipns coalesced", coalesced),
+                            ("concurrent checkouts coalesced", checkouts)):
+            ok = loop.run_until_complete(check())
+            print(f"{'AsyncPaymentHandler':20} {name:36} {'ok' if ok else 'FAIL'}")
+
+            if not ok:
+                failed.append(f"AsyncPaymentHandler {name}")
+
+        loop.run_until_complete(default_async_transport().close())
+    finally:
+        loop.close()
+        standin.stop()
+        directory.cleanup()
+
+    if failed:
+        print(f"\nFAILED: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+    print("\nboth handlers pass every check")
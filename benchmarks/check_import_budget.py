@@ -0,0 +1,101 @@
+# import time and memory budget of the yenepay package, measured in fresh interpreters
+# fails (exit status 1) when an import is slower or allocates more than its budget, or loads
+# a module that should only be imported on first use (the network stack, sqlite3, json backends ...)
+#
+#   python benchmarks/check_import_budget.py [--runs 7] [--scale 1.0]
+#
+# times are the median of several runs with bytecode already compiled, as in a deployed process
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# modules no import of the handler API may load, they are imported when first needed
+LAZY = ("requests", "urllib3", "httpx", "sqlite3", "orjson", "json", "hashlib", "concurrent.futures",
+        "asyncio", "logging", "cryptography", "numpy")
+
+# (import statement, milliseconds, KiB allocated)
+BUDGETS = [
+    ("from yenepay.PaymentHandler import PaymentHandler, ProcessType, PDT, Item, IPN", 40.0, 1024),
+    ("from yenepay.Checkout import MerchantConfig, Checkout", 45.0, 1280),
+]
+
+CHILD = """
+import sys, time
+sys.path.insert(0, {root!r})
+trace = {trace!r}
+if trace:
+    import tracemalloc
+    tracemalloc.start()
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+size = tracemalloc.get_traced_memory()[0] if trace else None
+modules = sorted(sys.modules)
+import json
+print(json.dumps({{"ms": elapsed * 1e3, "bytes": size, "modules": modules}}))
+"""
+
+
+def run(statement, trace):
+
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(root=ROOT, trace=trace, statement=statement)],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+
+    return json.loads(output)
+
+
+def check(statement, maxMs, maxKib, runs):
+
+    # the first run compiles the bytecode
+    run(statement, False)
+
+    times = [run(statement, False)["ms"] for _ in range(runs)]
+    traced = run(statement, True)
+
+    ms = statistics.median(times)
+    kib = traced["bytes"] / 1024
+    loaded = [name for name in LAZY if name in traced["modules"]]
+
+    failures = []
+
+    if ms > maxMs:
+        failures.append(f"{ms:.1f} ms > {maxMs:.1f} ms")
+
+    if kib > maxKib:
+        failures.append(f"{kib:.0f} KiB > {maxKib:.0f} KiB")
+
+    if loaded:
+        failures.append("loads " + ", ".join(loaded))
+
+    status = "FAIL " + "; ".join(failures) if failures else "ok"
+    print(f"{statement}\n    {ms:6.1f} ms (budget {maxMs:.0f})  {kib:6.0f} KiB (budget {maxKib})  "
+          f"{len(traced['modules'])} modules  {status}")
+
+    return not failures
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=7, help="timed runs per import, the median is checked")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the time budgets, e.g. for slow ci machines")
+    args = parser.parse_args()
+
+    results = [check(statement, ms * args.scale, kib, args.runs) for statement, ms, kib in BUDGETS]
+
+    if not all(results):
+        print(f"\nFAILED: {results.count(False)} import(s) over budget", file=sys.stderr)
+        sys.exit(1)
+
+    print("\nall imports within budget")
@@ -0,0 +1,256 @@
+# load test of app.py against the local yenepay stand-in (benchmarks/yenepay_standin.py)
+# every shopper repeatedly buys an item: POST / -> pays on the stand-in -> /success (or /cancel),
+# and the stand-in posts the ipn to /ipn, which the app verifies in the background
+#
+#   python benchmarks/load_test.py --shoppers 20 --orders 25
+#   python benchmarks/load_test.py --shoppers 50 --duration 60 --latency pdt=lognormal:0.08,0.5 --errors checkout=0.01
+#   python benchmarks/load_test.py --app http://127.0.0.1:5000 --standin-port 8765   against an app started by hand
+#
+# without --app, app.py is started in a temporary directory with the stand-in as its sandbox
+# reports throughput and p50/p95/p99 latency per route, --json writes the report to a file
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import requests
+
+from yenepay_standin import StandIn, add_fault_arguments, faults_from_arguments
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def free_port() -> int:
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# app.py in a subprocess with its databases in a temporary directory
+def start_app(standin: StandIn, port: int, directory: str, log):
+
+    url = f"http://127.0.0.1:{port}"
+    env = dict(
+        os.environ,
+        PYTHONPATH=ROOT,
+        YENEPAY_SANDBOX_HOST=standin.url,
+        YENEPAY_MERCHANT_CODE="0000",
+        YENEPAY_PDT_TOKEN="standin-token",
+        APP_URL=url,
+    )
+    command = [sys.executable, "-c", f"import app; app.app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    process = subprocess.Popen(command, cwd=directory, env=env, stdout=log, stderr=log)
+
+    deadline = time.monotonic() + 30
+
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"app.py exited with status {process.returncode}")
+
+        try:
+            requests.get(url + "/ipn/stats", timeout=1)
+            return process, url
+        except requests.RequestException:
+            time.sleep(0.2)
+
+    process.kill()
+    raise RuntimeError("app.py did not start within 30 seconds")
+
+
+# latencies and failures of each route
+class Recorder:
+
+    def __init__(self) -> None:
+
+        self.latencies: Dict[str, List[float]] = {}
+        self.failures: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, route: str, seconds: float, ok: bool) -> None:
+
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds)
+
+            if not ok:
+                self.failures[route] = self.failures.get(route, 0) + 1
+
+
+def percentile(ordered: List[float], p: float) -> float:
+
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered) + 0.5)) - 1))]
+
+
+# one shopper buying until it placed its orders or the time is up
+def shop(app: str, recorder: Recorder, orders: int, stop: float, cancelRate: float, seed: int) -> None:
+
+    rnd = random.Random(seed)
+    session = requests.Session()
+
+    def timed(route, method, url, **kwargs):
+        start = time.perf_counter()
+
+        try:
+            response = session.request(method, url, allow_redirects=False, timeout=60, **kwargs)
+        except requests.RequestException:
+            recorder.add(route, time.perf_counter() - start, False)
+            return None
+
+        ok = response.status_code < 400
+        recorder.add(route, time.perf_counter() - start, ok)
+
+        return response if ok else None
+
+    placed = 0
+
+    while placed < orders and time.monotonic() < stop:
+        placed += 1
+
+        response = timed("POST /", "POST", app + "/", data={"index": str(rnd.randint(0, 1))})
+
+        if response is None or "Location" not in response.headers:
+            continue
+
+        payment = response.headers["Location"]
+        cancel = rnd.random() < cancelRate
+
+        response = timed("pay (stand-in)", "GET", payment + ("&cancel=1" if cancel else ""))
+
+        if response is None or "Location" not in response.headers:
+            continue
+
+        timed("GET /cancel" if cancel else "GET /success", "GET", response.headers["Location"])
+
+    session.close()
+
+
+def report(recorder: Recorder, standin: StandIn, elapsed: float, ipnStats: dict) -> dict:
+
+    routes = {}
+    latencies = dict(recorder.latencies)
+    failures = dict(recorder.failures)
+
+    ipns = [seconds for seconds, status in standin.ipnDeliveries]
+
+    if ipns:
+        latencies["POST /ipn"] = ipns
+        failures["POST /ipn"] = sum(1 for _, status in standin.ipnDeliveries if status is None or status >= 400)
+
+    for route, values in latencies.items():
+        ordered = sorted(values)
+        routes[route] = {
+            "requests": len(values),
+            "failures": failures.get(route, 0),
+            "throughput": len(values) / elapsed,
+            "p50_ms": percentile(ordered, 50) * 1e3,
+            "p95_ms": percentile(ordered, 95) * 1e3,
+            "p99_ms": percentile(ordered, 99) * 1e3,
+            "max_ms": ordered[-1] * 1e3,
+        }
+
+    return {"seconds": elapsed, "routes": routes, "standin": standin.stats(), "app_ipn": ipnStats}
+
+
+def print_report(result: dict) -> None:
+
+    print(f"\n{result['seconds']:.1f}s")
+    print(f"{'route':18} {'requests':>9} {'failed':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+
+    for route, r in result["routes"].items():
+        print(f"{route:18} {r['requests']:9} {r['failures']:7} {r['throughput']:8.1f} "
+              f"{r['p50_ms']:8.1f} {r['p95_ms']:8.1f} {r['p99_ms']:8.1f} {r['max_ms']:8.1f}")
+
+    standin = result["standin"]
+    print(f"\nstand-in: {standin['requests']}, injected errors {standin['errors']}, drips {standin['drips']}")
+
+    if result["app_ipn"]:
+        ipn = result["app_ipn"]
+        print(f"app ipn queue: depth {ipn['depth']}, verified {ipn['verified']}, retried {ipn['retried']}, "
+              f"dead lettered {ipn['dead_lettered']}")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shoppers", type=int, default=10, help="concurrent shoppers")
+    parser.add_argument("--orders", type=int, default=20, help="orders placed by each shopper")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    parser.add_argument("--cancel-rate", type=float, default=0.1, help="fraction of payments canceled")
+    parser.add_argument("--app", default=None, help="url of a running app.py, started here when not given")
+    parser.add_argument("--standin-port", type=int, default=0, help="port of the stand-in, any free port by default")
+    parser.add_argument("--drain", type=float, default=30.0, help="seconds to wait for the app to verify queued ipns")
+    parser.add_argument("--json", default=None, help="file the report is written to")
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    standin = StandIn(port=args.standin_port, faults=faults_from_arguments(args), ipnDelay=args.ipn_delay,
+                      ipnCopies=args.ipn_copies, seed=args.seed).start()
+    process = None
+    directory = tempfile.mkdtemp(prefix="yenepay-load-")
+    log = tempfile.TemporaryFile()
+
+    try:
+        if args.app is None:
+            process, app = start_app(standin, free_port(), directory, log)
+        else:
+            app = args.app.rstrip("/")
+            print(f"stand-in at {standin.url}, the app has to run with YENEPAY_SANDBOX_HOST={standin.url}")
+
+        print(f"{args.shoppers} shoppers, {args.orders} orders each, app at {app}")
+
+        recorder = Recorder()
+        stop = time.monotonic() + args.duration if args.duration else float("inf")
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(args.shoppers) as shoppers:
+            for i in range(args.shoppers):
+                shoppers.submit(shop, app, recorder, args.orders, stop, args.cancel_rate,
+                                (args.seed or 0) * 100003 + i)
+
+        elapsed = time.perf_counter() - start
+
+        # ipns still scheduled are posted, then the app gets time to verify them
+        standin.finish_ipns()
+
+        ipnStats = None
+        deadline = time.monotonic() + args.drain
+
+        while True:
+            try:
+                ipnStats = requests.get(app + "/ipn/stats", timeout=5).json()
+            except (requests.RequestException, ValueError):
+                break
+
+            if ipnStats["depth"] == 0 or time.monotonic() > deadline:
+                break
+
+            time.sleep(0.2)
+
+        result = report(recorder, standin, elapsed, ipnStats)
+        print_report(result)
+
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(result, f, indent=2)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(10)
+
+            if process.returncode not in (0, -15):
+                log.seek(0)
+                print(log.read().decode("utf-8", "replace")[-4000:], file=sys.stderr)
+
+        standin.stop()
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,485 @@
+# benchmark suite: models, serialization, cart operations and the flask routes of app.py
+# with yenepay stubbed, results are written as json and compared against a stored baseline
+#
+#   python benchmarks/suite.py                    run, write benchmarks/results.json, compare to the baseline
+#   python benchmarks/suite.py --save-baseline    run and store the results as the new baseline
+#   python benchmarks/suite.py --filter route     only benchmarks whose name contains "route"
+#
+# exits with status 1 when a benchmark is slower than the baseline by more than --threshold
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from yenepay.Models import IPN, PDT, Item
+from yenepay.PaymentHandler import PaymentHandler, ProcessType
+from yenepay.Serializer import BACKEND, dumps, encode_checkout, encode_ipn, encode_pdt
+from yenepay.Transport import Response
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IPN_FIELDS = {
+    "TotalAmount": "115.00",
+    "BuyerId": "buyer-1",
+    "MerchantOrderId": "order-001",
+    "MerchantId": "merchant-1",
+    "MerchantCode": "0000",
+    "TransactionId": "txn-1",
+    "TransactionCode": "code-1",
+    "Status": "Paid",
+    "Currency": "ETB",
+    "Signature": "c2lnbmF0dXJl",
+}
+
+CART_SIZES = (10, 100, 1000)
+
+# registered benchmarks: name -> setup returning the function to time
+BENCHMARKS = {}
+
+
+def benchmark(name):
+
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+
+    return register
+
+
+# answers yenepay requests the way the sandbox does, without network
+# pdt requests for order ids starting with "cancel" are answered Canceled, others Paid
+class StubYenePay:
+
+    def post(self, url, data, headers, timeout=None):
+
+        if "/getcheckouturl/" in url:
+            return Response(200, b'{"result":"https://test.yenepay.com/Home/Process/?Token=bench"}')
+
+        if "/verify/pdt/" in url:
+            pdt = json.loads(data)
+            status = "Canceled" if pdt["merchantOrderId"].startswith("cancel") else "Paid"
+            query = (
+                f"result=SUCCESS&TotalAmount=115.00&BuyerId=buyer-1&MerchantOrderId={pdt['merchantOrderId']}"
+                f"&MerchantCode=0000&MerchantId=merchant-1&TransactionCode=code-1"
+                f"&TransactionId={pdt['transactionId']}&Status={status}&Currency=ETB"
+            )
+            return Response(200, dumps(query))
+
+        return Response(200, b"")
+
+
+# models
+
+@benchmark("models.item.create")
+def _():
+
+    return lambda: Item("item-0", "Car", 100, 1)
+
+
+@benchmark("models.item.as_dict")
+def _():
+
+    return Item("item-0", "Car", 100, 1).as_dict
+
+
+@benchmark("models.pdt.create")
+def _():
+
+    def create():
+        pdt = PDT("token")
+        pdt.transaction_id = "txn-1"
+        pdt.merchant_order_id = "order-001"
+        return pdt
+
+    return create
+
+
+@benchmark("models.pdt.as_dict")
+def _():
+
+    pdt = PDT("token")
+    pdt.transaction_id = "txn-1"
+    pdt.merchant_order_id = "order-001"
+
+    return pdt.as_dict
+
+
+@benchmark("models.ipn.from_dict")
+def _():
+
+    def create():
+        ipn = IPN()
+        ipn.from_dict(IPN_FIELDS)
+        return ipn
+
+    return create
+
+
+@benchmark("models.ipn.as_dict")
+def _():
+
+    ipn = IPN()
+    ipn.from_dict(IPN_FIELDS)
+
+    return ipn.as_dict
+
+
+# cart operations on carts of growing size
+
+def _handler(size):
+
+    handler = PaymentHandler("0000")
+    handler.vatRate = 0.15
+    handler.add_items(Item(f"item-{i}", f"Product {i}", 10 + i, 1) for i in range(size))
+
+    return handler
+
+
+def _cart_benchmarks(size):
+
+    @benchmark(f"cart.{size}.add_remove")
+    def _():
+
+        handler = _handler(size)
+        item = Item("new", "New product", 5, 1)
+
+        def add_remove():
+            handler.add_item(item)
+            handler.remove_item("new")
+
+        return add_remove
+
+    @benchmark(f"cart.{size}.add_existing")
+    def _():
+
+        handler = _handler(size)
+        item = Item(f"item-{size // 2}", "Product", 10, 1)
+
+        return lambda: handler.add_item(item)
+
+    @benchmark(f"cart.{size}.total")
+    def _():
+
+        return lambda handler=_handler(size): handler.total
+
+
+for _size in CART_SIZES:
+    _cart_benchmarks(_size)
+
+
+# serialization of request payloads
+
+def _checkout(size):
+
+    handler = _handler(size)
+    handler.merchantOrderId = "order-001"
+    handler.successUrl = "http://localhost:5000/success"
+    handler.ipnUrl = "http://localhost:5000/ipn"
+    handler.process = ProcessType.Cart if size > 1 else ProcessType.Express
+
+    return handler
+
+
+@benchmark("serialize.checkout.1.json_dumps")
+def _():
+
+    handler = _checkout(1)
+
+    return lambda: json.dumps(handler.as_dict())
+
+
+@benchmark("serialize.checkout.1.encode")
+def _():
+
+    return lambda handler=_checkout(1): encode_checkout(handler)
+
+
+@benchmark("serialize.checkout.100.json_dumps")
+def _():
+
+    handler = _checkout(100)
+
+    return lambda: json.dumps(handler.as_dict())
+
+
+@benchmark("serialize.checkout.100.encode")
+def _():
+
+    return lambda handler=_checkout(100): encode_checkout(handler)
+
+
+@benchmark("serialize.pdt.encode")
+def _():
+
+    pdt = PDT("token")
+    pdt.transaction_id = "txn-1"
+    pdt.merchant_order_id = "order-001"
+
+    return lambda: encode_pdt(pdt)
+
+
+@benchmark("serialize.ipn.encode")
+def _():
+
+    ipn = IPN()
+    ipn.from_dict(IPN_FIELDS)
+
+    return lambda: encode_ipn(ipn)
+
+
+# flask routes through the test client, the app's databases live in a temporary directory
+
+_app = None
+
+
+def _load_app():
+
+    global _app
+
+    if _app is None:
+        directory = tempfile.mkdtemp(prefix="yenepay-bench-")
+        cwd = os.getcwd()
+        os.chdir(directory)
+
+        try:
+            import app
+        finally:
+            os.chdir(cwd)
+
+        # a valid merchant code and the stub instead of yenepay, the ipn workers would verify with the real one
+        app.ipn_workers.stop()
+        app.config = app.config._replace(merchantId="0000", transport=StubYenePay())
+        app.catalog.config = app.config
+        app.catalog.compile()
+        app.app.logger.disabled = True
+
+        _app = (app, directory)
+
+    return _app[0]
+
+
+# a route benchmark timing an error page would be meaningless, so the first response is checked
+def _expect(response, status, body=None):
+
+    if response.status_code != status or (body is not None and response.get_data(as_text=True) != body):
+        raise AssertionError(f"unexpected response {response.status_code} {response.get_data(as_text=True)[:200]!r}")
+
+
+def _unload_app():
+
+    if _app is not None:
+        app, directory = _app
+        app.ledger.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+@benchmark("route.home.get")
+def _():
+
+    client = _load_app().app.test_client()
+    _expect(client.get("/"), 200)
+
+    return lambda: client.get("/")
+
+
+@benchmark("route.home.post")
+def _():
+
+    client = _load_app().app.test_client()
+    _expect(client.post("/", data={"index": "0"}), 302)
+
+    return lambda: client.post("/", data={"index": "0"})
+
+
+@benchmark("route.success")
+def _():
+
+    client = _load_app().app.test_client()
+    ids = itertools.count()
+
+    def success():
+        i = next(ids)
+        return client.get(f"/success?MerchantOrderId=order-{i}&TransactionId=txn-{i}")
+
+    _expect(success(), 200, "ok")
+
+    return success
+
+
+@benchmark("route.cancel")
+def _():
+
+    client = _load_app().app.test_client()
+    ids = itertools.count()
+
+    def cancel():
+        i = next(ids)
+        return client.get(f"/cancel?MerchantOrderId=cancel-{i}&TransactionId=txn-{i}")
+
+    _expect(cancel(), 200, "canceled")
+
+    return cancel
+
+
+@benchmark("route.ipn")
+def _():
+
+    client = _load_app().app.test_client()
+    _expect(client.post("/ipn", data=IPN_FIELDS), 200, "ipn received")
+
+    return lambda: client.post("/ipn", data=IPN_FIELDS)
+
+
+# runs fn in loops of at least minTime seconds, repeats times
+# returns nanoseconds per call of the fastest and the median loop
+def measure(fn, repeats, minTime):
+
+    fn()
+
+    loops = 1
+
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+
+        if elapsed >= minTime:
+            break
+
+        loops = loops * 10 if elapsed < minTime / 10 else loops * 2
+
+    timings = [elapsed]
+
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        timings.append(time.perf_counter() - start)
+
+    timings = [t / loops * 1e9 for t in timings]
+
+    return {"ns_per_op": min(timings), "median_ns": statistics.median(timings), "loops": loops, "repeats": repeats}
+
+
+def environment():
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "serializer": BACKEND,
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+# prints current vs baseline, returns the names of benchmarks slower than threshold allows
+def compare(results, baseline, threshold):
+
+    regressions = []
+
+    for key in ("python", "implementation", "machine", "serializer"):
+        if baseline["environment"].get(key) != results["environment"].get(key):
+            print(f"warning: baseline {key} {baseline['environment'].get(key)!r}, "
+                  f"now {results['environment'].get(key)!r}, timings may not be comparable")
+
+    print(f"\n{'benchmark':36} {'baseline':>12} {'current':>12} {'change':>8}")
+
+    for name, result in results["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+
+        if before is None:
+            print(f"{name:36} {'-':>12} {result['ns_per_op']:10.0f}ns {'new':>8}")
+            continue
+
+        change = result["ns_per_op"] / before["ns_per_op"] - 1
+        flag = ""
+
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+
+        print(f"{name:36} {before['ns_per_op']:10.0f}ns {result['ns_per_op']:10.0f}ns {change:+8.1%}{flag}")
+
+    return regressions
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", default=os.path.join(HERE, "results.json"), help="json file the results are written to")
+    parser.add_argument("--baseline", default=os.path.join(HERE, "baseline.json"), help="json file of the stored baseline")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown against the baseline (0.25 = 25%%)")
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this")
+    parser.add_argument("--repeats", type=int, default=5, help="timed loops per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.1, help="seconds a timed loop runs at least")
+    args = parser.parse_args(argv)
+
+    results = {"environment": environment(), "benchmarks": {}}
+
+    try:
+        for name, setup in BENCHMARKS.items():
+            if args.filter not in name:
+                continue
+
+            result = results["benchmarks"][name] = measure(setup(), args.repeats, args.min_time)
+            print(f"{name:36} {result['ns_per_op']:10.0f} ns/op  (median {result['median_ns']:.0f})")
+    finally:
+        _unload_app()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"results written to {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+        print(f"baseline stored in {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}, run with --save-baseline to store one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = compare(results, baseline, args.threshold)
+
+    if regressions:
+        print(f"\nFAILED: {len(regressions)} benchmark(s) more than {args.threshold:.0%} slower than the baseline: "
+              + ", ".join(regressions), file=sys.stderr)
+        return 1
+
+    print(f"\nno benchmark more than {args.threshold:.0%} slower than the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+
+    sys.exit(main())
@@ -0,0 +1,485 @@
+# local stand-in for the yenepay sandbox, for load tests without network
+# requests and responses have the shapes PaymentHandler sends and parses:
+#
+#   POST /api/urlgenerate/getcheckouturl/   checkout json -> {"result": checkout url}, 400 if invalid
+#   GET  /Home/Process/?Token=...           the customer pays (or cancels with &cancel=1) and is redirected
+#                                           to the successUrl (cancelUrl), an ipn is posted to the ipnUrl
+#   POST /api/verify/pdt/                   pdt json -> json string of the url encoded pdt result
+#   POST /api/verify/ipn/                   ipn json -> 200 if it matches a payment made here, 400 otherwise
+#
+# every endpoint (checkout, process, pdt, ipn) can be given a latency distribution, an error rate
+# and a rate of slow-drip responses, whose body is sent a byte at a time
+#
+#   python benchmarks/yenepay_standin.py --port 8765 --latency pdt=lognormal:0.08,0.5 --errors checkout=0.01 --drip pdt=0.02:3
+#
+# then run app.py with YENEPAY_SANDBOX_HOST=http://127.0.0.1:8765/ YENEPAY_MERCHANT_CODE=0000
+
+import argparse
+import itertools
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import requests
+
+
+ENDPOINTS = ("checkout", "process", "pdt", "ipn")
+
+PATHS = {
+    "/api/urlgenerate/getcheckouturl/": "checkout",
+    "/Home/Process/": "process",
+    "/api/verify/pdt/": "pdt",
+    "/api/verify/ipn/": "ipn",
+}
+
+
+# seconds a response is delayed, drawn from a distribution given as "kind:parameters"
+#   fixed:0.05   uniform:0.01,0.2   normal:0.1,0.02   lognormal:median,sigma   exp:mean
+class Latency:
+
+    KINDS = ("fixed", "uniform", "normal", "lognormal", "exp")
+
+    def __init__(self, spec: str = "fixed:0") -> None:
+
+        kind, _, params = spec.partition(":")
+
+        if kind not in self.KINDS:
+            raise ValueError(f"Invalid latency {spec!r}: kind must be one of {', '.join(self.KINDS)}")
+
+        # distribution and its parameters
+        self.kind: str = kind
+        self.params: Tuple[float, ...] = tuple(float(p) for p in params.split(",") if p)
+        self.spec: str = spec
+
+    def sample(self, rnd: random.Random) -> float:
+
+        p = self.params
+
+        if self.kind == "fixed":
+            return p[0] if p else 0.0
+        if self.kind == "uniform":
+            return rnd.uniform(p[0], p[1])
+        if self.kind == "normal":
+            return max(0.0, rnd.gauss(p[0], p[1]))
+        if self.kind == "lognormal":
+            return rnd.lognormvariate(math.log(p[0]), p[1])
+
+        return rnd.expovariate(1 / p[0])
+
+
+# faults injected into the responses of one endpoint
+class Fault:
+
+    def __init__(self, latency: Latency = None, errorRate: float = 0.0, errorStatus: int = 500,
+                 dripRate: float = 0.0, dripSeconds: float = 1.0) -> None:
+
+        # delay before a response is sent
+        self.latency: Latency = latency if latency is not None else Latency()
+
+        # fraction of requests answered with errorStatus
+        self.errorRate: float = errorRate
+        self.errorStatus: int = errorStatus
+
+        # fraction of responses whose body is spread over dripSeconds
+        self.dripRate: float = dripRate
+        self.dripSeconds: float = dripSeconds
+
+
+# a checkout url handed out, and its payment once made
+class _Order:
+
+    __slots__ = ("merchantCode", "merchantOrderId", "total", "successUrl", "cancelUrl", "ipnUrl",
+                 "transactionId", "transactionCode", "status")
+
+    def __init__(self, checkout: dict, total: float) -> None:
+
+        self.merchantCode: str = checkout["merchantId"]
+        self.merchantOrderId: str = checkout["merchantOrderId"]
+        self.total: float = total
+        self.successUrl: str = checkout.get("successUrl")
+        self.cancelUrl: str = checkout.get("cancelUrl")
+        self.ipnUrl: str = checkout.get("ipnUrl")
+        self.transactionId: str = None
+        self.transactionCode: str = None
+        self.status: str = None
+
+    # fields yenepay reports a payment with, in pdt results, ipns and redirects
+    def fields(self) -> dict:
+
+        return {
+            "TotalAmount": f"{self.total:.2f}",
+            "BuyerId": "standin-buyer",
+            "MerchantOrderId": self.merchantOrderId,
+            "MerchantCode": self.merchantCode,
+            "MerchantId": "standin-" + self.merchantCode,
+            "TransactionCode": self.transactionCode,
+            "TransactionId": self.transactionId,
+            "Status": self.status,
+            "Currency": "ETB",
+        }
+
+
+# yenepay sandbox stand-in served from a background thread
+class StandIn:
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, faults: Dict[str, Fault] = None,
+                 ipnDelay: float = 0.0, ipnCopies: int = 1, ipnWorkers: int = 8, seed: int = None) -> None:
+
+        # faults by endpoint (checkout, process, pdt, ipn)
+        self.faults: Dict[str, Fault] = {name: Fault() for name in ENDPOINTS}
+        self.faults.update(faults or {})
+
+        # seconds after a payment its ipn is posted, and how many times (yenepay retries deliveries)
+        self.ipnDelay: float = ipnDelay
+        self.ipnCopies: int = ipnCopies
+
+        # ipn deliveries: (seconds the app took to answer, http status or None on a network error)
+        self.ipnDeliveries: List[Tuple[float, int]] = []
+
+        # requests and injected faults by endpoint
+        self.requests: Dict[str, int] = dict.fromkeys(ENDPOINTS, 0)
+        self.errors: Dict[str, int] = dict.fromkeys(ENDPOINTS, 0)
+        self.drips: Dict[str, int] = dict.fromkeys(ENDPOINTS, 0)
+
+        self._orders: Dict[str, _Order] = {}
+        self._payments: Dict[str, _Order] = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._codes = itertools.count(100000)
+        self._ipns = ThreadPoolExecutor(ipnWorkers, thread_name_prefix="standin-ipn")
+        self._session = requests.Session()
+
+        self._server = ThreadingHTTPServer((host, port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread: threading.Thread = None
+
+    # base url to use as YENEPAY_SANDBOX_HOST
+    @property
+    def url(self) -> str:
+
+        host, port = self._server.server_address[:2]
+
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "StandIn":
+
+        self._thread = threading.Thread(target=self._server.serve_forever, name="standin", daemon=True)
+        self._thread.start()
+
+        return self
+
+    # waits until every scheduled ipn is posted, payments made afterwards post no ipn
+    def finish_ipns(self) -> None:
+
+        self._ipns.shutdown(wait=True)
+
+    # stops serving, after posting the ipns still scheduled
+    def stop(self) -> None:
+
+        self._ipns.shutdown(wait=True)
+        self._server.shutdown()
+        self._server.server_close()
+        self._session.close()
+
+    # posts the ipn of a payment made here to the app, returns the http status (None on a network error)
+    def fire_ipn(self, transactionId: str) -> int:
+
+        with self._lock:
+            order = self._payments[transactionId]
+            fields = order.fields()
+
+        fields["Signature"] = ""
+        start = time.perf_counter()
+
+        try:
+            status = self._session.post(order.ipnUrl, data=fields, timeout=30).status_code
+        except requests.RequestException:
+            status = None
+
+        with self._lock:
+            self.ipnDeliveries.append((time.perf_counter() - start, status))
+
+        return status
+
+    def stats(self) -> dict:
+
+        with self._lock:
+            return {
+                "orders": len(self._orders),
+                "payments": len(self._payments),
+                "requests": dict(self.requests),
+                "errors": dict(self.errors),
+                "drips": dict(self.drips),
+                "ipns": len(self.ipnDeliveries),
+            }
+
+    # fault decisions for a request to an endpoint: (delay, error status or None, drip seconds or None)
+    def _faults(self, endpoint: str) -> Tuple[float, int, float]:
+
+        fault = self.faults[endpoint]
+
+        with self._lock:
+            self.requests[endpoint] += 1
+            delay = fault.latency.sample(self._random)
+            error = fault.errorStatus if self._random.random() < fault.errorRate else None
+            drip = fault.dripSeconds if error is None and self._random.random() < fault.dripRate else None
+
+            if error is not None:
+                self.errors[endpoint] += 1
+
+            if drip is not None:
+                self.drips[endpoint] += 1
+
+        return delay, error, drip
+
+    # returns (status, body, headers) for a checkout request
+    def _checkout(self, body: bytes) -> Tuple[int, bytes, dict]:
+
+        try:
+            checkout = json.loads(body)
+            items = checkout["items"]
+            merchantCode = checkout["merchantId"]
+
+            if not (isinstance(merchantCode, str) and merchantCode.isdigit() and len(merchantCode) >= 4):
+                raise ValueError("invalid merchant code")
+
+            if not items or not checkout.get("merchantOrderId"):
+                raise ValueError("missing items or merchant order id")
+
+            total = sum(item["unitPrice"] * item["quantity"] for item in items)
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, json.dumps({"error": str(e)}).encode("utf-8"), {}
+
+        for field, sign in (("totalItemsDeliveryFee", 1), ("totalItemsHandlingFee", 1), ("totalItemsTax1", 1),
+                            ("totalItemsTax2", 1), ("totalItemsDiscount", -1)):
+            total += sign * (checkout.get(field) or 0)
+
+        token = uuid.uuid4().hex
+
+        with self._lock:
+            self._orders[token] = _Order(checkout, total)
+
+        result = {"result": f"{self.url}Home/Process/?Token={token}"}
+
+        return 200, json.dumps(result).encode("utf-8"), {"Content-Type": "application/json"}
+
+    # the customer pays (or cancels) and is redirected back to the merchant
+    def _process(self, query: dict) -> Tuple[int, bytes, dict]:
+
+        token = query.get("Token", [None])[0]
+        cancel = query.get("cancel", ["0"])[0] == "1"
+
+        with self._lock:
+            order = self._orders.get(token)
+
+            if order is None:
+                return 404, b"unknown token", {}
+
+            if order.transactionId is None:
+                order.transactionId = uuid.uuid4().hex
+                order.transactionCode = str(next(self._codes))
+                order.status = "Canceled" if cancel else "Paid"
+                self._payments[order.transactionId] = order
+
+            fields = order.fields()
+            url = order.cancelUrl if order.status == "Canceled" else order.successUrl
+
+        if order.status == "Paid" and order.ipnUrl:
+            try:
+                for _ in range(self.ipnCopies):
+                    self._ipns.submit(self._fire_later, order.transactionId)
+            except RuntimeError:
+                # finish_ipns() was called
+                pass
+
+        separator = "&" if "?" in url else "?"
+
+        return 302, b"", {"Location": url + separator + urlencode(fields)}
+
+    def _fire_later(self, transactionId: str) -> None:
+
+        if self.ipnDelay:
+            time.sleep(self.ipnDelay)
+
+        self.fire_ipn(transactionId)
+
+    # pdt result of a payment as a json string of its url encoded fields
+    def _pdt(self, body: bytes) -> Tuple[int, bytes, dict]:
+
+        try:
+            pdt = json.loads(body)
+        except ValueError:
+            return 400, b"invalid json", {}
+
+        with self._lock:
+            order = self._payments.get(pdt.get("transactionId"))
+            fields = order.fields() if order is not None else None
+
+        if fields is None or fields["MerchantOrderId"] != pdt.get("merchantOrderId"):
+            query = "result=FAIL"
+        else:
+            query = urlencode(dict(result="SUCCESS", **fields))
+
+        return 200, json.dumps(query).encode("utf-8"), {"Content-Type": "application/json"}
+
+    # 200 if the ipn reports a payment made here as it was made
+    def _ipn(self, body: bytes) -> Tuple[int, bytes, dict]:
+
+        try:
+            ipn = json.loads(body)
+        except ValueError:
+            return 400, b"invalid json", {}
+
+        with self._lock:
+            order = self._payments.get(ipn.get("transactionId"))
+            fields = order.fields() if order is not None else None
+
+        if (fields is not None and fields["MerchantOrderId"] == ipn.get("merchantOrderId")
+                and fields["Status"] == ipn.get("status") and fields["TotalAmount"] == ipn.get("totalAmount")):
+            return 200, b"VERIFIED", {}
+
+        return 400, b"INVALID", {}
+
+
+def _handler(standin: StandIn):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        # keep-alive, as yenepay does
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+
+            url = urlparse(self.path)
+
+            if PATHS.get(url.path) != "process":
+                return self._send(404, b"not found", {})
+
+            self._serve("process", lambda: standin._process(parse_qs(url.query)))
+
+        def do_POST(self):
+
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            endpoint = PATHS.get(urlparse(self.path).path)
+
+            if endpoint is None or endpoint == "process":
+                return self._send(404, b"not found", {})
+
+            self._serve(endpoint, lambda: getattr(standin, "_" + endpoint)(body))
+
+        def _serve(self, endpoint, respond):
+
+            delay, error, drip = standin._faults(endpoint)
+
+            if delay:
+                time.sleep(delay)
+
+            if error is not None:
+                return self._send(error, b"injected error", {})
+
+            status, body, headers = respond()
+
+            try:
+                self._send(status, body, headers, drip)
+            except (BrokenPipeError, ConnectionResetError):
+                # the client gave up waiting, e.g. its deadline passed
+                self.close_connection = True
+
+        def _send(self, status, body, headers, drip=None):
+
+            self.send_response(status)
+
+            for name, value in headers.items():
+                self.send_header(name, value)
+
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+
+            if drip is None or len(body) < 2:
+                self.wfile.write(body)
+                return
+
+            pause = drip / len(body)
+
+            for i in range(len(body)):
+                self.wfile.write(body[i:i + 1])
+                self.wfile.flush()
+                time.sleep(pause)
+
+        def log_message(self, format, *args):
+
+            pass
+
+    return Handler
+
+
+# adds the fault options shared with load_test.py
+def add_fault_arguments(parser: argparse.ArgumentParser) -> None:
+
+    parser.add_argument("--latency", action="append", default=[], metavar="ENDPOINT=SPEC",
+                        help="latency of an endpoint, e.g. pdt=lognormal:0.08,0.5 (fixed, uniform, normal, lognormal, exp)")
+    parser.add_argument("--errors", action="append", default=[], metavar="ENDPOINT=RATE[:STATUS]",
+                        help="fraction of requests answered with an error status (default 500), e.g. checkout=0.01")
+    parser.add_argument("--drip", action="append", default=[], metavar="ENDPOINT=RATE:SECONDS",
+                        help="fraction of responses sent a byte at a time over SECONDS, e.g. pdt=0.02:3")
+    parser.add_argument("--ipn-delay", type=float, default=0.0, help="seconds after a payment its ipn is posted")
+    parser.add_argument("--ipn-copies", type=int, default=1, help="times every ipn is posted")
+    parser.add_argument("--seed", type=int, default=None, help="seed of the fault decisions")
+
+
+# faults by endpoint from the parsed fault options
+def faults_from_arguments(args: argparse.Namespace) -> Dict[str, Fault]:
+
+    faults = {name: Fault() for name in ENDPOINTS}
+
+    def split(option):
+        endpoint, _, value = option.partition("=")
+
+        if endpoint not in faults or not value:
+            raise ValueError(f"Invalid option {option!r}: expected ENDPOINT=VALUE with ENDPOINT one of {', '.join(ENDPOINTS)}")
+
+        return faults[endpoint], value
+
+    for option in args.latency:
+        fault, value = split(option)
+        fault.latency = Latency(value)
+
+    for option in args.errors:
+        fault, value = split(option)
+        rate, _, status = value.partition(":")
+        fault.errorRate = float(rate)
+        fault.errorStatus = int(status) if status else 500
+
+    for option in args.drip:
+        fault, value = split(option)
+        rate, _, seconds = value.partition(":")
+        fault.dripRate = float(rate)
+        fault.dripSeconds = float(seconds) if seconds else 1.0
+
+    return faults
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_fault_arguments(parser)
+    args = parser.parse_args()
+
+    standin = StandIn(args.host, args.port, faults_from_arguments(args), args.ipn_delay, args.ipn_copies, seed=args.seed).start()
+    print(f"yenepay stand-in at {standin.url}, run app.py with YENEPAY_SANDBOX_HOST={standin.url} YENEPAY_MERCHANT_CODE=0000")
+
+    try:
+        while True:
+            time.sleep(10)
+            print(json.dumps(standin.stats()))
+    except KeyboardInterrupt:
+        standin.stop()
@@ -0,0 +1,150 @@
+from yenepay.Idempotency import ipn_key
+from yenepay.Metrics import Instrumentation
+from yenepay.Models import IPN, PDT, Item, PDTResult
+from yenepay.PaymentHandler import JSON_HEADER, PaymentHandler, ProcessType, _checkout_outcome, _ipn_outcome, _pdt_outcome
+from yenepay.Resilience import Deadline, wait_for
+from yenepay.Serializer import encode_checkout, encode_ipn, encode_pdt
+from yenepay.Transport import AsyncTransport, Response, default_async_transport
+
+
+# asyncio variant of PaymentHandler
+# builds the same checkout, pdt and ipn payloads, but network calls are awaitable
+# handlers created without a transport share the process wide async connection pool
+class AsyncPaymentHandler(PaymentHandler):
+
+    def __init__(self, merchantId: str, useSandbox: bool = True, transport: AsyncTransport = None) -> None:
+
+        shared = transport is None
+
+        super().__init__(merchantId, useSandbox, default_async_transport() if shared else transport)
+
+        self._sharedTransport: bool = shared
+
+    # posts encoded json payload to yenepay endpoint through the handler's async transport
+    # safe calls (that can be repeated without side effects) may be retried and hedged by the call policy
+    async def _post(self, url: str, query: bytes, safe: bool = False, deadline: Deadline = None) -> Response:
+
+        record = Instrumentation.current() if self.instrumentation is not None else None
+
+        async def send(timeout: float) -> Response:
+            if timeout is None:
+                response = await self.transport.post(url, query, JSON_HEADER)
+            else:
+                response = await self.transport.post(url, query, JSON_HEADER, timeout)
+
+            if record is not None:
+                record.received(response)
+
+            return response
+
+        if self.callPolicy is None:
+            timeout = deadline.remaining() if deadline is not None else None
+
+            return await wait_for(send(timeout), timeout)
+
+        return await self.callPolicy.call_async(url, send, safe, deadline)
+
+    # returns checkout url retruned from yenepay api endpoint
+    # with a checkout cache identical checkouts reuse the url generated first
+    async def get_checkout_url(self, deadline: float = None) -> str:
+
+        if self.instrumentation is None:
+            return await self._get_checkout_url(deadline)
+
+        url = self._endpoint(self.CHECKOUT_BASE_URL_PROD, self.CHECKOUT_BASE_URL_SANDBOX)
+
+        return await self.instrumentation.run_async("checkout", url, lambda: self._get_checkout_url(deadline), _checkout_outcome)
+
+    async def _get_checkout_url(self, deadline: float) -> str:
+
+        self._check()
+
+        url = self._endpoint(self.CHECKOUT_BASE_URL_PROD, self.CHECKOUT_BASE_URL_SANDBOX)
+
+        deadline = Deadline.of(deadline)
+
+        query = self.payload if self.payload is not None else encode_checkout(self)
+
+        async def generate() -> str:
+            return self._checkout_result(await self._post(url, query, deadline=deadline))
+
+        cache = self.checkoutCache
+
+        if cache is None:
+            return await generate()
+
+        return await cache.get_or_load_async(self._checkout_key(url, query), generate, self._checkout_ttl(cache))
+
+    # check if IPN model is authentic
+    # with a signature verifier the signature is checked locally first
+    # with an ipn store an already verified ipn is answered without calling yenepay
+    async def is_ipn_authentic(self, ipn: IPN, deadline: float = None) -> bool:
+
+        if self.instrumentation is None:
+            return await self._is_ipn_authentic(ipn, deadline)
+
+        url = self._endpoint(self.IPN_VERIFY_URL_PROD, self.IPN_VERIFY_URL_SANDBOX)
+
+        return await self.instrumentation.run_async("ipn", url, lambda: self._is_ipn_authentic(ipn, deadline), _ipn_outcome)
+
+    async def _is_ipn_authentic(self, ipn: IPN, deadline: float) -> bool:
+
+        url = self._endpoint(self.IPN_VERIFY_URL_PROD, self.IPN_VERIFY_URL_SANDBOX)
+
+        deadline = Deadline.of(deadline)
+
+        async def verify() -> bool:
+            verifier = self.signatureVerifier
+
+            if verifier is not None:
+                if verifier.verify(ipn):
+                    return True
+
+                if not verifier.remoteFallback:
+                    return False
+
+            return self._ipn_result(await self._post(url, encode_ipn(ipn), True, deadline))
+
+        if self.ipnStore is None:
+            return await verify()
+
+        return await self.ipnStore.verify_async(ipn_key(ipn), verify)
+
+    # request PDT
+    # returns yenepay response, None if the request failed
+    async def request_pdt(self, pdt: PDT, deadline: float = None) -> PDTResult:
+
+        if self.instrumentation is None:
+            return await self._request_pdt(pdt, deadline)
+
+        url = self._endpoint(self.PDT_URL_PROD, self.PDT_URL_SANDBOX)
+
+        return await self.instrumentation.run_async("pdt", url, lambda: self._request_pdt(pdt, deadline), _pdt_outcome)
+
+    async def _request_pdt(self, pdt: PDT, deadline: float) -> PDTResult:
+
+        url = self._endpoint(self.PDT_URL_PROD, self.PDT_URL_SANDBOX)
+
+        cache = self.pdtCache
+
+        if cache is not None:
+            key = cache.key(url, pdt)
+            result = cache.get(key)
+
+            if result is not None:
+                return result
+
+        response = await self._post(url, encode_pdt(pdt), True, Deadline.of(deadline))
+
+        result = self._pdt_result(response)
+
+        if cache is not None and result is not None:
+            cache.set(key, result)
+
+        return result
+
+    # closes the transport the handler was given, the shared default stays open for other handlers
+    async def aclose(self) -> None:
+
+        if not self._sharedTransport:
+            await self.transport.close()
@@ -0,0 +1,144 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, NamedTuple
+
+from yenepay.PaymentHandler import PaymentHandler
+from yenepay.Resilience import RateLimiter
+
+
+# outcome of one item of a bulk operation
+class BulkResult(NamedTuple):
+
+    # position of the item in the input
+    index: int
+
+    # the input item
+    item: Any
+
+    # value returned for the item, None if it failed
+    value: Any
+
+    # exception raised for the item, None if it succeeded
+    error: BaseException
+
+
+# counters of a bulk operation
+class BulkStats:
+
+    def __init__(self) -> None:
+
+        self.started: float = None
+        self.finished: float = None
+        self.succeeded: int = 0
+        self.failed: int = 0
+
+    @property
+    def completed(self) -> int:
+
+        return self.succeeded + self.failed
+
+    @property
+    def elapsed(self) -> float:
+
+        if self.started is None:
+            return 0.0
+
+        return (self.finished or time.monotonic()) - self.started
+
+    # completed items per second
+    @property
+    def throughput(self) -> float:
+
+        elapsed = self.elapsed
+
+        return self.completed / elapsed if elapsed else 0.0
+
+    def as_dict(self) -> dict:
+
+        return {
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "elapsed": self.elapsed,
+            "throughput": self.throughput,
+        }
+
+
+# applies fn to every item with at most workers calls in flight and at most rate calls per second
+# yields results as they complete; items are read lazily, so only about 2 * workers are held at a time
+def imap_bounded(fn: Callable[[Any], Any], items: Iterable, workers: int = 16, rate: float = None,
+                 stats: BulkStats = None) -> Iterator[BulkResult]:
+
+    limiter = RateLimiter(rate, burst=workers) if rate is not None else None
+    stats = stats if stats is not None else BulkStats()
+    lock = threading.Lock()
+
+    def call(index, item):
+        if limiter is not None:
+            limiter.acquire()
+
+        try:
+            value = fn(item)
+        except Exception as e:
+            with lock:
+                stats.failed += 1
+            return BulkResult(index, item, None, e)
+
+        with lock:
+            stats.succeeded += 1
+        return BulkResult(index, item, value, None)
+
+    stats.started = time.monotonic()
+    source = enumerate(items)
+    window = workers * 2
+
+    with ThreadPoolExecutor(workers, thread_name_prefix="yenepay-bulk") as executor:
+        pending = set()
+
+        for index, item in source:
+            pending.add(executor.submit(call, index, item))
+
+            if len(pending) >= window:
+                break
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                yield future.result()
+
+                for index, item in source:
+                    pending.add(executor.submit(call, index, item))
+                    break
+
+    stats.finished = time.monotonic()
+
+
+# generates checkout urls for many checkouts concurrently, e.g. for batch invoicing
+# results are streamed back as they complete, a failing checkout doesn't stop the others
+class BulkCheckout:
+
+    def __init__(self, workers: int = 16, rate: float = None, deadline: float = None) -> None:
+
+        # maximum concurrent calls to yenepay
+        self.workers: int = workers
+
+        # maximum calls per second, None for no limit
+        self.rate: float = rate
+
+        # seconds each checkout url generation may take
+        self.deadline: float = deadline
+
+        # counters of the last run
+        self.stats: BulkStats = BulkStats()
+
+    # yields a BulkResult (value: checkout url) per checkout, in completion order
+    # pass a generator to avoid building every checkout up front
+    def run(self, checkouts: Iterable[PaymentHandler]) -> Iterator[BulkResult]:
+
+        self.stats = BulkStats()
+
+        def generate(checkout: PaymentHandler) -> str:
+            return checkout.get_checkout_url(self.deadline)
+
+        return imap_bounded(generate, checkouts, self.workers, self.rate, self.stats)
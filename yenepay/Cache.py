@@ -0,0 +1,383 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from yenepay.Models import PDT, PDTResult
+from yenepay.Sqlite import LocalConnections
+
+
+# entry of an in-flight load other threads can wait on
+class _Flight:
+
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self) -> None:
+
+        self.event = threading.Event()
+        self.value = None
+        self.error: BaseException = None
+
+
+# thread safe in-process cache with per-entry expiry, evicting least recently used
+# entries beyond maxEntries or maxBytes
+# concurrent loads of the same missing key are collapsed into one (single-flight)
+class TTLCache:
+
+    def __init__(self, maxEntries: int = 1024, maxBytes: int = None, ttl: float = None) -> None:
+
+        # maximum number of entries kept
+        self.maxEntries: int = maxEntries
+
+        # approximate upper bound of memory used by cached values, None for no bound
+        self.maxBytes: int = maxBytes
+
+        # default seconds an entry lives, None to keep entries until evicted
+        self.ttl: float = ttl
+
+        # number of lookups answered from the cache
+        self.hits: int = 0
+
+        # number of lookups that had to load the value
+        self.misses: int = 0
+
+        # number of lookups that waited for another thread's load of the same key
+        self.coalesced: int = 0
+
+        # number of entries dropped to stay within bounds
+        self.evictions: int = 0
+
+        # approximate memory used by cached values
+        self.bytes: int = 0
+
+        # key -> (value, expires at (monotonic) or None, size)
+        self._entries: OrderedDict = OrderedDict()
+        self._inflight: dict = {}
+        self._lock = threading.Lock()
+
+    # returns cached value or default if missing or expired
+    def get(self, key: Hashable, default: Any = None) -> Any:
+
+        with self._lock:
+            value = self._lookup(key)
+
+            if value is _MISSING:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            return value
+
+    # stores value, ttl overrides the cache default (None uses the default)
+    def set(self, key: Hashable, value: Any, ttl: float = None) -> None:
+
+        if ttl is None:
+            ttl = self.ttl
+
+        expires = time.monotonic() + ttl if ttl is not None else None
+        size = _sizeof(value)
+
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (value, expires, size)
+            self.bytes += size
+            self._evict()
+
+    # returns cached value, or calls loader once to produce it
+    # threads asking for the same key while it loads wait for that result
+    # keep decides whether a loaded value is stored (default: always)
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], ttl: float = None, keep: Callable[[Any], bool] = None) -> Any:
+
+        with self._lock:
+            value = self._lookup(key)
+
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+
+            flight = self._inflight.get(key)
+
+            if flight is not None:
+                self.coalesced += 1
+                owner = False
+            else:
+                self.misses += 1
+                flight = self._inflight[key] = _Flight()
+                owner = True
+
+        if not owner:
+            flight.event.wait()
+
+            if flight.error is not None:
+                raise flight.error
+
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        else:
+            if keep is None or keep(flight.value):
+                self.set(key, flight.value, ttl)
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+            flight.event.set()
+
+        return flight.value
+
+    # asyncio counterpart of get_or_load, loader is a coroutine function
+    # tasks of the same event loop asking for the same key while it loads await that result
+    async def get_or_load_async(self, key: Hashable, loader: Callable[[], Any], ttl: float = None,
+                                keep: Callable[[Any], bool] = None) -> Any:
+
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        flightKey = (loop, key)
+
+        with self._lock:
+            value = self._lookup(key)
+
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+
+            flight = self._inflight.get(flightKey)
+
+            if flight is not None:
+                self.coalesced += 1
+                owner = False
+            else:
+                self.misses += 1
+                flight = self._inflight[flightKey] = loop.create_future()
+                owner = True
+
+        if not owner:
+            return await asyncio.shield(flight)
+
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except BaseException as e:
+            flight.set_exception(e)
+            # marks the error retrieved when no other task waits for it
+            flight.exception()
+            raise
+        else:
+            if keep is None or keep(value):
+                self.set(key, value, ttl)
+
+            flight.set_result(value)
+        finally:
+            with self._lock:
+                del self._inflight[flightKey]
+
+        return value
+
+    # removes key from the cache
+    def delete(self, key: Hashable) -> None:
+
+        with self._lock:
+            self._discard(key)
+
+    def clear(self) -> None:
+
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    # removes expired entries, returns how many
+    def purge(self) -> int:
+
+        now = time.monotonic()
+
+        with self._lock:
+            expired = [key for key, (_, expires, _) in self._entries.items() if expires is not None and expires <= now]
+
+            for key in expired:
+                self._discard(key)
+
+        return len(expired)
+
+    # counters for monitoring
+    def stats(self) -> dict:
+
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self) -> int:
+
+        return len(self._entries)
+
+    # value of a live entry, marking it recently used (lock held)
+    def _lookup(self, key: Hashable) -> Any:
+
+        entry = self._entries.get(key)
+
+        if entry is None:
+            return _MISSING
+
+        value, expires, _ = entry
+
+        if expires is not None and expires <= time.monotonic():
+            self._discard(key)
+            return _MISSING
+
+        self._entries.move_to_end(key)
+        return value
+
+    # removes an entry if present (lock held)
+    def _discard(self, key: Hashable) -> None:
+
+        entry = self._entries.pop(key, None)
+
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    # drops least recently used entries until within bounds (lock held)
+    def _evict(self) -> None:
+
+        while len(self._entries) > self.maxEntries or (self.maxBytes is not None and self.bytes > self.maxBytes and self._entries):
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+
+_MISSING = object()
+
+
+# approximate memory used by a cached value
+def _sizeof(value: Any) -> int:
+
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+
+    return sys.getsizeof(value)
+
+
+# string cache stored in a sqlite database (WAL mode)
+# lets several processes, e.g. gunicorn workers, share cached values
+class SQLiteCache:
+
+    def __init__(self, path: str, table: str = "cache") -> None:
+
+        # path of the database file
+        self.path: str = path
+
+        # table holding the entries
+        self.table: str = table
+
+        self._connections = LocalConnections(path)
+        self._connections.get().execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)"
+        )
+
+    # returns cached value or default if missing or expired
+    def get(self, key: str, default: str = None) -> str:
+
+        row = self._connections.get().execute(
+            f"SELECT value FROM {self.table} WHERE key = ? AND (expires IS NULL OR expires > ?)", (key, time.time())
+        ).fetchone()
+
+        if row is None:
+            return default
+
+        return row[0]
+
+    # stores value for ttl seconds, None to keep it until deleted
+    def set(self, key: str, value: str, ttl: float = None) -> None:
+
+        expires = time.time() + ttl if ttl is not None else None
+
+        self._connections.get().execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, value, expires) VALUES (?, ?, ?)", (key, value, expires)
+        )
+
+    def delete(self, key: str) -> None:
+
+        self._connections.get().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    # removes expired entries
+    def purge(self) -> None:
+
+        self._connections.get().execute(f"DELETE FROM {self.table} WHERE expires <= ?", (time.time(),))
+
+
+# cache of PDT results
+# terminal results (Paid, Canceled) are kept until evicted, others only for pendingTtl seconds
+# an optional shared backend (e.g. SQLiteCache) makes results visible to other processes
+class PDTCache:
+
+    def __init__(self, maxEntries: int = 10000, pendingTtl: float = 5.0, shared: SQLiteCache = None) -> None:
+
+        # seconds a non terminal result is reused
+        self.pendingTtl: float = pendingTtl
+
+        # optional backend shared between processes
+        self.shared: SQLiteCache = shared
+
+        # in-process least recently used cache in front of the shared backend
+        self.local: TTLCache = TTLCache(maxEntries=maxEntries)
+
+    # cache key of a pdt request to an endpoint
+    @staticmethod
+    def key(url: str, pdt: PDT) -> str:
+
+        data = "\n".join((url, pdt.pdtToken or "", pdt.merchantOrderId or "", pdt.transactionId or ""))
+
+        import hashlib
+
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    # returns cached result or None
+    def get(self, key: str) -> PDTResult:
+
+        result = self.local.get(key)
+
+        if result is not None or self.shared is None:
+            return result
+
+        query = self.shared.get(key)
+
+        if query is None:
+            return None
+
+        result = PDTResult.from_query(query)
+        self.local.set(key, result, self._ttl(result))
+
+        return result
+
+    # stores a result
+    def set(self, key: str, result: PDTResult) -> None:
+
+        ttl = self._ttl(result)
+
+        self.local.set(key, result, ttl)
+
+        if self.shared is not None:
+            self.shared.set(key, result.to_query(), ttl)
+
+    def stats(self) -> dict:
+
+        return self.local.stats()
+
+    def _ttl(self, result: PDTResult) -> float:
+
+        if result.is_terminal:
+            return None
+
+        return self.pendingTtl
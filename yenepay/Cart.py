@@ -0,0 +1,160 @@
+import sys
+from typing import Dict, Iterable, Iterator, List
+
+from yenepay.Models import Item
+from yenepay.Totals import line_tax, to_minor, to_rate
+
+
+# checkout items indexed by item id
+# keeps insertion order, add, merge, quantity updates and removal are O(1)
+# subtotal and taxes are kept as running totals in santim
+class Cart:
+
+    def __init__(self, items: Iterable[Item] = ()) -> None:
+
+        # item dictionaries (as yenepay expects them) keyed by item id
+        self._items: Dict[str, dict] = {}
+
+        # per item [unit price, vat rate, tot rate, line vat, line tot] in santim / parts per million
+        self._lines: Dict[str, list] = {}
+
+        # sum of unit price * quantity in santim
+        self.subtotal: int = 0
+
+        # total VAT (tax1) in santim
+        self.tax1: int = 0
+
+        # total TOT (tax2) in santim
+        self.tax2: int = 0
+
+        self.add_items(items)
+
+    # adds item to cart with optional VAT and TOT rates (e.g. 0.15)
+    # if an item with the same id is already in the cart its quantity is increased
+    def add(self, item: Item, vat_rate: float = None, tot_rate: float = None) -> None:
+
+        item_id = item.item_id
+        quantity = item.item_quantity
+
+        item_dict = self._items.get(item_id)
+
+        if item_dict is None:
+            price = to_minor(item.unit_price)
+            self._items[item_id] = item.as_dict()
+            self._lines[item_id] = [price, to_rate(vat_rate), to_rate(tot_rate), 0, 0]
+            self._update(item_id, quantity)
+        else:
+            item_dict["quantity"] += quantity
+            self._update(item_id, item_dict["quantity"], quantity)
+
+    # adds every item of an iterable
+    def add_items(self, items: Iterable[Item], vat_rate: float = None, tot_rate: float = None) -> None:
+
+        for item in items:
+            self.add(item, vat_rate, tot_rate)
+
+    # sets quantity of an item already in the cart, a quantity of 0 removes it
+    def set_quantity(self, id_: str, quantity: int) -> None:
+
+        if quantity < 0:
+            raise ValueError(f"Invalid Quantity: got negative quantity {quantity}")
+
+        item_dict = self._items[id_]
+
+        if quantity == 0:
+            self.remove(id_)
+        else:
+            delta = quantity - item_dict["quantity"]
+            item_dict["quantity"] = quantity
+            self._update(id_, quantity, delta)
+
+    # removes item by id (if found)
+    def remove(self, id_: str) -> None:
+
+        item_dict = self._items.pop(id_, None)
+
+        if item_dict is not None:
+            price, _, _, tax1, tax2 = self._lines.pop(id_)
+            self.subtotal -= price * item_dict["quantity"]
+            self.tax1 -= tax1
+            self.tax2 -= tax2
+
+    # adjusts running totals after the quantity of a line changed by delta
+    def _update(self, id_: str, quantity: int, delta: int = None) -> None:
+
+        line = self._lines[id_]
+        price, vat, tot, tax1, tax2 = line
+
+        if delta is None:
+            delta = quantity
+
+        line[3] = line_tax(price, quantity, vat)
+        line[4] = line_tax(price, quantity, tot)
+
+        self.subtotal += price * delta
+        self.tax1 += line[3] - tax1
+        self.tax2 += line[4] - tax2
+
+    # returns item dictionary by id, None if not in cart
+    def get(self, id_: str) -> dict:
+
+        return self._items.get(id_)
+
+    def clear(self) -> None:
+
+        self._items.clear()
+        self._lines.clear()
+        self.subtotal = 0
+        self.tax1 = 0
+        self.tax2 = 0
+
+    # [item dictionary, vat rate, tot rate] per item, rates in parts per million, e.g. to store the cart as json
+    def as_state(self) -> List[list]:
+
+        return [[item_dict, self._lines[id_][1], self._lines[id_][2]] for id_, item_dict in self._items.items()]
+
+    # cart rebuilt from as_state(), the item dictionaries are used as they are
+    @staticmethod
+    def from_state(state: List[list]) -> "Cart":
+
+        cart = Cart()
+
+        for item_dict, vat, tot in state:
+            id_ = item_dict["itemId"]
+            cart._items[id_] = item_dict
+            cart._lines[id_] = [to_minor(item_dict["unitPrice"]), vat, tot, 0, 0]
+            cart._update(id_, item_dict["quantity"])
+
+        return cart
+
+    # list of item dictionaries in the order they were added, as sent to yenepay
+    def as_list(self) -> List[dict]:
+
+        return list(self._items.values())
+
+    def __contains__(self, id_: str) -> bool:
+
+        return id_ in self._items
+
+    def __iter__(self) -> Iterator[dict]:
+
+        return iter(self._items.values())
+
+    def __len__(self) -> int:
+
+        return len(self._items)
+
+    # approximate memory used by the cart and its items, e.g. for sys.getsizeof
+    def __sizeof__(self) -> int:
+
+        size = object.__sizeof__(self) + sys.getsizeof(self._items) + sys.getsizeof(self._lines)
+
+        for id_, item_dict in self._items.items():
+            size += sys.getsizeof(id_) + sys.getsizeof(item_dict) + sys.getsizeof(self._lines[id_])
+            size += sum(sys.getsizeof(v) for v in item_dict.values())
+
+        return size
+
+    def __str__(self) -> str:
+
+        return str(self.as_list())
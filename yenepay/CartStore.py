@@ -0,0 +1,207 @@
+import json
+import threading
+import time
+from typing import Callable
+
+from yenepay.Cache import TTLCache
+from yenepay.Cart import Cart
+from yenepay.Models import Item
+from yenepay.Serializer import dumps
+from yenepay.Sqlite import LocalConnections
+
+
+# carts of visitors keyed by session id
+# subclasses store the carts, cart changes go through update() so they are atomic per store
+class CartStore:
+
+    def __init__(self, maxItems: int = None) -> None:
+
+        # maximum number of different items in one cart, None for no limit
+        self.maxItems: int = maxItems
+
+    # cart of a session, None if it has none (or it expired)
+    def get(self, sessionId: str) -> Cart:
+
+        raise NotImplementedError
+
+    # applies change to the cart of a session (created if missing) and stores it, returns the cart
+    def update(self, sessionId: str, change: Callable[[Cart], None]) -> Cart:
+
+        raise NotImplementedError
+
+    # removes the cart of a session, e.g. after checkout
+    def delete(self, sessionId: str) -> None:
+
+        raise NotImplementedError
+
+    # adds item to the cart of a session with optional VAT and TOT rates (e.g. 0.15)
+    def add(self, sessionId: str, item: Item, vat_rate: float = None, tot_rate: float = None) -> Cart:
+
+        def change(cart: Cart) -> None:
+
+            if self.maxItems is not None and item.item_id not in cart and len(cart) >= self.maxItems:
+                raise ValueError(f"Cart is full: at most {self.maxItems} different items")
+
+            cart.add(item, vat_rate, tot_rate)
+
+        return self.update(sessionId, change)
+
+    # sets quantity of an item in the cart of a session, a quantity of 0 removes it
+    def set_quantity(self, sessionId: str, id_: str, quantity: int) -> Cart:
+
+        return self.update(sessionId, lambda cart: cart.set_quantity(id_, quantity))
+
+    # removes item by id from the cart of a session (if found)
+    def remove(self, sessionId: str, id_: str) -> Cart:
+
+        return self.update(sessionId, lambda cart: cart.remove(id_))
+
+
+# carts kept in process memory
+# a cart expires ttl seconds after its last change, least recently used carts are evicted
+# beyond maxCarts or when all carts together use more than maxBytes
+# get() returns the stored cart itself, so a checkout sends its item dictionaries without copying them
+class MemoryCartStore(CartStore):
+
+    def __init__(self, maxCarts: int = 10000, maxBytes: int = 64 * 1024 * 1024, ttl: float = 3600.0, maxItems: int = None) -> None:
+
+        super().__init__(maxItems)
+
+        # carts by session id, sized with Cart.__sizeof__
+        self.carts: TTLCache = TTLCache(maxEntries=maxCarts, maxBytes=maxBytes, ttl=ttl)
+
+        self._lock = threading.Lock()
+
+    def get(self, sessionId: str) -> Cart:
+
+        return self.carts.get(sessionId)
+
+    def update(self, sessionId: str, change: Callable[[Cart], None]) -> Cart:
+
+        with self._lock:
+            cart = self.carts.get(sessionId)
+
+            if cart is None:
+                cart = Cart()
+
+            change(cart)
+
+            # stored again to renew its expiry and account its new size
+            self.carts.set(sessionId, cart)
+
+        return cart
+
+    def delete(self, sessionId: str) -> None:
+
+        self.carts.delete(sessionId)
+
+    # removes expired carts
+    def purge(self) -> int:
+
+        return self.carts.purge()
+
+    # carts live, evictions and bytes used
+    def stats(self) -> dict:
+
+        self.purge()
+
+        stats = self.carts.stats()
+
+        return {"carts": stats["entries"], "bytes": stats["bytes"], "evictions": stats["evictions"]}
+
+
+# carts stored as json in a sqlite database (WAL mode) shared by several processes, e.g. gunicorn workers
+# a cart expires ttl seconds after its last change, least recently changed carts are evicted beyond maxCarts
+class SQLiteCartStore(CartStore):
+
+    def __init__(self, path: str, maxCarts: int = 100000, ttl: float = 3600.0, maxItems: int = None) -> None:
+
+        super().__init__(maxItems)
+
+        # path of the database file
+        self.path: str = path
+
+        # maximum number of carts kept
+        self.maxCarts: int = maxCarts
+
+        # seconds a cart lives after its last change
+        self.ttl: float = ttl
+
+        # number of carts evicted by this process to stay within maxCarts
+        self.evictions: int = 0
+
+        self._connections = LocalConnections(path)
+        self._connections.get().executescript(
+            "CREATE TABLE IF NOT EXISTS carts (session_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL, expires REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS carts_updated ON carts (updated);"
+        )
+
+    def get(self, sessionId: str) -> Cart:
+
+        row = self._connections.get().execute(
+            "SELECT data FROM carts WHERE session_id = ? AND expires > ?", (sessionId, time.time())
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        return Cart.from_state(json.loads(row[0]))
+
+    def update(self, sessionId: str, change: Callable[[Cart], None]) -> Cart:
+
+        connection = self._connections.get()
+        now = time.time()
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT data FROM carts WHERE session_id = ? AND expires > ?", (sessionId, now)
+            ).fetchone()
+
+            cart = Cart.from_state(json.loads(row[0])) if row is not None else Cart()
+            change(cart)
+
+            connection.execute(
+                "INSERT OR REPLACE INTO carts (session_id, data, updated, expires) VALUES (?, ?, ?, ?)",
+                (sessionId, dumps(cart.as_state()).decode("utf-8"), now, now + self.ttl),
+            )
+
+            if row is None:
+                self._evict(connection, now)
+
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        return cart
+
+    def delete(self, sessionId: str) -> None:
+
+        self._connections.get().execute("DELETE FROM carts WHERE session_id = ?", (sessionId,))
+
+    # removes expired carts
+    def purge(self) -> int:
+
+        return self._connections.get().execute("DELETE FROM carts WHERE expires <= ?", (time.time(),)).rowcount
+
+    # carts live, evictions (by this process) and bytes used by cart data
+    def stats(self) -> dict:
+
+        carts, size = self._connections.get().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM carts WHERE expires > ?", (time.time(),)
+        ).fetchone()
+
+        return {"carts": carts, "bytes": size, "evictions": self.evictions}
+
+    # drops expired carts, then the least recently changed ones beyond maxCarts (in the update transaction)
+    def _evict(self, connection, now: float) -> None:
+
+        connection.execute("DELETE FROM carts WHERE updated <= ?", (now - self.ttl,))
+
+        excess = connection.execute("SELECT COUNT(*) FROM carts").fetchone()[0] - self.maxCarts
+
+        if excess > 0:
+            self.evictions += connection.execute(
+                "DELETE FROM carts WHERE session_id IN (SELECT session_id FROM carts ORDER BY updated LIMIT ?)", (excess,)
+            ).rowcount
@@ -0,0 +1,258 @@
+from typing import Dict, Iterable, List, Tuple
+
+from yenepay.Checkout import Checkout, MerchantConfig
+from yenepay.Exceptions import ValidationError
+from yenepay.Models import Item
+from yenepay.PaymentHandler import ProcessType
+from yenepay.Serializer import dumps, encode_checkout
+from yenepay.Totals import line_tax, to_major, to_minor, to_rate
+from yenepay.Validation import CheckoutRules, Violation
+
+
+# placeholders the per-order fields are encoded as when a template is compiled
+_ORDER = "\x00merchantOrderId\x00"
+_QUANTITY = 918273645
+_TAX1 = 918273646
+_TAX2 = 918273647
+
+
+# Express checkout payload of one catalog item, split around its per-order fields
+class _Template:
+
+    __slots__ = ("parts", "unitPrice", "itemName", "price", "vat", "tot", "single")
+
+    def __init__(self, parts: Tuple[bytes, ...], item: Item, price: int, vat: int, tot: int) -> None:
+
+        # payload bytes between merchant order id, quantity, VAT and TOT
+        self.parts: Tuple[bytes, ...] = parts
+
+        # item values the template was compiled from
+        self.unitPrice: float = item.unitPrice
+        self.itemName: str = item.itemName
+
+        # unit price in santim and tax rates in parts per million
+        self.price: int = price
+        self.vat: int = vat
+        self.tot: int = tot
+
+        # encoded quantity and taxes of a single item
+        self.single: List[bytes] = _values(price, 1, vat, tot)
+
+
+# items sold with Express checkout, each with its checkout payload precompiled to bytes
+# at request time only the merchant order id, quantity and taxes are spliced in
+# a template is rebuilt when its item's price or name changes, all templates when the config changes
+class Catalog:
+
+    def __init__(self, config: MerchantConfig, items: Iterable[Item] = ()) -> None:
+
+        # item and its (VAT, TOT) rates, None to use the config rates
+        self._items: Dict[str, Tuple[Item, float, float]] = {}
+        self._templates: Dict[str, _Template] = {}
+
+        # payload parts common to many items (e.g. the urls) are kept once
+        self._shared: Dict[bytes, bytes] = {}
+
+        self._config: MerchantConfig = config
+        self._maxOrderIdLength: int = (config.rules or CheckoutRules()).maxOrderIdLength
+
+        for item in items:
+            self.add(item)
+
+    # merchant settings the payloads are built from, changing them drops every template
+    @property
+    def config(self) -> MerchantConfig:
+
+        return self._config
+
+    @config.setter
+    def config(self, config: MerchantConfig) -> None:
+
+        self._config = config
+        self._templates = {}
+        self._shared = {}
+        self._maxOrderIdLength = (config.rules or CheckoutRules()).maxOrderIdLength
+
+    # adds or replaces an item with optional VAT and TOT rates overriding the config rates
+    def add(self, item: Item, vat_rate: float = None, tot_rate: float = None) -> None:
+
+        if item.unitPrice < 0:
+            raise ValueError(f"Invalid Price: got negative price {item.unitPrice}")
+
+        self._items[item.itemId] = (item, vat_rate, tot_rate)
+        self._templates.pop(item.itemId, None)
+
+    # item by id, None if not in the catalog
+    def get(self, itemId: str) -> Item:
+
+        entry = self._items.get(itemId)
+
+        return entry[0] if entry is not None else None
+
+    def remove(self, itemId: str) -> None:
+
+        self._items.pop(itemId, None)
+        self._templates.pop(itemId, None)
+
+    # changes the price of an item, its template is rebuilt on next use
+    def set_price(self, itemId: str, price: float) -> None:
+
+        self._items[itemId][0].unit_price = price
+        self._templates.pop(itemId, None)
+
+    # builds the templates of all items not compiled yet, e.g. at startup
+    def compile(self) -> None:
+
+        for itemId in self._items:
+            if itemId not in self._templates:
+                self._compile(itemId)
+
+    # Express checkout request body for quantity of an item, as encode_checkout would produce it
+    def express_payload(self, itemId: str, merchantOrderId: str, quantity: int = 1) -> bytes:
+
+        template = self._template(itemId)
+
+        if not merchantOrderId or len(merchantOrderId) > self._maxOrderIdLength:
+            raise ValidationError([Violation("merchantOrderId", f"must be 1 to {self._maxOrderIdLength} characters")])
+
+        if quantity == 1:
+            values = template.single
+        elif quantity > 0:
+            values = _values(template.price, quantity, template.vat, template.tot)
+        else:
+            raise ValueError(f"Invalid Quantity: got {quantity}")
+
+        if values is None:
+            # a tax rounds to 0 and is left out of the payload, the template doesn't apply
+            return encode_checkout(self._checkout(itemId, merchantOrderId, quantity))
+
+        parts = template.parts
+        out = [parts[0], dumps(merchantOrderId)]
+
+        for part, value in zip(parts[1:], values):
+            out.append(part)
+            out.append(value)
+
+        out.append(parts[-1])
+
+        return b"".join(out)
+
+    # amount the customer pays for quantity of an item, including taxes
+    def total(self, itemId: str, quantity: int = 1) -> float:
+
+        template = self._template(itemId)
+        subtotal = template.price * quantity
+
+        return to_major(subtotal + line_tax(template.price, quantity, template.vat) + line_tax(template.price, quantity, template.tot))
+
+    # checkout for quantity of an item with its payload taken from the template
+    # (the checkout's items are left empty, the payload is sent as it is)
+    # merchantOrderId replaces the generated order id, e.g. to give a resubmitted form the order it created first
+    def express_checkout(self, itemId: str, quantity: int = 1, merchantOrderId: str = None) -> Checkout:
+
+        checkout = Checkout(self._config)
+        checkout.process = ProcessType.Express
+
+        if merchantOrderId is not None:
+            checkout.merchantOrderId = merchantOrderId
+
+        checkout.payload = self.express_payload(itemId, checkout.merchantOrderId, quantity)
+
+        return checkout
+
+    def __contains__(self, itemId: str) -> bool:
+
+        return itemId in self._items
+
+    def __len__(self) -> int:
+
+        return len(self._items)
+
+    # template of an item, rebuilt if the item changed since it was compiled
+    def _template(self, itemId: str) -> _Template:
+
+        template = self._templates.get(itemId)
+
+        if template is None:
+            return self._compile(itemId)
+
+        item = self._items[itemId][0]
+
+        if template.unitPrice != item.unitPrice or template.itemName != item.itemName:
+            return self._compile(itemId)
+
+        return template
+
+    # checkout of quantity of an item built field by field
+    def _checkout(self, itemId: str, merchantOrderId: str, quantity: int) -> Checkout:
+
+        item, vat_rate, tot_rate = self._items[itemId]
+
+        # the config's order id generator is not used, the order id is given
+        checkout = Checkout(self._config._replace(orderIds=None))
+        checkout.process = ProcessType.Express
+        checkout.merchantOrderId = merchantOrderId
+        checkout.add_item(Item(item.itemId, item.itemName, item.unitPrice, quantity), vat_rate, tot_rate)
+
+        return checkout
+
+    def _compile(self, itemId: str) -> _Template:
+
+        item, vat_rate, tot_rate = self._items[itemId]
+        config = self._config
+
+        vat = to_rate(vat_rate if vat_rate is not None else config.vatRate)
+        tot = to_rate(tot_rate if tot_rate is not None else config.totRate)
+
+        checkout = self._checkout(itemId, _ORDER, _QUANTITY)
+
+        # payloads from the template skip validation in get_checkout_url, so the template is validated here
+        violations = checkout.validate()
+
+        if violations:
+            raise ValidationError(violations)
+
+        placeholders = [dumps(_ORDER), str(_QUANTITY).encode("ascii")]
+
+        # placeholder taxes are set as fixed amounts so they show up in the payload
+        if vat:
+            checkout.totalItemsTax1 = _TAX1
+            placeholders.append(str(_TAX1).encode("ascii"))
+
+        if tot:
+            checkout.totalItemsTax2 = _TAX2
+            placeholders.append(str(_TAX2).encode("ascii"))
+
+        parts = []
+        rest = encode_checkout(checkout)
+
+        for placeholder in placeholders:
+            part, found, rest = rest.partition(placeholder)
+
+            if not found:
+                raise ValueError(f"Can't compile a template for item {itemId!r}")
+
+            parts.append(self._shared.setdefault(part, part))
+
+        parts.append(self._shared.setdefault(rest, rest))
+
+        template = self._templates[itemId] = _Template(tuple(parts), item, to_minor(item.unitPrice), vat, tot)
+
+        return template
+
+
+# encoded quantity, VAT and TOT (those with a rate) of a line, None if a tax rounds to 0
+def _values(price: int, quantity: int, vat: int, tot: int) -> List[bytes]:
+
+    values = [str(quantity).encode("ascii")]
+
+    for rate in (vat, tot):
+        if rate:
+            tax = line_tax(price, quantity, rate)
+
+            if not tax:
+                return None
+
+            values.append(str(to_major(tax)).encode("ascii"))
+
+    return values
@@ -0,0 +1,142 @@
+from typing import NamedTuple
+
+from yenepay.Cache import PDTCache, TTLCache
+from yenepay.Idempotency import MemoryIPNStore
+from yenepay.Metrics import Instrumentation
+from yenepay.OrderId import OrderIdGenerator
+from yenepay.Resilience import CallPolicy
+from yenepay.Signature import SignatureVerifier
+from yenepay.Models import PDT
+from yenepay.PaymentHandler import PaymentHandler, ProcessType
+from yenepay.Transport import SANDBOX_HOST, Transport
+from yenepay.Validation import CheckoutRules, compile_rules
+
+
+# merchant wide settings shared by every checkout
+# immutable, so one instance can be used from any number of threads without locking
+class MerchantConfig(NamedTuple):
+
+    # An all numeral (minimum 4-digit) unique seller code used to uniquely identify a merchant on YenePay
+    merchantId: str
+
+    # True to use yenepay sandbox server, False for production
+    useSandbox: bool = True
+
+    # endpoint url on a merchant site used to send instant payment notifications (IPN)
+    ipnUrl: str = None
+
+    # endpoint url on a merchant site used to return a customer after a payment is successfully completed on YenePay
+    successUrl: str = None
+
+    # endpoint url on a merchant site used to return a customer after cancelling a payment on YenePay
+    cancelUrl: str = None
+
+    # endpoint url on a merchant site used to return a customer when a payment fails on YenePay
+    failureUrl: str = None
+
+    # default checkout process for new checkouts
+    process: str = ProcessType.Cart
+
+    # default number of minutes before an order expires
+    expiresAfter: int = None
+
+    # default expiration period for a payment in days
+    expiresInDays: int = None
+
+    # VAT rate (e.g. 0.15) applied to items, for VAT registered merchants
+    vatRate: float = None
+
+    # TOT rate (e.g. 0.02) applied to items, for TOT registered merchants
+    totRate: float = None
+
+    # http transport shared by all checkouts, defaults to the shared connection pool
+    transport: Transport = None
+
+    # optional cache of generated checkout urls shared by all checkouts
+    checkoutCache: TTLCache = None
+
+    # optional cache of pdt results shared by all checkouts
+    pdtCache: PDTCache = None
+
+    # optional store of verified ipns shared by all checkouts
+    ipnStore: MemoryIPNStore = None
+
+    # optional local verifier of ipn signatures
+    signatureVerifier: SignatureVerifier = None
+
+    # optional retry, hedging and circuit breaker policy shared by all checkouts
+    callPolicy: CallPolicy = None
+
+    # optional generator giving every new checkout a unique merchant order id
+    orderIds: OrderIdGenerator = None
+
+    # checks every checkout has to pass before it is sent, None for the default rules
+    rules: CheckoutRules = None
+
+    # optional hooks every checkout's yenepay calls are reported to
+    instrumentation: Instrumentation = None
+
+    # base url of the sandbox, replaced by a local stand-in server in load tests
+    sandboxHost: str = SANDBOX_HOST
+
+    # PDT token of the merchant from the yenepay dashboard
+    pdtToken: str = None
+
+    # returns a new checkout for this merchant
+    def checkout(self) -> "Checkout":
+
+        return Checkout(self)
+
+    # returns a pdt request for a payment of this merchant
+    def pdt(self, transactionId: str, merchantOrderId: str) -> PDT:
+
+        pdt = PDT(self.pdtToken)
+        pdt.transactionId = transactionId
+        pdt.merchantOrderId = merchantOrderId
+
+        return pdt
+
+
+# a single customer checkout created from a MerchantConfig
+# create one per request instead of sharing a PaymentHandler between requests
+class Checkout(PaymentHandler):
+
+    def __init__(self, config: MerchantConfig) -> None:
+
+        super().__init__(config.merchantId, config.useSandbox, config.transport)
+
+        # merchant settings this checkout was created from
+        self.config: MerchantConfig = config
+
+        self.process = config.process
+        self.ipnUrl = config.ipnUrl
+        self.successUrl = config.successUrl
+        self.cancelUrl = config.cancelUrl
+        self.failureUrl = config.failureUrl
+        self.expiresAfter = config.expiresAfter
+        self.expiresInDays = config.expiresInDays
+        self.vatRate = config.vatRate
+        self.totRate = config.totRate
+        self.checkoutCache = config.checkoutCache
+        self.pdtCache = config.pdtCache
+        self.ipnStore = config.ipnStore
+        self.signatureVerifier = config.signatureVerifier
+        self.callPolicy = config.callPolicy
+        self.validator = compile_rules(config.rules)
+        self.instrumentation = config.instrumentation
+        self.sandboxHost = config.sandboxHost
+
+        if config.orderIds is not None:
+            self.merchantOrderId = config.orderIds.next()
+
+    # resets checkout values to the merchant defaults
+    def clear(self) -> None:
+
+        super().clear()
+
+        self.process = self.config.process
+        self.expiresAfter = self.config.expiresAfter
+        self.expiresInDays = self.config.expiresInDays
+
+        if self.config.orderIds is not None:
+            self.merchantOrderId = self.config.orderIds.next()
@@ -0,0 +1,68 @@
+# base class of errors raised when talking to yenepay
+class YenePayError(Exception):
+    pass
+
+
+# the request could not be sent or no response was received (connection error, timeout ...)
+class TransportError(YenePayError):
+    pass
+
+
+# no request slot of a QuotaTransport became free in time, nothing was sent
+class QuotaExceeded(TransportError):
+
+    def __init__(self, name: str, maxConcurrent: int) -> None:
+
+        super().__init__(f"Concurrency quota of {name} exhausted: {maxConcurrent} requests in flight")
+
+        self.name: str = name
+        self.maxConcurrent: int = maxConcurrent
+
+
+# yenepay answered with a server error
+class ServerError(YenePayError):
+
+    def __init__(self, status_code: int, body: bytes = b"") -> None:
+
+        super().__init__(f"YenePay server error: HTTP {status_code}")
+
+        self.status_code: int = status_code
+        self.body: bytes = body
+
+
+# yenepay did not return a checkout url
+class CheckoutError(YenePayError):
+
+    def __init__(self, status_code: int, body: bytes = b"") -> None:
+
+        super().__init__(f"Checkout url generation failed: HTTP {status_code} {body[:200]!r}")
+
+        self.status_code: int = status_code
+        self.body: bytes = body
+
+
+# the call's deadline passed before it could complete
+class DeadlineExceeded(YenePayError):
+    pass
+
+
+# the endpoint failed repeatedly and calls are rejected until it recovers
+class CircuitOpenError(YenePayError):
+
+    def __init__(self, endpoint: str, retryAfter: float) -> None:
+
+        super().__init__(f"Circuit open for {endpoint}, retry in {retryAfter:.1f}s")
+
+        self.endpoint: str = endpoint
+        self.retryAfter: float = retryAfter
+
+
+# the checkout failed local validation, nothing was sent to yenepay
+# violations lists every problem found as (field, message) pairs
+class ValidationError(YenePayError, ValueError):
+
+    def __init__(self, violations: list) -> None:
+
+        super().__init__("Invalid checkout: " + "; ".join(f"{field} {message}" for field, message in violations))
+
+        self.violations: list = violations
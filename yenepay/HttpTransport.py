@@ -0,0 +1,285 @@
+import threading
+import time
+import weakref
+from typing import Callable, Iterable, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import EmptyPoolError
+
+from yenepay.Exceptions import TransportError
+from yenepay.Transport import PROD_HOST, SANDBOX_HOST, AsyncTransport, Response, Transport
+
+
+# pooled keep-alive transport built on a requests session
+# one instance is safe to share between threads and PaymentHandler objects
+# when all poolSize connections are busy a request waits at most poolTimeout seconds (capped by its timeout)
+# for one to be returned, then raises TransportError
+class RequestsTransport(Transport):
+
+    def __init__(self, poolSize: int = 10, connectTimeout: float = 3.05, readTimeout: float = 10.0, keepAlive: bool = True,
+                 poolTimeout: float = None) -> None:
+
+        # maximum number of connections kept open per host
+        self.poolSize: int = poolSize
+
+        # seconds to wait for a connection (including tls handshake) to be established
+        self.connectTimeout: float = connectTimeout
+
+        # seconds to wait for yenepay to send a response
+        self.readTimeout: float = readTimeout
+
+        # reuse connections between calls
+        self.keepAlive: bool = keepAlive
+
+        # seconds to wait for a free connection of the pool, defaults to the connect timeout
+        self.poolTimeout: float = poolTimeout if poolTimeout is not None else connectTimeout
+
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=poolSize, pool_block=True)
+        adapter.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPConnectionPool, "https": _TimedHTTPSConnectionPool}
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        if not keepAlive:
+            self.session.headers["Connection"] = "close"
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+
+        return (self.connectTimeout, self.readTimeout)
+
+    def post(self, url: str, data: bytes, headers: dict, timeout: float = None) -> Response:
+
+        timeouts = self.timeout
+        _pool_wait.seconds = self.poolTimeout
+
+        if timeout is not None:
+            timeouts = (min(self.connectTimeout, timeout), min(self.readTimeout, timeout))
+            _pool_wait.seconds = min(self.poolTimeout, timeout)
+
+        timings = _connect_timings
+        timings.tcp = timings.tls = 0.0
+        start = time.perf_counter()
+
+        try:
+            response = self.session.post(url, data=data, headers=headers, timeout=timeouts)
+        except (requests.RequestException, EmptyPoolError) as e:
+            # requests passes urllib3's EmptyPoolError (no free connection within poolTimeout) through unwrapped
+            raise TransportError(str(e)) from e
+
+        elapsed = time.perf_counter() - start
+        tcp, tls = timings.tcp, timings.tls
+
+        return Response(response.status_code, response.content, (tcp, tls, elapsed - tcp - tls))
+
+    # open connections to yenepay hosts before the first real request
+    # failures are ignored, prewarming is only an optimization
+    def prewarm(self, hosts: Iterable[str] = (SANDBOX_HOST, PROD_HOST)) -> None:
+
+        _pool_wait.seconds = self.poolTimeout
+
+        for host in hosts:
+            try:
+                self.session.head(host, timeout=self.timeout)
+            except (requests.RequestException, EmptyPoolError):
+                pass
+
+    def close(self) -> None:
+
+        self.session.close()
+
+
+# seconds the calling thread's current request spent connecting (tcp) and in the tls handshake
+_connect_timings = threading.local()
+
+
+# connections recording their connect time in _connect_timings
+class _TimedHTTPConnection(HTTPConnection):
+
+    def _new_conn(self):
+
+        start = time.perf_counter()
+
+        try:
+            return super()._new_conn()
+        finally:
+            _connect_timings.tcp = getattr(_connect_timings, "tcp", 0.0) + time.perf_counter() - start
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+
+    def _new_conn(self):
+
+        start = time.perf_counter()
+
+        try:
+            return super()._new_conn()
+        finally:
+            _connect_timings.tcp = getattr(_connect_timings, "tcp", 0.0) + time.perf_counter() - start
+
+    # tcp connect and tls handshake, the tls share is what _new_conn didn't take
+    def connect(self) -> None:
+
+        tcp = getattr(_connect_timings, "tcp", 0.0)
+        start = time.perf_counter()
+
+        try:
+            super().connect()
+        finally:
+            elapsed = time.perf_counter() - start
+            _connect_timings.tls = getattr(_connect_timings, "tls", 0.0) + elapsed - (_connect_timings.tcp - tcp)
+
+
+# seconds the calling thread's current request may wait for a free pooled connection
+# requests doesn't pass a pool timeout to urllib3, without one a blocking pool waits forever
+_pool_wait = threading.local()
+
+
+# pools taking the wait for a free connection from _pool_wait
+class _BoundedWaitPool:
+
+    def urlopen(self, method, url, *args, pool_timeout=None, **kwargs):
+
+        if pool_timeout is None:
+            pool_timeout = getattr(_pool_wait, "seconds", None)
+
+        return super().urlopen(method, url, *args, pool_timeout=pool_timeout, **kwargs)
+
+
+class _TimedHTTPConnectionPool(_BoundedWaitPool, HTTPConnectionPool):
+
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(_BoundedWaitPool, HTTPSConnectionPool):
+
+    ConnectionCls = _TimedHTTPSConnection
+
+
+# pooled keep-alive asyncio transport built on an httpx client
+# requires the optional httpx package
+class HttpxAsyncTransport(AsyncTransport):
+
+    def __init__(self, poolSize: int = 100, connectTimeout: float = 3.05, readTimeout: float = 10.0, keepAlive: bool = True) -> None:
+
+        import httpx
+
+        # maximum number of concurrent connections
+        self.poolSize: int = poolSize
+
+        # seconds to wait for a connection (including tls handshake) to be established
+        self.connectTimeout: float = connectTimeout
+
+        # seconds to wait for yenepay to send a response
+        self.readTimeout: float = readTimeout
+
+        # reuse connections between calls
+        self.keepAlive: bool = keepAlive
+
+        limits = httpx.Limits(max_connections=poolSize, max_keepalive_connections=poolSize if keepAlive else 0)
+        timeout = httpx.Timeout(readTimeout, connect=connectTimeout)
+
+        self.client = httpx.AsyncClient(limits=limits, timeout=timeout)
+
+    async def post(self, url: str, data: bytes, headers: dict, timeout: float = None) -> Response:
+
+        import httpx
+
+        marks = {}
+
+        # httpcore reports connection events, used to time tcp connect and tls handshake
+        async def trace(event: str, info: dict) -> None:
+            marks[event] = time.perf_counter()
+
+        kwargs = {"extensions": {"trace": trace}}
+
+        if timeout is not None:
+            kwargs["timeout"] = httpx.Timeout(min(self.readTimeout, timeout), connect=min(self.connectTimeout, timeout))
+
+        start = time.perf_counter()
+
+        try:
+            response = await self.client.post(url, content=data, headers=headers, **kwargs)
+        except httpx.HTTPError as e:
+            raise TransportError(str(e)) from e
+
+        elapsed = time.perf_counter() - start
+        tcp = _span(marks, "connection.connect_tcp")
+        tls = _span(marks, "connection.start_tls")
+
+        return Response(response.status_code, response.content, (tcp, tls, elapsed - tcp - tls))
+
+    # open connections to yenepay hosts before the first real request
+    async def prewarm(self, hosts: Iterable[str] = (SANDBOX_HOST, PROD_HOST)) -> None:
+
+        import httpx
+
+        for host in hosts:
+            try:
+                await self.client.head(host)
+            except httpx.HTTPError:
+                pass
+
+    async def close(self) -> None:
+
+        await self.client.aclose()
+
+
+# async transport keeping one transport (an HttpxAsyncTransport by default) per event loop
+# httpx connections belong to the loop that opened them, so a transport shared by every handler
+# of a process needs its own pool in each loop (e.g. across successive asyncio.run calls)
+class PerLoopAsyncTransport(AsyncTransport):
+
+    def __init__(self, factory: Callable[[], AsyncTransport] = HttpxAsyncTransport) -> None:
+
+        # creates the transport of a loop
+        self.factory: Callable[[], AsyncTransport] = factory
+
+        self._transports = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    # transport of the running loop
+    def current(self) -> AsyncTransport:
+
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+
+        with self._lock:
+            transport = self._transports.get(loop)
+
+            if transport is None:
+                transport = self._transports[loop] = self.factory()
+
+        return transport
+
+    async def post(self, url: str, data: bytes, headers: dict, timeout: float = None) -> Response:
+
+        return await self.current().post(url, data, headers, timeout)
+
+    # closes the running loop's transport, the next request opens a new one
+    async def close(self) -> None:
+
+        import asyncio
+
+        with self._lock:
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+
+        if transport is not None:
+            await transport.close()
+
+
+# seconds between the started and complete events of a traced step, 0 if it didn't happen
+def _span(marks: dict, step: str) -> float:
+
+    start = marks.get(step + ".started")
+    end = marks.get(step + ".complete")
+
+    if start is None or end is None:
+        return 0.0
+
+    return end - start
@@ -0,0 +1,403 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, List, Tuple
+
+from yenepay.Models import IPN
+from yenepay.Sqlite import LocalConnections
+
+
+logger = logging.getLogger("yenepay")
+
+
+# running count, sum and maximum of a latency
+class _Latency:
+
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self) -> None:
+
+        self.count: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+
+    def add(self, seconds: float) -> None:
+
+        self.count += 1
+        self.total += seconds
+
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self) -> dict:
+
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+        }
+
+
+# durable queue of received ipns in a sqlite database (WAL mode)
+# the ipn route appends to it and acknowledges, workers verify later
+# several processes can share one queue: a claimed ipn is leased to the claiming queue object for
+# leaseTime seconds, and only taken over by another one when its lease ran out (its process died or hung)
+class IPNQueue:
+
+    PENDING = 0
+    PROCESSING = 1
+    DONE = 2
+    DEAD = 3
+
+    def __init__(self, path: str, leaseTime: float = 120.0) -> None:
+
+        # path of the database file
+        self.path: str = path
+
+        # seconds a claimed ipn stays with its claimer, longer than the slowest verification
+        self.leaseTime: float = leaseTime
+
+        # identifies this queue object's claims among all processes sharing the database
+        self.owner: str = f"{os.getpid()}-{os.urandom(4).hex()}"
+
+        self._connections = LocalConnections(path)
+
+        connection = self._connections.get()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS ipn_queue ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL, state INTEGER NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, enqueued REAL NOT NULL, available REAL NOT NULL, "
+            "verified INTEGER, error TEXT, owner TEXT, lease REAL)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS ipn_queue_ready ON ipn_queue (state, available)")
+
+        # queues created before leases were added
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(ipn_queue)")]
+
+        for column, type_ in (("owner", "TEXT"), ("lease", "REAL")):
+            if column not in columns:
+                connection.execute(f"ALTER TABLE ipn_queue ADD COLUMN {column} {type_}")
+
+    # appends an ipn, returns its queue id
+    def enqueue(self, ipn: IPN) -> int:
+
+        now = time.time()
+
+        return self._connections.get().execute(
+            "INSERT INTO ipn_queue (payload, state, enqueued, available) VALUES (?, ?, ?, ?)",
+            (json.dumps(ipn.as_dict()), self.PENDING, now, now),
+        ).lastrowid
+
+    # atomically takes up to size ready ipns for processing, leased to this queue object
+    # ipns whose lease ran out are taken over
+    # returns (queue id, ipn, attempts so far, enqueued at) tuples
+    def claim(self, size: int) -> List[Tuple[int, IPN, int, float]]:
+
+        connection = self._connections.get()
+        now = time.time()
+
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = connection.execute(
+                "SELECT id, payload, attempts, enqueued FROM ipn_queue "
+                "WHERE (state = ? AND available <= ?) OR (state = ? AND lease < ?) ORDER BY id LIMIT ?",
+                (self.PENDING, now, self.PROCESSING, now, size),
+            ).fetchall()
+
+            connection.executemany(
+                "UPDATE ipn_queue SET state = ?, owner = ?, lease = ? WHERE id = ?",
+                [(self.PROCESSING, self.owner, now + self.leaseTime, row[0]) for row in rows],
+            )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        return [(id_, _ipn_from_payload(payload), attempts, enqueued) for id_, payload, attempts, enqueued in rows]
+
+    # extends the lease of a claimed ipn before it is verified
+    # returns False if the lease ran out and another claimer took the ipn over
+    def renew(self, id_: int) -> bool:
+
+        return self._connections.get().execute(
+            "UPDATE ipn_queue SET lease = ? WHERE id = ? AND state = ? AND owner = ?",
+            (time.time() + self.leaseTime, id_, self.PROCESSING, self.owner),
+        ).rowcount == 1
+
+    # marks an ipn as verified (authentic or not)
+    def complete(self, id_: int, authentic: bool) -> None:
+
+        self._finish(id_, "state = ?, verified = ?, attempts = attempts + 1, error = NULL", (self.DONE, int(authentic)))
+
+    # puts an ipn back to be retried after delay seconds
+    def retry(self, id_: int, error: str, delay: float) -> None:
+
+        self._finish(id_, "state = ?, attempts = attempts + 1, available = ?, error = ?", (self.PENDING, time.time() + delay, error))
+
+    # gives up on an ipn, keeping it for inspection
+    def dead_letter(self, id_: int, error: str) -> None:
+
+        self._finish(id_, "state = ?, attempts = attempts + 1, error = ?", (self.DEAD, error))
+
+    # updates an ipn this queue object holds the lease of and releases the lease
+    def _finish(self, id_: int, assignments: str, values: tuple) -> None:
+
+        self._connections.get().execute(
+            f"UPDATE ipn_queue SET {assignments}, owner = NULL, lease = NULL WHERE id = ? AND state = ? AND owner = ?",
+            values + (id_, self.PROCESSING, self.owner),
+        )
+
+    # returns ipns whose lease ran out (their worker crashed or hung) to the queue
+    # ipns other live processes are verifying keep their lease
+    def recover(self) -> int:
+
+        return self._connections.get().execute(
+            "UPDATE ipn_queue SET state = ?, owner = NULL, lease = NULL WHERE state = ? AND (lease IS NULL OR lease < ?)",
+            (self.PENDING, self.PROCESSING, time.time()),
+        ).rowcount
+
+    # dead lettered ipns as (queue id, ipn, error) tuples
+    def dead_letters(self) -> List[Tuple[int, IPN, str]]:
+
+        rows = self._connections.get().execute(
+            "SELECT id, payload, error FROM ipn_queue WHERE state = ? ORDER BY id", (self.DEAD,)
+        ).fetchall()
+
+        return [(id_, _ipn_from_payload(payload), error) for id_, payload, error in rows]
+
+    # number of ipns waiting or being verified
+    def depth(self) -> int:
+
+        return self._connections.get().execute(
+            "SELECT COUNT(*) FROM ipn_queue WHERE state IN (?, ?)", (self.PENDING, self.PROCESSING)
+        ).fetchone()[0]
+
+    # seconds the oldest waiting ipn has been queued
+    def lag(self) -> float:
+
+        oldest = self._connections.get().execute(
+            "SELECT MIN(enqueued) FROM ipn_queue WHERE state IN (?, ?)", (self.PENDING, self.PROCESSING)
+        ).fetchone()[0]
+
+        if oldest is None:
+            return 0.0
+
+        return max(0.0, time.time() - oldest)
+
+    # removes verified ipns older than maxAge seconds, returns how many
+    def purge(self, maxAge: float) -> int:
+
+        return self._connections.get().execute(
+            "DELETE FROM ipn_queue WHERE state = ? AND enqueued < ?", (self.DONE, time.time() - maxAge)
+        ).rowcount
+
+
+# ipn rebuilt from a queued payload
+def _ipn_from_payload(payload: str) -> IPN:
+
+    ipn = IPN()
+
+    for k, v in json.loads(payload).items():
+        setattr(ipn, k, v)
+
+    return ipn
+
+
+# worker threads verifying queued ipns in batches
+# onResult(ipn, authentic) is called once per verified ipn
+class IPNWorkerPool:
+
+    def __init__(self, queue: IPNQueue, verify: Callable[[IPN], bool], onResult: Callable[[IPN, bool], None] = None,
+                 workers: int = 4, batchSize: int = 16, maxAttempts: int = 5, backoff: float = 1.0,
+                 maxBackoff: float = 300.0, pollInterval: float = 0.2, keepDone: float = 86400.0,
+                 purgeInterval: float = 300.0) -> None:
+
+        # queue the ipns are taken from
+        self.queue: IPNQueue = queue
+
+        # verification function, e.g. PaymentHandler.is_ipn_authentic
+        self.verify: Callable[[IPN], bool] = verify
+
+        # called with every ipn and its verification result
+        self.onResult: Callable[[IPN, bool], None] = onResult
+
+        # number of worker threads, i.e. maximum concurrent verifications
+        self.workers: int = workers
+
+        # ipns a worker claims at once
+        self.batchSize: int = batchSize
+
+        # attempts before an ipn is dead lettered
+        self.maxAttempts: int = maxAttempts
+
+        # seconds before the first retry, doubled on every attempt (with jitter)
+        self.backoff: float = backoff
+
+        # upper bound of the retry delay
+        self.maxBackoff: float = maxBackoff
+
+        # seconds an idle worker waits before looking at the queue again
+        self.pollInterval: float = pollInterval
+
+        # seconds verified ipns stay in the queue before they are purged, None to keep them
+        self.keepDone: float = keepDone
+
+        # seconds between purges of verified ipns
+        self.purgeInterval: float = purgeInterval
+
+        # time from enqueue to claim
+        self.waitLatency = _Latency()
+
+        # time spent verifying
+        self.verifyLatency = _Latency()
+
+        # time from enqueue to a final result
+        self.totalLatency = _Latency()
+
+        self.verified: int = 0
+        self.retried: int = 0
+        self.deadLettered: int = 0
+        self.purged: int = 0
+
+        # failed batches, e.g. the database was locked, the batch's leases run out and it is claimed again
+        self.errors: int = 0
+
+        self._lock = threading.Lock()
+        self._nextPurge: float = 0.0
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    # starts the worker threads, returning ipns whose lease ran out to the queue
+    def start(self) -> None:
+
+        self.queue.recover()
+        self._stop.clear()
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"ipn-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    # stops the workers after their current batch
+    def stop(self, timeout: float = None) -> None:
+
+        self._stop.set()
+
+        for thread in self._threads:
+            thread.join(timeout)
+
+        self._threads = []
+
+    # verifies ready ipns until the queue is empty, in the calling thread
+    def drain(self) -> None:
+
+        while self._process(self.queue.claim(self.batchSize)):
+            pass
+
+    # a failing batch is logged and the worker carries on, ipns it left claimed are taken over when their lease runs out
+    def _run(self) -> None:
+
+        while not self._stop.is_set():
+            try:
+                self._purge()
+                busy = self._process(self.queue.claim(self.batchSize))
+            except Exception:
+                logger.exception("yenepay ipn worker batch failed")
+                busy = False
+
+                with self._lock:
+                    self.errors += 1
+
+            if not busy:
+                self._stop.wait(self.pollInterval)
+
+    # purges verified ipns older than keepDone, once every purgeInterval seconds (by one of the workers)
+    # so claim and lag don't scan a table that only grows
+    def _purge(self) -> None:
+
+        if self.keepDone is None:
+            return
+
+        now = time.monotonic()
+
+        with self._lock:
+            if now < self._nextPurge:
+                return
+
+            self._nextPurge = now + self.purgeInterval
+
+        purged = self.queue.purge(self.keepDone)
+
+        with self._lock:
+            self.purged += purged
+
+    # verifies a claimed batch, returns False if it was empty
+    def _process(self, batch: list) -> bool:
+
+        for id_, ipn, attempts, enqueued in batch:
+            # taken over by another process while this one worked through the batch
+            if not self.queue.renew(id_):
+                continue
+
+            start = time.time()
+
+            with self._lock:
+                self.waitLatency.add(start - enqueued)
+
+            # a failing onResult is retried too, so it should be idempotent
+            try:
+                authentic = self.verify(ipn)
+                verified = time.time()
+
+                if self.onResult is not None:
+                    self.onResult(ipn, authentic)
+            except Exception as e:
+                self._failed(id_, attempts + 1, repr(e))
+                continue
+
+            self.queue.complete(id_, authentic)
+            end = time.time()
+
+            with self._lock:
+                self.verified += 1
+                self.verifyLatency.add(verified - start)
+                self.totalLatency.add(end - enqueued)
+
+        return bool(batch)
+
+    # retries with jittered exponential backoff, or dead letters after maxAttempts
+    def _failed(self, id_: int, attempts: int, error: str) -> None:
+
+        if attempts >= self.maxAttempts:
+            self.queue.dead_letter(id_, error)
+
+            with self._lock:
+                self.deadLettered += 1
+
+            return
+
+        delay = min(self.maxBackoff, self.backoff * 2 ** (attempts - 1))
+        self.queue.retry(id_, error, random.uniform(delay / 2, delay))
+
+        with self._lock:
+            self.retried += 1
+
+    # queue depth, lag and per stage latencies for monitoring
+    def stats(self) -> dict:
+
+        with self._lock:
+            return {
+                "depth": self.queue.depth(),
+                "lag": self.queue.lag(),
+                "verified": self.verified,
+                "retried": self.retried,
+                "dead_lettered": self.deadLettered,
+                "purged": self.purged,
+                "errors": self.errors,
+                "wait": self.waitLatency.as_dict(),
+                "verify": self.verifyLatency.as_dict(),
+                "total": self.totalLatency.as_dict(),
+            }
@@ -0,0 +1,196 @@
+import time
+from typing import Awaitable, Callable
+
+from yenepay.Cache import TTLCache
+from yenepay.Models import IPN
+from yenepay.Signature import canonical_string
+from yenepay.Sqlite import LocalConnections
+
+
+# idempotency key of an ipn: digest of every signed field and the signature
+# an ipn reusing a verified one's transaction id and signature with any field changed gets a new key
+def ipn_key(ipn: IPN) -> str:
+
+    data = canonical_string(ipn) + b"\n" + (ipn.signature or "").encode("utf-8")
+
+    import hashlib
+
+    return hashlib.sha256(data).hexdigest()
+
+
+# remembers verified ipns in process memory, evicting least recently used ones
+# concurrent deliveries of the same ipn share one verification
+class MemoryIPNStore:
+
+    def __init__(self, maxEntries: int = 100000) -> None:
+
+        self._cache: TTLCache = TTLCache(maxEntries=maxEntries)
+
+    # returns verifier() for a new ipn and the stored result for a verified one
+    # failed verifications are not remembered so a retried delivery is verified again
+    def verify(self, key: str, verifier: Callable[[], bool]) -> bool:
+
+        return self._cache.get_or_load(key, verifier, keep=bool)
+
+    # asyncio counterpart of verify, verifier is a coroutine function
+    async def verify_async(self, key: str, verifier: Callable[[], Awaitable[bool]]) -> bool:
+
+        return await self._cache.get_or_load_async(key, verifier, keep=bool)
+
+    # counters for monitoring, hits are verification calls saved
+    def stats(self) -> dict:
+
+        return self._cache.stats()
+
+
+# remembers verified ipns in a sqlite database (WAL mode) shared by several processes
+# the first process to see an ipn claims it, others wait for its result
+class SQLiteIPNStore:
+
+    PENDING = 0
+    VERIFIED = 1
+
+    def __init__(self, path: str, claimTimeout: float = 30.0, pollInterval: float = 0.05) -> None:
+
+        # path of the database file
+        self.path: str = path
+
+        # seconds after which a claim of a crashed process can be taken over
+        self.claimTimeout: float = claimTimeout
+
+        # seconds between checks while another process verifies the same ipn
+        self.pollInterval: float = pollInterval
+
+        # number of verifications answered from the store
+        self.hits: int = 0
+
+        # number of verifications done by this process
+        self.misses: int = 0
+
+        # number of verifications that waited for another process
+        self.coalesced: int = 0
+
+        self._connections = LocalConnections(path)
+        self._connections.get().execute(
+            "CREATE TABLE IF NOT EXISTS ipn_verified (key TEXT PRIMARY KEY, state INTEGER NOT NULL, updated REAL NOT NULL)"
+        )
+
+    # returns verifier() for a new ipn and True for an already verified one
+    # failed verifications are not remembered so a retried delivery is verified again
+    def verify(self, key: str, verifier: Callable[[], bool]) -> bool:
+
+        waited = False
+
+        while True:
+            state = self._claim(key)
+
+            if state == self.VERIFIED:
+                return self._hit(waited)
+
+            if state is None:
+                break
+
+            # another process is verifying this ipn
+            waited = True
+            time.sleep(self.pollInterval)
+
+        self.misses += 1
+
+        try:
+            verified = verifier()
+        except BaseException:
+            self._release(key, False)
+            raise
+
+        return self._release(key, verified)
+
+    # asyncio counterpart of verify, verifier is a coroutine function
+    async def verify_async(self, key: str, verifier: Callable[[], Awaitable[bool]]) -> bool:
+
+        import asyncio
+
+        waited = False
+
+        while True:
+            state = self._claim(key)
+
+            if state == self.VERIFIED:
+                return self._hit(waited)
+
+            if state is None:
+                break
+
+            waited = True
+            await asyncio.sleep(self.pollInterval)
+
+        self.misses += 1
+
+        try:
+            verified = await verifier()
+        except BaseException:
+            self._release(key, False)
+            raise
+
+        return self._release(key, verified)
+
+    def _hit(self, waited: bool) -> bool:
+
+        if waited:
+            self.coalesced += 1
+        else:
+            self.hits += 1
+
+        return True
+
+    # records the outcome of a claimed verification, a failed one releases the claim
+    def _release(self, key: str, verified: bool) -> bool:
+
+        connection = self._connections.get()
+
+        if verified:
+            connection.execute("UPDATE ipn_verified SET state = ?, updated = ? WHERE key = ?", (self.VERIFIED, time.time(), key))
+        else:
+            connection.execute("DELETE FROM ipn_verified WHERE key = ? AND state = ?", (key, self.PENDING))
+
+        return verified
+
+    # atomically claims key for verification
+    # returns None if claimed, otherwise the current state of the key
+    def _claim(self, key: str) -> int:
+
+        connection = self._connections.get()
+        now = time.time()
+
+        inserted = connection.execute(
+            "INSERT OR IGNORE INTO ipn_verified (key, state, updated) VALUES (?, ?, ?)", (key, self.PENDING, now)
+        ).rowcount
+
+        if inserted:
+            return None
+
+        # take over a claim left behind by a crashed process
+        taken = connection.execute(
+            "UPDATE ipn_verified SET updated = ? WHERE key = ? AND state = ? AND updated < ?",
+            (now, key, self.PENDING, now - self.claimTimeout),
+        ).rowcount
+
+        if taken:
+            return None
+
+        row = connection.execute("SELECT state FROM ipn_verified WHERE key = ?", (key,)).fetchone()
+
+        if row is None:
+            # the claim was released meanwhile, try again
+            return self._claim(key)
+
+        return row[0]
+
+    # removes entries older than maxAge seconds
+    def purge(self, maxAge: float) -> None:
+
+        self._connections.get().execute("DELETE FROM ipn_verified WHERE updated < ?", (time.time() - maxAge,))
+
+    # counters for monitoring, hits are verification calls saved
+    def stats(self) -> dict:
+
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
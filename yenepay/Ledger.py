@@ -0,0 +1,293 @@
+import json
+import queue
+import threading
+import time
+from typing import Iterator, List, NamedTuple, Tuple
+
+from yenepay.Models import IPN, PDTResult
+from yenepay.Sqlite import LocalConnections, connect
+
+
+# order statuses in the order they can be reached, an order never moves back
+STATUS_RANK = {
+    "New": 0,
+    "Processing": 1,
+    "Paid": 2,
+    "Canceled": 2,
+    "Expired": 2,
+    "Delivered": 3,
+    "Completed": 4,
+}
+
+
+# an order as stored in the ledger
+class Order(NamedTuple):
+
+    merchantOrderId: str
+    transactionId: str
+    status: str
+    total: float
+    checkoutUrl: str
+    created: float
+    updated: float
+
+
+# an event recorded for an order
+class OrderEvent(NamedTuple):
+
+    merchantOrderId: str
+    kind: str
+    status: str
+    transactionId: str
+    at: float
+    data: str
+
+
+# request to the writer thread
+class _Write:
+
+    __slots__ = ("event", "total", "checkoutUrl", "done", "error")
+
+    def __init__(self, event: OrderEvent, total: float, checkoutUrl: str, wait: bool) -> None:
+
+        self.event: OrderEvent = event
+        self.total: float = total
+        self.checkoutUrl: str = checkoutUrl
+        self.done: threading.Event = threading.Event() if wait else None
+        self.error: BaseException = None
+
+
+_STOP = object()
+
+
+# persistent order ledger in a sqlite database (WAL mode)
+# orders are indexed by merchant order id and transaction id, every checkout, pdt and ipn is
+# recorded as an event, and status transitions are applied atomically (an order never moves back)
+# writes from all threads go through one writer thread that commits them in groups
+class Ledger:
+
+    def __init__(self, path: str, maxBatch: int = 1000) -> None:
+
+        # path of the database file
+        self.path: str = path
+
+        # maximum events committed in one transaction
+        self.maxBatch: int = maxBatch
+
+        # number of events committed
+        self.events: int = 0
+
+        # number of transactions used to commit them
+        self.commits: int = 0
+
+        self._reads = LocalConnections(path)
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+
+        connection = connect(path)
+        connection.executescript(
+            "CREATE TABLE IF NOT EXISTS orders ("
+            " merchant_order_id TEXT PRIMARY KEY, transaction_id TEXT, status TEXT NOT NULL, rank INTEGER NOT NULL,"
+            " total REAL, checkout_url TEXT, created REAL NOT NULL, updated REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS orders_transaction ON orders (transaction_id);"
+            "CREATE INDEX IF NOT EXISTS orders_pending ON orders (rank, transaction_id);"
+            "CREATE TABLE IF NOT EXISTS order_events ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, merchant_order_id TEXT NOT NULL, kind TEXT NOT NULL,"
+            " status TEXT, transaction_id TEXT, at REAL NOT NULL, data TEXT);"
+            "CREATE INDEX IF NOT EXISTS order_events_order ON order_events (merchant_order_id);"
+        )
+
+        self._writer = threading.Thread(target=self._write_loop, args=(connection,), name="yenepay-ledger", daemon=True)
+        self._writer.start()
+
+    # records a generated checkout, creating the order as New
+    def record_checkout(self, merchantOrderId: str, checkoutUrl: str = None, total: float = None, wait: bool = True) -> None:
+
+        event = OrderEvent(merchantOrderId, "checkout", "New", None, time.time(), None)
+
+        self._submit(_Write(event, total, checkoutUrl, wait))
+
+    # records a pdt result, results without a merchant order id (a failed pdt request) are skipped
+    def record_pdt(self, result: PDTResult, wait: bool = True) -> None:
+
+        if not result.merchantOrderId:
+            return
+
+        status = result.status if result.is_success else None
+        event = OrderEvent(result.merchantOrderId, "pdt", status, result.transactionId, time.time(), result.to_query())
+
+        self._submit(_Write(event, None, None, wait))
+
+    # records an ipn, its status is applied only if it is authentic
+    def record_ipn(self, ipn: IPN, authentic: bool, wait: bool = True) -> None:
+
+        data = ipn.as_dict()
+        data["authentic"] = authentic
+        status = ipn.status if authentic else None
+        event = OrderEvent(ipn.merchantOrderId, "ipn", status, ipn.transactionId, time.time(), json.dumps(data))
+
+        self._submit(_Write(event, None, None, wait))
+
+    # order by merchant order id, None if unknown
+    def get(self, merchantOrderId: str) -> Order:
+
+        row = self._reads.get().execute(
+            "SELECT merchant_order_id, transaction_id, status, total, checkout_url, created, updated"
+            " FROM orders WHERE merchant_order_id = ?", (merchantOrderId,)
+        ).fetchone()
+
+        return Order(*row) if row is not None else None
+
+    # order by yenepay transaction id, None if unknown
+    def by_transaction(self, transactionId: str) -> Order:
+
+        row = self._reads.get().execute(
+            "SELECT merchant_order_id, transaction_id, status, total, checkout_url, created, updated"
+            " FROM orders WHERE transaction_id = ?", (transactionId,)
+        ).fetchone()
+
+        return Order(*row) if row is not None else None
+
+    # events of an order, oldest first
+    def history(self, merchantOrderId: str) -> List[OrderEvent]:
+
+        rows = self._reads.get().execute(
+            "SELECT merchant_order_id, kind, status, transaction_id, at, data FROM order_events"
+            " WHERE merchant_order_id = ? ORDER BY id", (merchantOrderId,)
+        ).fetchall()
+
+        return [OrderEvent(*row) for row in rows]
+
+    # streams (merchantOrderId, transactionId) of orders with a known transaction that are not yet paid or canceled,
+    # e.g. as input of yenepay.Reconcile
+    def pending(self) -> Iterator[Tuple[str, str]]:
+
+        cursor = self._reads.get().execute(
+            "SELECT merchant_order_id, transaction_id FROM orders WHERE rank < ? AND transaction_id IS NOT NULL",
+            (STATUS_RANK["Paid"],),
+        )
+
+        for row in cursor:
+            yield row[0], row[1]
+
+    # writes pdt status rows as produced by yenepay.Reconcile (merchantOrderId, transactionId, status, error)
+    def write_statuses(self, rows: List[Tuple[str, str, str, str]]) -> None:
+
+        writes = []
+
+        for order, txn, status, error in rows:
+            if status:
+                event = OrderEvent(order, "pdt", status, txn, time.time(), None)
+                writes.append(_Write(event, None, None, True))
+
+        for write in writes:
+            self._queue.put(write)
+
+        for write in writes:
+            self._wait(write)
+
+    # waits for queued writes and stops the writer thread
+    def close(self) -> None:
+
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def _submit(self, write: _Write) -> None:
+
+        self._queue.put(write)
+
+        if write.done is not None:
+            self._wait(write)
+
+    @staticmethod
+    def _wait(write: _Write) -> None:
+
+        write.done.wait()
+
+        if write.error is not None:
+            raise write.error
+
+    # takes every queued write (up to maxBatch) and commits them in one transaction
+    def _write_loop(self, connection) -> None:
+
+        while True:
+            first = self._queue.get()
+
+            if first is _STOP:
+                return
+
+            batch = [first]
+            stop = False
+
+            while len(batch) < self.maxBatch:
+                try:
+                    write = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+                if write is _STOP:
+                    stop = True
+                    break
+
+                batch.append(write)
+
+            try:
+                self._commit(connection, batch)
+            except Exception:
+                # isolate the failing write
+                for write in batch:
+                    try:
+                        self._commit(connection, [write])
+                    except Exception as e:
+                        write.error = e
+
+            for write in batch:
+                if write.done is not None:
+                    write.done.set()
+
+            if stop:
+                return
+
+    def _commit(self, connection, batch: List[_Write]) -> None:
+
+        connection.execute("BEGIN IMMEDIATE")
+
+        try:
+            for write in batch:
+                self._apply(connection, write)
+
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        self.events += len(batch)
+        self.commits += 1
+
+    @staticmethod
+    def _apply(connection, write: _Write) -> None:
+
+        event = write.event
+
+        connection.execute(
+            "INSERT INTO order_events (merchant_order_id, kind, status, transaction_id, at, data) VALUES (?, ?, ?, ?, ?, ?)",
+            event,
+        )
+
+        # events without a status (failed pdt, ipn that isn't authentic) are only kept in the history,
+        # they must not create an order or change its transaction id
+        if event.status not in STATUS_RANK:
+            return
+
+        connection.execute(
+            "INSERT INTO orders (merchant_order_id, transaction_id, status, rank, total, checkout_url, created, updated)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (merchant_order_id) DO UPDATE SET"
+            "  transaction_id = COALESCE(excluded.transaction_id, transaction_id),"
+            "  total = COALESCE(excluded.total, total),"
+            "  checkout_url = COALESCE(excluded.checkout_url, checkout_url),"
+            "  status = CASE WHEN excluded.rank > rank THEN excluded.status ELSE status END,"
+            "  rank = MAX(rank, excluded.rank),"
+            "  updated = excluded.updated",
+            (event.merchantOrderId, event.transactionId, event.status, STATUS_RANK[event.status],
+             write.total, write.checkoutUrl, event.at, event.at),
+        )
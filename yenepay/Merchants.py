@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Iterator, List
+
+from yenepay.Checkout import Checkout, MerchantConfig
+from yenepay.Models import IPN
+from yenepay.Transport import QuotaTransport, Transport, default_transport
+
+
+logger = logging.getLogger("yenepay")
+
+# MerchantConfig fields a merchant (or the defaults) can set in a registry file
+FIELDS = ("merchantId", "pdtToken", "useSandbox", "sandboxHost", "ipnUrl", "successUrl", "cancelUrl", "failureUrl",
+          "process", "expiresAfter", "expiresInDays", "vatRate", "totRate")
+
+
+# merchants served from one process, indexed by merchant code
+# every merchant's config is base with the merchant's fields replaced, its transport a QuotaTransport
+# over one shared transport, so a merchant can't hold more than its maxConcurrent of the pool's connections
+# base carries what all merchants share: caches, call policy, ipn store, instrumentation ...
+#
+# the registry file is json:
+#   {"defaults": {"useSandbox": true, "maxConcurrent": 4},
+#    "merchants": [{"merchantId": "0000", "pdtToken": "...", "successUrl": "...", "maxConcurrent": 8}, ...]}
+#
+# reload() reads the file again and swaps in the new merchants at once, lookups never see half a reload
+class MerchantRegistry:
+
+    def __init__(self, path: str = None, base: MerchantConfig = None, transport: Transport = None,
+                 maxConcurrent: int = 4, quotaWait: float = 1.0, checkInterval: float = 5.0) -> None:
+
+        # json file the merchants are read from, None to load() them from a dict
+        self.path: str = path
+
+        # settings every merchant starts from
+        self.base: MerchantConfig = base if base is not None else MerchantConfig("0000")
+
+        # transport shared by all merchants, defaults to the base config's or the shared connection pool
+        if transport is None:
+            transport = self.base.transport if self.base.transport is not None else default_transport()
+
+        self.transport: Transport = transport
+
+        # requests a merchant may have in flight when neither it nor the defaults set maxConcurrent
+        self.maxConcurrent: int = maxConcurrent
+
+        # seconds a request waits for a free slot of its merchant's quota
+        self.quotaWait: float = quotaWait
+
+        # seconds between checks whether the file changed, None to reload only when reload() is called
+        self.checkInterval: float = checkInterval
+
+        self._merchants: Dict[str, MerchantConfig] = {}
+        self._quotas: Dict[str, QuotaTransport] = {}
+        self._mtime: float = None
+        self._checked: float = time.monotonic()
+        self._lock = threading.Lock()
+
+        if path is not None:
+            self.reload()
+
+    # config of a merchant by merchant code, None if unknown
+    def get(self, merchantCode: str) -> MerchantConfig:
+
+        if self.checkInterval is not None and time.monotonic() - self._checked >= self.checkInterval:
+            self.refresh()
+
+        return self._merchants.get(merchantCode)
+
+    # config of the merchant an ipn was sent for, None if unknown
+    def for_ipn(self, ipn: IPN) -> MerchantConfig:
+
+        return self.get(ipn.merchantCode)
+
+    # new checkout of a merchant, raises KeyError if unknown
+    def checkout(self, merchantCode: str) -> Checkout:
+
+        return Checkout(self[merchantCode])
+
+    # verifies an ipn with the merchant it was sent for, unknown merchants' ipns are not authentic
+    def is_ipn_authentic(self, ipn: IPN) -> bool:
+
+        config = self.for_ipn(ipn)
+
+        if config is None:
+            return False
+
+        return Checkout(config).is_ipn_authentic(ipn)
+
+    # reads the registry file again if it changed since it was last read
+    # a broken file is logged and skipped until it changes again, the current merchants stay in place
+    def refresh(self) -> None:
+
+        self._checked = time.monotonic()
+
+        if self.path is None:
+            return
+
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            logger.exception("yenepay merchant registry %s not reloaded", self.path)
+            return
+
+        if mtime == self._mtime:
+            return
+
+        try:
+            self.reload()
+        except (OSError, ValueError, TypeError):
+            logger.exception("yenepay merchant registry %s not reloaded", self.path)
+            self._mtime = mtime
+
+    # reads the registry file and replaces every merchant
+    # a file that can't be read or is invalid raises and leaves the current merchants in place
+    def reload(self) -> None:
+
+        mtime = os.stat(self.path).st_mtime
+
+        with open(self.path, "rb") as f:
+            data = json.load(f)
+
+        self.load(data)
+        self._mtime = mtime
+
+    # replaces every merchant with those of a parsed registry file
+    def load(self, data: dict) -> None:
+
+        if not isinstance(data, dict):
+            raise ValueError("Invalid merchant registry: expected a json object")
+
+        defaults = dict(data.get("defaults") or {})
+        defaultQuota = defaults.pop("maxConcurrent", self.maxConcurrent)
+        _check_fields(defaults, "defaults")
+
+        merchants = {}
+        quotas = {}
+
+        with self._lock:
+            for entry in data.get("merchants") or []:
+                entry = dict(entry)
+                maxConcurrent = entry.pop("maxConcurrent", defaultQuota)
+                _check_fields(entry, f"merchant {entry.get('merchantId')!r}")
+
+                code = entry.get("merchantId")
+
+                if not code:
+                    raise ValueError("Invalid merchant registry: merchant without merchantId")
+
+                if code in merchants:
+                    raise ValueError(f"Invalid merchant registry: merchant {code!r} listed twice")
+
+                # quotas are kept across reloads, requests in flight stay counted
+                quota = self._quotas.get(code)
+
+                if quota is None or quota.maxConcurrent != maxConcurrent:
+                    quota = QuotaTransport(self.transport, maxConcurrent, code, self.quotaWait)
+
+                quotas[code] = quota
+                merchants[code] = self.base._replace(**{**defaults, **entry, "transport": quota})
+
+            self._merchants = merchants
+            self._quotas = quotas
+
+    # merchant codes
+    def codes(self) -> List[str]:
+
+        return list(self._merchants)
+
+    def __getitem__(self, merchantCode: str) -> MerchantConfig:
+
+        config = self.get(merchantCode)
+
+        if config is None:
+            raise KeyError(merchantCode)
+
+        return config
+
+    def __contains__(self, merchantCode: str) -> bool:
+
+        return merchantCode in self._merchants
+
+    def __iter__(self) -> Iterator[MerchantConfig]:
+
+        return iter(list(self._merchants.values()))
+
+    def __len__(self) -> int:
+
+        return len(self._merchants)
+
+
+# raises ValueError naming the keys of entry that aren't registry fields
+def _check_fields(entry: dict, where: str) -> None:
+
+    unknown = [key for key in entry if key not in FIELDS]
+
+    if unknown:
+        raise ValueError(f"Invalid merchant registry: {where} has unknown fields {', '.join(unknown)}")
@@ -0,0 +1,271 @@
+import bisect
+import contextvars
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from yenepay.Transport import Response
+
+
+# content type of the prometheus text format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# latency histogram bucket bounds in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# record of the call being made in the current thread or task
+_current: contextvars.ContextVar = contextvars.ContextVar("yenepay_call", default=None)
+
+
+# one PaymentHandler call (checkout, pdt or ipn) as seen by the instrumentation
+# a call answered from a cache or rejected locally has no status and no network timings
+class CallRecord:
+
+    __slots__ = ("call", "endpoint", "start", "seconds", "status", "result", "error", "connect", "tls", "server", "parse", "_received")
+
+    def __init__(self, call: str, endpoint: str) -> None:
+
+        # checkout, pdt or ipn
+        self.call: str = call
+
+        # url of the yenepay endpoint
+        self.endpoint: str = endpoint
+
+        # perf_counter() when the call started
+        self.start: float = time.perf_counter()
+
+        # seconds the whole call took
+        self.seconds: float = None
+
+        # http status of the last response, None if no request was answered
+        self.status: int = None
+
+        # outcome: ok, a pdt status (Paid, Canceled, ...), failed, valid, invalid or error
+        self.result: str = None
+
+        # exception class name if the call raised
+        self.error: str = None
+
+        # seconds of the last request spent on tcp connect, tls handshake and request/response,
+        # None if the transport doesn't measure them
+        self.connect: float = None
+        self.tls: float = None
+        self.server: float = None
+
+        # seconds from the last response to the call's result (decoding, caching)
+        self.parse: float = None
+
+        self._received: float = None
+
+    # notes a response of the call (the last one wins when calls are retried or hedged)
+    def received(self, response: Response) -> None:
+
+        self._received = time.perf_counter()
+        self.status = response.status_code
+
+        timings = getattr(response, "timings", None)
+
+        if timings is not None:
+            self.connect, self.tls, self.server = timings
+
+    def _finish(self) -> None:
+
+        end = time.perf_counter()
+        self.seconds = end - self.start
+
+        if self._received is not None:
+            self.parse = end - self._received
+
+
+# pre and post call hooks of a PaymentHandler
+# before hooks get the record when a call starts, after hooks when it ended (also if it raised)
+# hooks run in the calling thread, exceptions they raise are logged and ignored
+class Instrumentation:
+
+    def __init__(self, before: Iterable[Callable[[CallRecord], None]] = (), after: Iterable[Callable[[CallRecord], None]] = ()) -> None:
+
+        # called with the record when a call starts
+        self.before: List[Callable[[CallRecord], None]] = list(before)
+
+        # called with the completed record
+        self.after: List[Callable[[CallRecord], None]] = list(after)
+
+    def add_before(self, hook: Callable[[CallRecord], None]) -> None:
+
+        self.before.append(hook)
+
+    def add_after(self, hook: Callable[[CallRecord], None]) -> None:
+
+        self.after.append(hook)
+
+    # record of the call in progress in this thread or task, None outside a call
+    @staticmethod
+    def current() -> CallRecord:
+
+        return _current.get()
+
+    # runs fn as an instrumented call, classify turns its return value into the record's result
+    def run(self, call: str, endpoint: str, fn: Callable[[], Any], classify: Callable[[Any], str]) -> Any:
+
+        record = CallRecord(call, endpoint)
+        token = _current.set(record)
+        self._notify(self.before, record)
+
+        try:
+            value = fn()
+            record.result = classify(value)
+            return value
+        except BaseException as e:
+            record.result = "error"
+            record.error = type(e).__name__
+            raise
+        finally:
+            record._finish()
+            _current.reset(token)
+            self._notify(self.after, record)
+
+    # run() for a coroutine function
+    async def run_async(self, call: str, endpoint: str, fn: Callable[[], Any], classify: Callable[[Any], str]) -> Any:
+
+        record = CallRecord(call, endpoint)
+        token = _current.set(record)
+        self._notify(self.before, record)
+
+        try:
+            value = await fn()
+            record.result = classify(value)
+            return value
+        except BaseException as e:
+            record.result = "error"
+            record.error = type(e).__name__
+            raise
+        finally:
+            record._finish()
+            _current.reset(token)
+            self._notify(self.after, record)
+
+    @staticmethod
+    def _notify(hooks: List[Callable[[CallRecord], None]], record: CallRecord) -> None:
+
+        for hook in hooks:
+            try:
+                hook(record)
+            except Exception:
+                import logging
+
+                logging.getLogger("yenepay").exception("yenepay instrumentation hook failed")
+
+
+# cumulative histogram with fixed bucket bounds
+class _Histogram:
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int) -> None:
+
+        self.counts: List[int] = [0] * (buckets + 1)
+        self.sum: float = 0.0
+        self.count: int = 0
+
+
+# per call latency histograms (total, connect, tls, server, parse) and counters of
+# http statuses and results, rendered in the prometheus text format
+# pass observe as an after hook of an Instrumentation
+class PrometheusMetrics:
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, prefix: str = "yenepay") -> None:
+
+        # upper bounds of the latency buckets in seconds
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+
+        # prefix of every metric name
+        self.prefix: str = prefix
+
+        self._histograms: Dict[Tuple[str, str], _Histogram] = {}
+        self._statuses: Dict[Tuple[str, str], int] = {}
+        self._results: Dict[Tuple[str, str], int] = {}
+        self._gauges: List[Tuple[str, str, Callable[[], float]]] = []
+        self._lock = threading.Lock()
+
+    # an instrumentation reporting to these metrics
+    def instrumentation(self) -> Instrumentation:
+
+        return Instrumentation(after=[self.observe])
+
+    # adds a value read when the metrics are rendered, e.g. a queue depth
+    def add_gauge(self, name: str, help_: str, fn: Callable[[], float]) -> None:
+
+        self._gauges.append((name, help_, fn))
+
+    # records a completed call
+    def observe(self, record: CallRecord) -> None:
+
+        call = record.call
+        phases = [("total", record.seconds)]
+
+        if record.server is not None:
+            phases += [("connect", record.connect), ("tls", record.tls), ("server", record.server)]
+
+        if record.parse is not None:
+            phases.append(("parse", record.parse))
+
+        status = str(record.status) if record.status is not None else "none"
+
+        with self._lock:
+            for phase, seconds in phases:
+                histogram = self._histograms.get((call, phase))
+
+                if histogram is None:
+                    histogram = self._histograms[(call, phase)] = _Histogram(len(self.buckets))
+
+                histogram.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+                histogram.sum += seconds
+                histogram.count += 1
+
+            self._statuses[(call, status)] = self._statuses.get((call, status), 0) + 1
+            self._results[(call, record.result)] = self._results.get((call, record.result), 0) + 1
+
+    # metrics in the prometheus text exposition format
+    def render(self) -> str:
+
+        name = self.prefix + "_call_duration_seconds"
+        lines = [
+            f"# HELP {name} Seconds spent in yenepay calls by phase",
+            f"# TYPE {name} histogram",
+        ]
+
+        with self._lock:
+            histograms = sorted((key, list(h.counts), h.sum, h.count) for key, h in self._histograms.items())
+            statuses = sorted(self._statuses.items())
+            results = sorted(self._results.items())
+
+        for (call, phase), counts, total, count in histograms:
+            labels = f'call="{call}",phase="{phase}"'
+            cumulative = 0
+
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{name}_sum{{{labels}}} {total}")
+            lines.append(f"{name}_count{{{labels}}} {count}")
+
+        name = self.prefix + "_http_responses_total"
+        lines += [f"# HELP {name} Yenepay calls by http status of the last response", f"# TYPE {name} counter"]
+        lines += [f'{name}{{call="{call}",status="{status}"}} {n}' for (call, status), n in statuses]
+
+        name = self.prefix + "_call_results_total"
+        lines += [f"# HELP {name} Yenepay calls by result", f"# TYPE {name} counter"]
+        lines += [f'{name}{{call="{call}",result="{_escape(result)}"}} {n}' for (call, result), n in results]
+
+        for gauge, help_, fn in self._gauges:
+            lines += [f"# HELP {gauge} {help_}", f"# TYPE {gauge} gauge", f"{gauge} {fn()}"]
+
+        return "\n".join(lines) + "\n"
+
+
+# label value escaped for the text format
+def _escape(value: str) -> str:
+
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
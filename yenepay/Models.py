@@ -1,5 +1,46 @@
+from typing import Sequence, Tuple
+
+
+# generates an as_dict function reading the given attributes in order
+# skip_none leaves out attributes that are None
+def _compile_as_dict(fields: Sequence[str], skip_none: bool = True):
+
+    if skip_none:
+        body = ["    d = {}"]
+        for f in fields:
+            body.append(f"    v = self.{f}")
+            body.append(f"    if v is not None: d[{f!r}] = v")
+        body.append("    return d")
+    else:
+        body = ["    return {" + ", ".join(f"{f!r}: self.{f}" for f in fields) + "}"]
+
+    namespace = {}
+    exec("def as_dict(self) -> dict:\n" + "\n".join(body), namespace)
+
+    return namespace["as_dict"]
+
+
+# generates a from_dict function filling attributes from (key, attribute) pairs
+# a missing key raises a ValueError naming every missing field
+def _compile_from_dict(name: str, mapping: Sequence[Tuple[str, str]]):
+
+    body = ["    try:"]
+    for key, attr in mapping:
+        body.append(f"        self.{attr} = d[{key!r}]")
+    body.append("    except KeyError:")
+    body.append("        missing = [k for k in keys if k not in d]")
+    body.append(f"        raise ValueError(f\"Invalid {name}: missing fields {{', '.join(missing)}}\") from None")
+
+    namespace = {"keys": tuple(key for key, _ in mapping)}
+    exec("def from_dict(self, d: dict) -> None:\n" + "\n".join(body), namespace)
+
+    return namespace["from_dict"]
+
+
 class Item:
 
+    __slots__ = ("itemId", "itemName", "unitPrice", "quantity")
+
     def __init__(self, itemId, itemName, itemPrice, totalQuantity):
         
         # Unique identifier of the item
@@ -61,19 +102,13 @@ class Item:
         self.quantity = q
     
     # dictionary representation of Item
-    def as_dict(self):
-        
-        d = {}
-
-        for k, v in self.__dict__.items():
-            if v != None:
-                d[k] = v
-
-        return d
+    as_dict = _compile_as_dict(__slots__)
 
 # Payment data transfer
 class PDT:
 
+    __slots__ = ("requestType", "pdtToken", "transactionId", "merchantOrderId")
+
     def __init__(self, pdtToken: str):
 
         # PDT Request Type
@@ -119,16 +154,14 @@ class PDT:
         self.merchantOrderId = id_
 
     # dictionary representation of PDT
-    def as_dict(self):
-
-        return self.__dict__
+    as_dict = _compile_as_dict(__slots__, skip_none=False)
     
     # string representation of PDT
     def __str__(self) -> str:
         
         s = ''
         
-        for k, v in self.__dict__.items():
+        for k, v in self.as_dict().items():
             s += f"{k} : {v}\n"
         
         return s
@@ -137,6 +170,8 @@ class PDT:
 # Instant Payment Notification
 class IPN:
 
+    __slots__ = ("totalAmount", "buyerId", "merchantOrderId", "merchantId", "merchantCode", "transactionId", "transactionCode", "status", "currency", "signature")
+
     def __init__(self):
         
         # Total amount paid
@@ -250,24 +285,130 @@ class IPN:
         self.signature = signature
     
     # fill IPN object attributes from dictionary
-    def from_dict(self, d: dict) -> None:
-        
-        self.totalAmount = d["TotalAmount"]
-        self.buyerId = d["BuyerId"]
-        self.merchantOrderId = d["MerchantOrderId"]
-        self.merchantId = d["MerchantId"]
-        self.merchantCode = d["MerchantCode"]
-        self.transactionId = d["TransactionId"]
-        self.transactionCode = d["TransactionCode"]
-        self.status = d["Status"]
-        self.currency = d["Currency"]
-        self.signature = d["Signature"]
+    # raises ValueError listing the missing fields if any is absent
+    from_dict = _compile_from_dict("IPN", [
+        ("TotalAmount", "totalAmount"),
+        ("BuyerId", "buyerId"),
+        ("MerchantOrderId", "merchantOrderId"),
+        ("MerchantId", "merchantId"),
+        ("MerchantCode", "merchantCode"),
+        ("TransactionId", "transactionId"),
+        ("TransactionCode", "transactionCode"),
+        ("Status", "status"),
+        ("Currency", "currency"),
+        ("Signature", "signature"),
+    ])
     
+    # dictionary representation of IPN
+    as_dict = _compile_as_dict(__slots__)
+
+
+# result of a PDT request as returned by yenepay
+class PDTResult:
+
+    # payment statuses that never change once reported
+    TERMINAL_STATUSES = ("Paid", "Canceled")
+
+    __slots__ = ("result", "totalAmount", "buyerId", "merchantOrderId", "merchantCode", "merchantId", "transactionCode", "transactionId", "status", "currency", "raw")
+
+    def __init__(self, raw: dict) -> None:
+
+        # every field yenepay returned
+        self.raw: dict = raw
+
+        # "SUCCESS" if the pdt request succeeded
+        self.result: str = raw.get("result")
+
+        # Total amount paid
+        self.totalAmount: str = raw.get("TotalAmount")
+
+        # The customer's id on YenePay
+        self.buyerId: str = raw.get("BuyerId")
+
+        # Id that identifies the order on the merchant application
+        self.merchantOrderId: str = raw.get("MerchantOrderId")
+
+        # your YenePay merchant account code
+        self.merchantCode: str = raw.get("MerchantCode")
+
+        # your YenePay merchant account unique identifier
+        self.merchantId: str = raw.get("MerchantId")
+
+        # an order code for the payment order assigned by YenePay
+        self.transactionCode: str = raw.get("TransactionCode")
+
+        # an identifier for the payment order assigned by YenePay
+        self.transactionId: str = raw.get("TransactionId")
+
+        # Order status value for the payment
+        self.status: str = raw.get("Status")
+
+        # Currency code used for payment
+        self.currency: str = raw.get("Currency")
+
+    # parses the url encoded body of a pdt response
+    @classmethod
+    def from_query(cls, query: str) -> "PDTResult":
+
+        from urllib.parse import parse_qsl
+
+        return cls(dict(parse_qsl(query)))
+
+    # url encoded form of the result, as returned by yenepay
+    def to_query(self) -> str:
+
+        from urllib.parse import urlencode
+
+        return urlencode(self.raw)
+
+    @property
+    def is_success(self) -> bool:
+        return self.result == "SUCCESS"
+
+    @property
+    def is_paid(self) -> bool:
+        return self.is_success and self.status == "Paid"
+
+    @property
+    def is_canceled(self) -> bool:
+        return self.is_success and self.status == "Canceled"
+
+    # True if the status can not change anymore
+    @property
+    def is_terminal(self) -> bool:
+        return self.is_success and self.status in self.TERMINAL_STATUSES
+
+    @property
+    def payment_status(self) -> str:
+        return self.status
+
+    @property
+    def transaction_id(self) -> str:
+        return self.transactionId
+
+    @property
+    def merchant_order_id(self) -> str:
+        return self.merchantOrderId
+
+    @property
+    def total_amount(self) -> str:
+        return self.totalAmount
+
     def as_dict(self) -> dict:
-        d = {}
+        return self.raw
+
+    # raw field access, e.g. result["Status"]
+    def __getitem__(self, key: str) -> str:
+        return self.raw[key]
 
-        for k, v in self.__dict__.items():
-            if v != None:
-                d[k] = v
+    def get(self, key: str, default: str = None) -> str:
+        return self.raw.get(key, default)
 
-        return d
\ No newline at end of file
+    def __str__(self) -> str:
+        
+        s = ''
+        
+        for k, v in self.raw.items():
+            s += f"{k} : {v}\n"
+        
+        return s
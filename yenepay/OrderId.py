@@ -0,0 +1,285 @@
+import itertools
+import os
+import threading
+import time
+import weakref
+from time import time_ns
+from typing import IO, Tuple
+
+
+# longest merchant order id generated, prefix included
+MAX_ORDER_ID_LENGTH = 36
+
+# ids count milliseconds from 2024-01-01 UTC, 41 bits last until 2093
+EPOCH_MS = 1704067200000
+
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+
+_TIME_SHIFT = WORKER_BITS + SEQUENCE_BITS
+
+# digits of the 63 bit id in each encoding, ids are zero padded so they sort by time as strings too
+_WIDTHS = {"decimal": 19, "hex": 16, "base36": 13}
+
+_BASE36 = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+# the high bits of a worker id name the node (YENEPAY_NODE_ID), the low bits a slot unique on the node
+NODE_BITS = 4
+SLOT_BITS = WORKER_BITS - NODE_BITS
+
+MAX_NODE_ID = (1 << NODE_BITS) - 1
+MAX_SLOT = (1 << SLOT_BITS) - 1
+
+
+# node id from YENEPAY_NODE_ID, 0 when it isn't set
+def _node_id() -> int:
+
+    node = int(os.environ.get("YENEPAY_NODE_ID", 0))
+
+    if not 0 <= node <= MAX_NODE_ID:
+        raise ValueError(f"YENEPAY_NODE_ID must be between 0 and {MAX_NODE_ID}")
+
+    return node
+
+
+# locks the first byte of an open file without waiting, raises OSError when another process holds it
+# the lock goes away with the last descriptor of the file, so also when its process dies
+def _lock(file) -> None:
+
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    else:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+
+# (worker id, lease file) of a generator without an explicit worker id
+# YENEPAY_NODE_ID (0-15, one per machine or container) goes in the high bits, and the first of the node's
+# the lease file stays open until the generator is closed (or garbage collected)
+# directory by default), so every process and generator on a node gets its own worker id whoever started it
+# the lease file stays open as long as the generator, and must not be closed before it stops making ids
+def default_worker_id() -> Tuple[int, IO]:
+
+    if "YENEPAY_WORKER_ID" in os.environ:
+        raise ValueError("YENEPAY_WORKER_ID is shared by every process of a node, "
+                         "set YENEPAY_NODE_ID per node instead")
+
+    node = _node_id()
+    directory = os.environ.get("YENEPAY_WORKER_LOCK_DIR")
+
+    if directory is None:
+        import tempfile
+        directory = os.path.join(tempfile.gettempdir(), "yenepay-order-ids")
+
+    os.makedirs(directory, exist_ok=True)
+
+    for slot in range(MAX_SLOT + 1):
+        file = open(os.path.join(directory, f"{node}-{slot}.lock"), "a+b")
+
+        try:
+            _lock(file)
+        except OSError:
+            file.close()
+            continue
+
+        return node << SLOT_BITS | slot, file
+
+    raise RuntimeError(f"All {MAX_SLOT + 1} order id worker slots of node {node} are held, "
+                       f"run fewer generators per node or set YENEPAY_NODE_ID")
+
+
+# time ordered unique merchant order ids (milliseconds | worker id | sequence, 63 bits)
+# ids are unique across processes and nodes as long as every generator has its own worker id: pass one,
+# or set YENEPAY_NODE_ID per node and let each generator lease a slot of the node (see default_worker_id)
+# next() takes no lock: the millisecond and sequence come from one atomic counter that is
+# only moved forward (under a lock) when it falls behind the clock
+class OrderIdGenerator:
+
+    def __init__(self, workerId: int = None, prefix: str = "", encoding: str = "decimal", maxDrift: int = 50) -> None:
+
+        if encoding not in _WIDTHS:
+            raise ValueError(f"Unknown encoding {encoding!r}, expected one of {', '.join(_WIDTHS)}")
+
+        if len(prefix) + _WIDTHS[encoding] > MAX_ORDER_ID_LENGTH:
+            raise ValueError(f"Order ids would be longer than {MAX_ORDER_ID_LENGTH} characters, use a shorter prefix")
+
+        if workerId is not None and not 0 <= workerId <= MAX_WORKER_ID:
+            raise ValueError(f"Worker id must be between 0 and {MAX_WORKER_ID}")
+
+        if workerId is None:
+            workerId, self._lease = default_worker_id()
+        else:
+            self._lease = None
+
+        # id of this generator, unique per process and node
+        self.workerId: int = workerId
+
+        # text put in front of every id, e.g. "order-"
+        self.prefix: str = prefix
+
+        # digits of the id: decimal, hex or base36
+        self.encoding: str = encoding
+
+        # milliseconds ids may run ahead of the clock before next() slows down
+        self.maxDrift: int = maxDrift
+
+        self._explicitWorker: bool = self._lease is None
+        self._width: int = _WIDTHS[encoding]
+        self._lock = threading.Lock()
+        self._workerBits: int = self.workerId << SEQUENCE_BITS
+        self._counter = itertools.count((time_ns() // 1000000 - EPOCH_MS) << SEQUENCE_BITS)
+
+        # a forked child would repeat the parent's ids
+        _generators.add(self)
+
+    # releases the leased worker id, next() raises afterwards
+    # waits (up to maxDrift ms) until the clock has passed the last id, so the next owner of the slot can't repeat it
+    def close(self) -> None:
+
+        with self._lock:
+            if isinstance(self._counter, _Stopped):
+                return
+
+            ms = next(self._counter) >> SEQUENCE_BITS
+            self._counter = _Stopped("Order id generator is closed")
+
+        behind = ms - (time_ns() // 1000000 - EPOCH_MS) + 1
+
+        if behind > 0:
+            time.sleep(min(behind, self.maxDrift) / 1000)
+
+        if self._lease is not None:
+            self._lease.close()
+            self._lease = None
+
+    def __enter__(self) -> "OrderIdGenerator":
+
+        return self
+
+    def __exit__(self, *exc) -> None:
+
+        self.close()
+
+    # next order id as a string
+    def next(self) -> str:
+
+        return self._format(self.next_int())
+
+    # next order id as an integer
+    def next_int(self) -> int:
+
+        value = next(self._counter)
+        now = time_ns() // 1000000 - EPOCH_MS
+
+        if value >> SEQUENCE_BITS != now:
+            value = self._adjust(value, now)
+
+        return ((value >> SEQUENCE_BITS) << _TIME_SHIFT) | self._workerBits | (value & SEQUENCE_MASK)
+
+    # (unix time in seconds, worker id, sequence) of an id made by a generator with the same prefix and encoding
+    def parse(self, orderId: str) -> Tuple[float, int, int]:
+
+        digits = orderId[len(self.prefix):]
+        value = int(digits, {"decimal": 10, "hex": 16, "base36": 36}[self.encoding])
+
+        ms = value >> _TIME_SHIFT
+
+        return (ms + EPOCH_MS) / 1000, (value >> SEQUENCE_BITS) & MAX_WORKER_ID, value & SEQUENCE_MASK
+
+    # value of a counter that is behind or ahead of the clock
+    def _adjust(self, value: int, now: int) -> int:
+
+        ms = value >> SEQUENCE_BITS
+
+        if ms > now:
+            # more than 4096 ids per millisecond: let the clock catch up (bounded, a clock stepped back isn't waited for)
+            if ms - now > self.maxDrift:
+                time.sleep(min(ms - now - self.maxDrift, self.maxDrift) / 1000)
+
+            return value
+
+        # moves the counter to the clock, values threads still draw from the replaced counter
+        # stay below the new one, which starts a millisecond ahead
+        with self._lock:
+            value = next(self._counter)
+
+            if value >> SEQUENCE_BITS < now:
+                value = (now + 1) << SEQUENCE_BITS
+                self._counter = itertools.count(value + 1)
+
+            return value
+
+    # string of an id in the configured encoding
+    def _format(self, value: int) -> str:
+
+        if self.encoding == "decimal":
+            return f"{self.prefix}{value:019d}"
+
+        if self.encoding == "hex":
+            return f"{self.prefix}{value:016x}"
+
+        return self.prefix + _to_base36(value, self._width)
+
+    def _after_fork(self) -> None:
+
+        self._lock = threading.Lock()
+
+        if self._explicitWorker or isinstance(self._counter, _Stopped):
+            return
+
+        # the inherited lease stays with the parent, the child leases its own slot
+        self._lease.close()
+        self._lease = None
+
+        try:
+            self.workerId, self._lease = default_worker_id()
+        except Exception as e:
+            # the parent's worker id would repeat its ids, the child makes none
+            self._counter = _Stopped(f"No order id worker id in the forked process: {e}")
+            return
+
+        self._workerBits = self.workerId << SEQUENCE_BITS
+
+
+# counter of a generator that makes no more ids, raises instead
+class _Stopped:
+
+    def __init__(self, message: str) -> None:
+
+        self.message: str = message
+
+    def __next__(self) -> int:
+
+        raise RuntimeError(self.message)
+
+
+# generators of this process, they lease their own worker id in a forked child
+_generators: "weakref.WeakSet[OrderIdGenerator]" = weakref.WeakSet()
+
+
+def _after_fork_in_child() -> None:
+
+    for generator in list(_generators):
+        generator._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+# zero padded base36 digits of value
+def _to_base36(value: int, width: int) -> str:
+
+    digits = []
+
+    while value:
+        value, digit = divmod(value, 36)
+        digits.append(_BASE36[digit])
+
+    return "".join(reversed(digits)).rjust(width, "0")
@@ -1,10 +1,21 @@
-from typing import List, Type
+from typing import Callable, Iterable, List, Type
 
-from urllib.parse import parse_qsl
-import json
-import requests
+from yenepay.Models import IPN, PDT, Item, PDTResult
+from yenepay.Cache import PDTCache, TTLCache
+from yenepay.Cart import Cart
+from yenepay.Exceptions import CheckoutError, ValidationError
+from yenepay.Idempotency import MemoryIPNStore, ipn_key
+from yenepay.Metrics import Instrumentation
+from yenepay.Resilience import CallPolicy, Deadline
+from yenepay.Signature import SignatureVerifier
+from yenepay.Serializer import encode_checkout, encode_ipn, encode_pdt
+from yenepay.Totals import to_major, to_minor
+from yenepay.Transport import SANDBOX_HOST, Response, Transport, default_transport
+from yenepay.Validation import Violation, compile_rules
 
-from yenepay.Models import IPN, PDT, Item
+
+# headers sent with every request to yenepay
+JSON_HEADER: dict = {"Content-Type": "application/json"}
 
 
 class ProcessType:
@@ -23,7 +34,7 @@ class PaymentHandler:
     PDT_URL_PROD = "https://endpoints.yenepay.com/api/verify/pdt/"
     PDT_URL_SANDBOX = "https://testapi.yenepay.com/api/verify/pdt/"
 
-    def __init__(self, merchantId: str, useSandbox: bool = True) -> None:
+    def __init__(self, merchantId: str, useSandbox: bool = True, transport: Transport = None) -> None:
 
         # set True for testing (to use yenepay sandbox server) 
         # set False for production
@@ -38,8 +49,8 @@ class PaymentHandler:
         # Id that identifies the order on the merchant application 
         self.merchantOrderId: str = "0"
 
-        # List of items
-        self.items: List[Item] = []
+        # items of the order indexed by item id
+        self.items: Cart = Cart()
         
         # endpoint url on a merchant site used to send instant payment notifications (IPN)
         self.ipnUrl: str = None
@@ -59,20 +70,63 @@ class PaymentHandler:
         # Expiration period for this payment in days
         self.expiresInDays: int = None
 
-        # Total delivery fee for the order (if applicable)
-        self.totalItemsDeliveryFee: float = None
+        # Total delivery fee for the order in santim (if applicable), set in birr through totalItemsDeliveryFee
+        self._totalItemsDeliveryFee: int = None
 
-        # Total handling fee for the order (if applicable)
-        self.totalItemsHandlingFee: float = None
+        # Total handling fee for the order in santim (if applicable)
+        self._totalItemsHandlingFee: int = None
 
-        # Total discount amount for the order (if applicable)
-        self.totalItemsDiscount: float = None
+        # Total discount amount for the order in santim (if applicable)
+        self._totalItemsDiscount: int = None
         
-        # Total VAT amount. Set only for VAT registered merchants
-        self.totalItemsTax1: float = None
+        # Total VAT amount in santim. Set only for VAT registered merchants
+        # when left unset it is computed from the VAT rates of the items
+        self._totalItemsTax1: int = None
+
+        # Total TOT amount in santim. Set only for TOT registered merchants
+        # when left unset it is computed from the TOT rates of the items
+        self._totalItemsTax2: int = None
+
+        # VAT rate (e.g. 0.15) applied to items added without their own rate
+        self.vatRate: float = None
+
+        # TOT rate (e.g. 0.02) applied to items added without their own rate
+        self.totRate: float = None
+
+        # http transport used to reach yenepay, defaults to the shared connection pool
+        self.transport: Transport = transport if transport is not None else default_transport()
+
+        # optional cache of generated checkout urls, shared between handlers of the same merchant
+        self.checkoutCache: TTLCache = None
+
+        # optional cache of pdt results, shared between handlers of the same merchant
+        self.pdtCache: PDTCache = None
+
+        # optional store of verified ipns, so retried deliveries are not verified again
+        # (MemoryIPNStore or SQLiteIPNStore)
+        self.ipnStore: MemoryIPNStore = None
+
+        # optional local check of ipn signatures against yenepay's public key
+        # yenepay is only asked when the signature doesn't match and the verifier allows a remote fallback
+        self.signatureVerifier: SignatureVerifier = None
+
+        # optional retry, hedging and circuit breaker policy for calls to yenepay
+        # without one every call is made once and only the deadline (if given) is enforced
+        self.callPolicy: CallPolicy = None
+
+        # optional pre-encoded checkout request body (e.g. from a Catalog template)
+        # sent instead of encoding the handler's fields when set
+        self.payload: bytes = None
+
+        # local checks run before a checkout url is requested (see yenepay.Validation), None to skip them
+        self.validator: Callable[["PaymentHandler"], List[Violation]] = compile_rules()
+
+        # optional pre/post call hooks, e.g. reporting to PrometheusMetrics
+        # without one calls are not timed at all
+        self.instrumentation: Instrumentation = None
 
-        # Total TOT amount. Set only for TOT registered merchants
-        self.totalItemsTax2: float = None
+        # base url sandbox requests are sent to, e.g. a local stand-in server for load tests
+        self.sandboxHost: str = SANDBOX_HOST
     
     @property
     def use_sandbox(self) -> bool:
@@ -93,7 +147,67 @@ class PaymentHandler:
     def merchant_id(self, id_: str) -> None:
 
         self.merchantId = id_
+
+    @property
+    def http_transport(self) -> Transport:
+
+        return self.transport
+
+    @http_transport.setter
+    def http_transport(self, transport: Transport) -> None:
+
+        self.transport = transport
     
+    @property
+    def checkout_cache(self) -> TTLCache:
+
+        return self.checkoutCache
+
+    @checkout_cache.setter
+    def checkout_cache(self, cache: TTLCache) -> None:
+
+        self.checkoutCache = cache
+
+    @property
+    def pdt_cache(self) -> PDTCache:
+
+        return self.pdtCache
+
+    @pdt_cache.setter
+    def pdt_cache(self, cache: PDTCache) -> None:
+
+        self.pdtCache = cache
+
+    @property
+    def ipn_store(self) -> MemoryIPNStore:
+
+        return self.ipnStore
+
+    @ipn_store.setter
+    def ipn_store(self, store: MemoryIPNStore) -> None:
+
+        self.ipnStore = store
+
+    @property
+    def signature_verifier(self) -> SignatureVerifier:
+
+        return self.signatureVerifier
+
+    @signature_verifier.setter
+    def signature_verifier(self, verifier: SignatureVerifier) -> None:
+
+        self.signatureVerifier = verifier
+
+    @property
+    def call_policy(self) -> CallPolicy:
+
+        return self.callPolicy
+
+    @call_policy.setter
+    def call_policy(self, policy: CallPolicy) -> None:
+
+        self.callPolicy = policy
+
     @property
     def checkout_process(self) -> str:
 
@@ -178,6 +292,61 @@ class PaymentHandler:
 
         self.expiresInDays = day
     
+    # Total delivery fee for the order in birr, None if not set
+    @property
+    def totalItemsDeliveryFee(self) -> float:
+
+        return _major(self._totalItemsDeliveryFee)
+
+    @totalItemsDeliveryFee.setter
+    def totalItemsDeliveryFee(self, amount: float) -> None:
+
+        self._totalItemsDeliveryFee = _minor(amount)
+
+    # Total handling fee for the order in birr, None if not set
+    @property
+    def totalItemsHandlingFee(self) -> float:
+
+        return _major(self._totalItemsHandlingFee)
+
+    @totalItemsHandlingFee.setter
+    def totalItemsHandlingFee(self, amount: float) -> None:
+
+        self._totalItemsHandlingFee = _minor(amount)
+
+    # Total discount amount for the order in birr, None if not set
+    @property
+    def totalItemsDiscount(self) -> float:
+
+        return _major(self._totalItemsDiscount)
+
+    @totalItemsDiscount.setter
+    def totalItemsDiscount(self, amount: float) -> None:
+
+        self._totalItemsDiscount = _minor(amount)
+
+    # Total VAT amount for the order in birr, None if not set
+    @property
+    def totalItemsTax1(self) -> float:
+
+        return _major(self._totalItemsTax1)
+
+    @totalItemsTax1.setter
+    def totalItemsTax1(self, amount: float) -> None:
+
+        self._totalItemsTax1 = _minor(amount)
+
+    # Total TOT amount for the order in birr, None if not set
+    @property
+    def totalItemsTax2(self) -> float:
+
+        return _major(self._totalItemsTax2)
+
+    @totalItemsTax2.setter
+    def totalItemsTax2(self, amount: float) -> None:
+
+        self._totalItemsTax2 = _minor(amount)
+
     @property
     def total_delivery_fee(self) -> float:
 
@@ -220,6 +389,9 @@ class PaymentHandler:
     @property
     def total_vat(self) -> float:
 
+        if self._totalItemsTax1 is None and self.items.tax1:
+            return to_major(self.items.tax1)
+
         return self.totalItemsTax1
     
     @total_vat.setter
@@ -233,7 +405,10 @@ class PaymentHandler:
     @property
     def total_tot(self) -> float:
 
-        return self.totalItemsTax1
+        if self._totalItemsTax2 is None and self.items.tax2:
+            return to_major(self.items.tax2)
+
+        return self.totalItemsTax2
     
     @total_tot.setter
     def total_tot(self, tot: float) -> None:
@@ -243,118 +418,338 @@ class PaymentHandler:
 
         self.totalItemsTax2 = tot
     
+    @property
+    def vat_rate(self) -> float:
+
+        return self.vatRate
+
+    @vat_rate.setter
+    def vat_rate(self, rate: float) -> None:
+
+        if rate is not None and rate < 0:
+            raise ValueError(f"Invalid Rate: got negative rate {rate}")
+
+        self.vatRate = rate
+
+    @property
+    def tot_rate(self) -> float:
+
+        return self.totRate
+
+    @tot_rate.setter
+    def tot_rate(self, rate: float) -> None:
+
+        if rate is not None and rate < 0:
+            raise ValueError(f"Invalid Rate: got negative rate {rate}")
+
+        self.totRate = rate
+
+    # sum of unit price * quantity of all items
+    @property
+    def subtotal(self) -> float:
+
+        return to_major(self.items.subtotal)
+
+    # amount the customer pays: subtotal plus taxes and fees minus discount
+    @property
+    def total(self) -> float:
+
+        total = self.items.subtotal
+
+        for amount in (self._totalItemsDeliveryFee, self._totalItemsHandlingFee):
+            if amount is not None:
+                total += amount
+
+        total += self._totalItemsTax1 if self._totalItemsTax1 is not None else self.items.tax1
+        total += self._totalItemsTax2 if self._totalItemsTax2 is not None else self.items.tax2
+
+        if self._totalItemsDiscount is not None:
+            total -= self._totalItemsDiscount
+
+        return to_major(total)
+    
     # adds item to items list
     # if item with the same id is found in items list its quantity will be set appropirately
-    def add_item(self, item: Item) -> None:
+    # vat_rate and tot_rate override the handler's default rates for this item
+    # more than one item in Express mode is reported by validate()
+    def add_item(self, item: Item, vat_rate: float = None, tot_rate: float = None) -> None:
 
-        # a safeguard to prevent adding morethan one item in express mode
-        if self.process == ProcessType.Express:
-            if self.__len__() == 1 and self.items[0]["itemId"] != item.item_id:
-                raise Exception("Can't add morethan one item in Express mode, use Cart mode instead")
+        if vat_rate is None:
+            vat_rate = self.vatRate
 
-        item = item.as_dict()
+        if tot_rate is None:
+            tot_rate = self.totRate
 
-        for i in self.items:
-            if i["itemId"] == item["itemId"]:
-                i["quantity"] += item["quantity"]
-                break
-        
-        else:
-            self.items.append(item)
+        self.items.add(item, vat_rate, tot_rate)
+
+    # adds every item of an iterable
+    def add_items(self, items: Iterable[Item], vat_rate: float = None, tot_rate: float = None) -> None:
+
+        for item in items:
+            self.add_item(item, vat_rate, tot_rate)
+
+    # sets quantity of an item already added, a quantity of 0 removes it
+    def set_quantity(self, id_: str, quantity: int) -> None:
+
+        self.items.set_quantity(id_, quantity)
 
     # removes item from items list by id (if found)
     def remove_item(self, id_: str) -> None:
-        
-        i = 0
-        while (i < len(self.items)):
-            if self.items[i]["itemId"] == id_:
-                del self.items[i]
-                break
-            
-            i += 1
+
+        self.items.remove(id_)
 
     # resets checkout values to begin new checkout
     def clear(self) -> None:
         self.process: str = ProcessType.Cart
         self.merchantOrderId: str = "0"
-        self.items: List[Item] = []
+        self.items: Cart = Cart()
         self.expiresAfter: int = None
         self.expiresInDays: int = None
-        self.totalItemsDeliveryFee: float = None
-        self.totalItemsHandlingFee: float = None
-        self.totalItemsDiscount: float = None
-        self.totalItemsTax1: float = None
-        self.totalItemsTax2: float = None
+        self._totalItemsDeliveryFee: int = None
+        self._totalItemsHandlingFee: int = None
+        self._totalItemsDiscount: int = None
+        self._totalItemsTax1: int = None
+        self._totalItemsTax2: int = None
+        self.payload: bytes = None
 
     # returns dictionary representation of checkout with keys yenepay expects
+    # unset (None) parameters are left out
     def as_dict(self) -> dict:
-        
-        # yenepay checkout parameters
-        checkout_params = ['merchantId', 'process', 'merchantOrderId', 'items', 'ipnUrl', 'successUrl', 'cancelUrl', 'failureUrl', 'expiresAfter', 'totalItemsDeliveryFee', 'totalItemsHandlingFee', 'totalItemsDiscount', 'totalItemsTax1', 'totalItemsTax2']
-        
-        d = {}
 
-        for k, v in self.__dict__.items():
-            if v != None and k in checkout_params:
-                d[k] = v
+        # yenepay checkout parameters, amounts are stored in santim and sent in birr
+        d = {
+            'merchantId': self.merchantId,
+            'process': self.process,
+            'merchantOrderId': self.merchantOrderId,
+            'items': self.items.as_list(),
+            'ipnUrl': self.ipnUrl,
+            'successUrl': self.successUrl,
+            'cancelUrl': self.cancelUrl,
+            'failureUrl': self.failureUrl,
+            'expiresAfter': self.expiresAfter,
+            'totalItemsDeliveryFee': self.total_delivery_fee,
+            'totalItemsHandlingFee': self.total_handling_fee,
+            'totalItemsDiscount': self.total_discount,
+            'totalItemsTax1': self.total_vat,
+            'totalItemsTax2': self.total_tot,
+        }
+
+        return {k: v for k, v in d.items() if v is not None}
+    
+    # every problem the validator finds in the checkout, an empty list if it can be sent
+    def validate(self) -> List[Violation]:
+
+        if self.validator is None:
+            return []
+
+        return self.validator(self)
+
+    # returns the sandbox or production variant of an endpoint
+    def _endpoint(self, prod: str, sandbox: str) -> str:
+
+        if self.use_sandbox:
+            if self.sandboxHost != SANDBOX_HOST:
+                return self.sandboxHost + sandbox[len(SANDBOX_HOST):]
+
+            return sandbox
+
+        return prod
+
+    # posts encoded json payload to yenepay endpoint through the handler's transport
+    # safe calls (that can be repeated without side effects) may be retried and hedged by the call policy
+    def _post(self, url: str, query: bytes, safe: bool = False, deadline: Deadline = None) -> Response:
+
+        # taken here, hedged requests are sent from other threads
+        record = Instrumentation.current() if self.instrumentation is not None else None
+
+        def send(timeout: float) -> Response:
+            if timeout is None:
+                response = self.transport.post(url, query, JSON_HEADER)
+            else:
+                response = self.transport.post(url, query, JSON_HEADER, timeout)
+
+            if record is not None:
+                record.received(response)
+
+            return response
+
+        if self.callPolicy is None:
+            return send(deadline.remaining() if deadline is not None else None)
+
+        return self.callPolicy.call(url, send, safe, deadline)
+
+    # checkout url from a checkout url generation response
+    @staticmethod
+    def _checkout_result(response: Response) -> str:
+
+        if response.status_code != 200:
+            raise CheckoutError(response.status_code, response.content)
+
+        try:
+            return response.json()['result']
+        except (ValueError, KeyError, TypeError):
+            raise CheckoutError(response.status_code, response.content) from None
+
+    # ipn verification outcome from a verify response
+    @staticmethod
+    def _ipn_result(response: Response) -> bool:
+
+        if response.status_code == 200:
+            return True
+
+        return False
+
+    # parsed pdt result from a pdt response
+    @staticmethod
+    def _pdt_result(response: Response) -> PDTResult:
+
+        if response.status_code == 200:
+            return PDTResult.from_query(response.json())
+
+        return None
+
+    # raises ValidationError if the checkout is invalid
+    # a pre-encoded payload was validated when it was built
+    def _check(self) -> None:
+
+        if self.payload is not None:
+            return
+
+        violations = self.validate()
+
+        if violations:
+            raise ValidationError(violations)
+
+    # seconds a generated checkout url may be reused: the cache ttl, capped by the order expiry
+    def _checkout_ttl(self, cache: TTLCache) -> float:
+
+        ttls = [cache.ttl]
+
+        if self.expiresAfter is not None:
+            ttls.append(self.expiresAfter * 60)
+
+        if self.expiresInDays is not None:
+            ttls.append(self.expiresInDays * 86400)
+
+        ttls = [t for t in ttls if t is not None]
+
+        return min(ttls) if ttls else None
+
+    # cache key of a checkout: hash of the endpoint and the canonical payload
+    @staticmethod
+    def _checkout_key(url: str, query: bytes) -> bytes:
+
+        import hashlib
+
+        return hashlib.sha256(url.encode("utf-8") + b"\n" + query).digest()
 
-        return d
-    
     # returns checkout url retruned from yenepay api endpoint
     # redirect cliend to this url to complete payment
-    def get_checkout_url(self) -> str:
-         
-        query: json = json.dumps(self.as_dict())
+    # with a checkout cache identical checkouts reuse the url generated first
+    # deadline is the number of seconds (or a Deadline) the call may take
+    # raises ValidationError (listing every violation) without calling yenepay if the checkout is invalid
+    # raises CheckoutError if yenepay doesn't return a url
+    def get_checkout_url(self, deadline: float = None) -> str:
 
-        header: dict = {"Content-Type": "application/json"}
+        if self.instrumentation is None:
+            return self._get_checkout_url(deadline)
 
-        if self.use_sandbox:
-            url = self.CHECKOUT_BASE_URL_SANDBOX
-        else:
-            url =  self.CHECKOUT_BASE_URL_PROD
+        url = self._endpoint(self.CHECKOUT_BASE_URL_PROD, self.CHECKOUT_BASE_URL_SANDBOX)
+
+        return self.instrumentation.run("checkout", url, lambda: self._get_checkout_url(deadline), _checkout_outcome)
+
+    def _get_checkout_url(self, deadline: float) -> str:
+
+        self._check()
+
+        url = self._endpoint(self.CHECKOUT_BASE_URL_PROD, self.CHECKOUT_BASE_URL_SANDBOX)
+
+        query = self.payload if self.payload is not None else encode_checkout(self)
+
+        deadline = Deadline.of(deadline)
+
+        def generate() -> str:
+            return self._checkout_result(self._post(url, query, deadline=deadline))
 
-        response = requests.post(url, data = query, headers = header)
+        cache = self.checkoutCache
 
-        return response.json()['result']
+        if cache is None:
+            return generate()
+
+        return cache.get_or_load(self._checkout_key(url, query), generate, self._checkout_ttl(cache))
     
     # check if IPN model is authentic
-    def is_ipn_authentic(self, ipn: IPN) -> bool:
-        
-        query: json = json.dumps(ipn.as_dict())
+    # with a signature verifier the signature is checked locally first
+    # with an ipn store an already verified ipn is answered without calling yenepay
+    # deadline is the number of seconds (or a Deadline) the call may take
+    def is_ipn_authentic(self, ipn: IPN, deadline: float = None) -> bool:
 
-        header: dict = {"Content-Type": "application/json"}
+        if self.instrumentation is None:
+            return self._is_ipn_authentic(ipn, deadline)
 
-        if self.use_sandbox:
-            url = self.IPN_VERIFY_URL_SANDBOX
-        else:
-            url =  self.IPN_VERIFY_URL_PROD
-        
-        response = requests.post(url, data = query, headers = header)
+        url = self._endpoint(self.IPN_VERIFY_URL_PROD, self.IPN_VERIFY_URL_SANDBOX)
 
-        if response.status_code == 200:
-            return True
-        
-        return False
+        return self.instrumentation.run("ipn", url, lambda: self._is_ipn_authentic(ipn, deadline), _ipn_outcome)
+
+    def _is_ipn_authentic(self, ipn: IPN, deadline: float) -> bool:
+
+        url = self._endpoint(self.IPN_VERIFY_URL_PROD, self.IPN_VERIFY_URL_SANDBOX)
+
+        deadline = Deadline.of(deadline)
+
+        def verify() -> bool:
+            verifier = self.signatureVerifier
+
+            if verifier is not None:
+                if verifier.verify(ipn):
+                    return True
+
+                if not verifier.remoteFallback:
+                    return False
+
+            return self._ipn_result(self._post(url, encode_ipn(ipn), True, deadline))
+
+        if self.ipnStore is None:
+            return verify()
+
+        return self.ipnStore.verify(ipn_key(ipn), verify)
     
     # request PDT 
-    # returns yenepay response
-    def request_pdt(self, pdt: PDT):
+    # returns yenepay response, None if the request failed
+    # with a pdt cache repeated requests for the same order are answered locally
+    # deadline is the number of seconds (or a Deadline) the call may take
+    def request_pdt(self, pdt: PDT, deadline: float = None) -> PDTResult:
 
-        query: json = json.dumps(pdt.as_dict())        
+        if self.instrumentation is None:
+            return self._request_pdt(pdt, deadline)
 
-        header: dict = {"Content-Type": "application/json"}
+        url = self._endpoint(self.PDT_URL_PROD, self.PDT_URL_SANDBOX)
 
-        if self.use_sandbox:
-            url = self.PDT_URL_SANDBOX
-        else:
-            url =  self.PDT_URL_PROD
+        return self.instrumentation.run("pdt", url, lambda: self._request_pdt(pdt, deadline), _pdt_outcome)
+
+    def _request_pdt(self, pdt: PDT, deadline: float) -> PDTResult:
+
+        url = self._endpoint(self.PDT_URL_PROD, self.PDT_URL_SANDBOX)
+
+        deadline = Deadline.of(deadline)
+
+        cache = self.pdtCache
+
+        if cache is not None:
+            key = cache.key(url, pdt)
+            result = cache.get(key)
+
+            if result is not None:
+                return result
         
-        response = requests.post(url, data = query, headers = header)
+        response = self._post(url, encode_pdt(pdt), True, deadline)
 
-        if response.status_code == 200:
-            return dict(parse_qsl(response.json()))
+        result = self._pdt_result(response)
 
-        return None
+        if cache is not None and result is not None:
+            cache.set(key, result)
+
+        return result
     
     # returns number of items 
     def __len__(self) -> int:
@@ -369,6 +764,42 @@ class PaymentHandler:
             s += f"{k} : {v}\n"
         
         return s
-    
 
-        
+
+# birr amount of an optional santim amount
+def _major(minor: int):
+
+    if minor is None:
+        return None
+
+    return to_major(minor)
+
+
+# santim amount of an optional birr amount
+def _minor(amount: float) -> int:
+
+    if amount is None:
+        return None
+
+    return to_minor(amount)
+
+
+# instrumentation result of a checkout url
+def _checkout_outcome(url: str) -> str:
+
+    return "ok"
+
+
+# instrumentation result of an ipn verification
+def _ipn_outcome(authentic: bool) -> str:
+
+    return "valid" if authentic else "invalid"
+
+
+# instrumentation result of a pdt request: the payment status, or failed
+def _pdt_outcome(result: PDTResult) -> str:
+
+    if result is None or not result.is_success:
+        return "failed"
+
+    return result.status
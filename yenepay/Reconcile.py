@@ -0,0 +1,238 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+from yenepay.Bulk import BulkStats, imap_bounded
+from yenepay.Exceptions import YenePayError
+from yenepay.Models import PDT
+from yenepay.PaymentHandler import PaymentHandler
+
+
+# streams (merchantOrderId, transactionId) pairs from a csv file with those two columns
+def read_pending_csv(path: str) -> Iterator[Tuple[str, str]]:
+
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) >= 2 and row[0] != "merchantOrderId":
+                yield row[0], row[1]
+
+
+# appends status rows (merchantOrderId, transactionId, status, error) to a csv file
+class CsvSink:
+
+    def __init__(self, path: str) -> None:
+
+        # path of the output file
+        self.path: str = path
+
+    def __call__(self, rows: List[Tuple[str, str, str, str]]) -> None:
+
+        with open(self.path, "a", newline="") as f:
+            csv.writer(f).writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+# value at fraction q of sorted values
+def _percentile(values: List[float], q: float) -> float:
+
+    if not values:
+        return 0.0
+
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+# resolves pending orders by requesting their PDT
+# pairs are processed with bounded parallelism and rate, results are written in batches,
+# and a checkpoint of the input position lets an interrupted run resume
+# the checkpoint only moves past pairs yenepay answered: failed requests (transport errors, open circuit,
+# deadline, a response that isn't a pdt answer such as a 5xx) are appended to retryFile to be run again, without one the checkpoint stops at the first of them
+class Reconciler:
+
+    def __init__(self, handler: PaymentHandler, pdtToken: str, workers: int = 8, rate: float = None,
+                 batchSize: int = 500, checkpoint: str = None, deadline: float = 10.0, retryFile: str = None) -> None:
+
+        # handler the pdt requests are made with
+        self.handler: PaymentHandler = handler
+
+        # merchant pdt token
+        self.pdtToken: str = pdtToken
+
+        # maximum concurrent pdt requests
+        self.workers: int = workers
+
+        # maximum pdt requests per second, None for no limit
+        self.rate: float = rate
+
+        # results written at once
+        self.batchSize: int = batchSize
+
+        # json file recording how much of the input has been written, None to disable
+        self.checkpoint: str = checkpoint
+
+        # seconds each pdt request may take
+        self.deadline: float = deadline
+
+        # csv file pairs whose pdt request failed are appended to (same format as the input), None to disable
+        self.retryFile: str = retryFile
+
+        # counters of the last run
+        self.stats: BulkStats = BulkStats()
+
+        # seconds every pdt request of the last run took
+        self.latencies: List[float] = []
+
+    # number of input pairs already handled by a previous run
+    def load_checkpoint(self) -> int:
+
+        if self.checkpoint is None or not os.path.exists(self.checkpoint):
+            return 0
+
+        with open(self.checkpoint) as f:
+            return json.load(f)["position"]
+
+    def _save_checkpoint(self, position: int) -> None:
+
+        if self.checkpoint is None:
+            return
+
+        tmp = self.checkpoint + ".tmp"
+
+        with open(tmp, "w") as f:
+            json.dump({"position": position}, f)
+
+        os.replace(tmp, self.checkpoint)
+
+    # pdt status of one pair (None if yenepay answered FAIL), timed
+    # raises YenePayError if yenepay didn't answer, so the pair is run again
+    def _check(self, pair: Tuple[str, str]) -> Tuple[str, float]:
+
+        pdt = PDT(self.pdtToken)
+        pdt.merchant_order_id, pdt.transaction_id = pair
+
+        start = time.monotonic()
+        result = self.handler.request_pdt(pdt, self.deadline)
+        elapsed = time.monotonic() - start
+
+        if result is None:
+            raise YenePayError(f"No pdt answer for order {pair[0]}")
+
+        if not result.is_success:
+            return None, elapsed
+
+        return result.status, elapsed
+
+    # reconciles pairs, passing batches of (merchantOrderId, transactionId, status, error) rows to write
+    # at-least-once: pairs finished after the last checkpoint are queried (and written) again on resume
+    def run(self, pairs: Iterable[Tuple[str, str]], write: Callable[[List[tuple]], None]) -> BulkStats:
+
+        self.stats = BulkStats()
+        self.latencies = []
+
+        start = self.load_checkpoint()
+        pairs = itertools.islice(pairs, start, None)
+
+        retry = CsvSink(self.retryFile) if self.retryFile is not None else None
+
+        batch = []
+        failed = []
+        done = set()
+        position = start
+
+        for result in imap_bounded(self._check, pairs, self.workers, self.rate, self.stats):
+            order, txn = result.item
+
+            if result.error is not None:
+                batch.append((order, txn, "", repr(result.error)))
+
+                # no answer from yenepay, the pair is handled only once it is in the retry file
+                if retry is None:
+                    continue
+
+                failed.append((order, txn))
+            else:
+                status, elapsed = result.value
+                self.latencies.append(elapsed)
+                batch.append((order, txn, status or "", "" if status else "pdt request failed"))
+
+            # the checkpoint only moves past pairs whose results (and all before them) are written
+            done.add(start + result.index)
+
+            if len(batch) >= self.batchSize:
+                self._flush(write, batch, retry, failed)
+                batch, failed = [], []
+                position = self._advance(position, done)
+
+        self._flush(write, batch, retry, failed)
+        self._advance(position, done)
+
+        return self.stats
+
+    # writes a batch of status rows and the failed pairs to retry
+    @staticmethod
+    def _flush(write: Callable[[List[tuple]], None], batch: list, retry: CsvSink, failed: list) -> None:
+
+        if batch:
+            write(batch)
+
+        if failed:
+            retry(failed)
+
+    # moves the checkpoint to the first unfinished position
+    def _advance(self, position: int, done: set) -> int:
+
+        while position in done:
+            done.discard(position)
+            position += 1
+
+        self._save_checkpoint(position)
+
+        return position
+
+    # throughput and latency summary of the last run
+    def summary(self) -> str:
+
+        latencies = sorted(self.latencies)
+        stats = self.stats
+
+        return (
+            f"{stats.completed} pairs in {stats.elapsed:.2f}s ({stats.throughput:.1f}/s), {stats.failed} failed\n"
+            f"pdt latency p50 {_percentile(latencies, 0.50) * 1000:.1f} ms, "
+            f"p95 {_percentile(latencies, 0.95) * 1000:.1f} ms, "
+            f"p99 {_percentile(latencies, 0.99) * 1000:.1f} ms"
+        )
+
+
+def main(argv: List[str] = None) -> None:
+
+    parser = argparse.ArgumentParser(description="Request PDT for pending orders and record their status")
+    parser.add_argument("pending", help="csv file of merchantOrderId,transactionId pairs")
+    parser.add_argument("--out", required=True, help="csv file status rows are appended to")
+    parser.add_argument("--checkpoint", help="checkpoint file to resume from")
+    parser.add_argument("--retry", help="csv file pairs whose pdt request failed are appended to, to be run again")
+    parser.add_argument("--merchant", required=True, help="merchant code")
+    parser.add_argument("--token", required=True, help="pdt token")
+    parser.add_argument("--production", action="store_true", help="use the production server instead of the sandbox")
+    parser.add_argument("--endpoint", help="pdt endpoint url, e.g. of a local stub")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, help="maximum requests per second")
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    handler = PaymentHandler(args.merchant, useSandbox=not args.production)
+
+    if args.endpoint:
+        handler.PDT_URL_SANDBOX = handler.PDT_URL_PROD = args.endpoint
+
+    reconciler = Reconciler(handler, args.token, args.workers, args.rate, args.batch, args.checkpoint, retryFile=args.retry)
+    reconciler.run(read_pending_csv(args.pending), CsvSink(args.out))
+
+    print(reconciler.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,394 @@
+import random
+import threading
+import time
+from typing import Callable, Dict, Union
+
+from yenepay.Exceptions import CircuitOpenError, DeadlineExceeded, QuotaExceeded, ServerError, TransportError
+from yenepay.Transport import Response
+
+
+# point in time a call has to complete by
+class Deadline:
+
+    __slots__ = ("expires",)
+
+    def __init__(self, seconds: float) -> None:
+
+        # monotonic time the deadline passes
+        self.expires: float = time.monotonic() + seconds
+
+    # seconds left, raises DeadlineExceeded if none
+    def remaining(self) -> float:
+
+        left = self.expires - time.monotonic()
+
+        if left <= 0:
+            raise DeadlineExceeded("Deadline exceeded")
+
+        return left
+
+    # deadline from seconds, an existing Deadline or None (no deadline)
+    @staticmethod
+    def of(deadline: Union[float, "Deadline", None]) -> "Deadline":
+
+        if deadline is None or isinstance(deadline, Deadline):
+            return deadline
+
+        return Deadline(deadline)
+
+
+# per endpoint circuit breaker
+# after failureThreshold consecutive failures calls are rejected for resetTimeout seconds,
+# then a single probe call decides whether the endpoint is healthy again
+class CircuitBreaker:
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, endpoint: str, failureThreshold: int = 5, resetTimeout: float = 30.0) -> None:
+
+        # endpoint this breaker protects
+        self.endpoint: str = endpoint
+
+        # consecutive failures that open the circuit
+        self.failureThreshold: int = failureThreshold
+
+        # seconds the circuit stays open before a probe is allowed
+        self.resetTimeout: float = resetTimeout
+
+        self.state: str = self.CLOSED
+        self.failures: int = 0
+        self.openedAt: float = 0.0
+
+        self._lock = threading.Lock()
+
+    # raises CircuitOpenError if a call may not be made now
+    def before(self) -> None:
+
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+
+            retryAfter = self.openedAt + self.resetTimeout - time.monotonic()
+
+            if self.state == self.OPEN and retryAfter <= 0:
+                # let one probe through
+                self.state = self.HALF_OPEN
+                return
+
+            raise CircuitOpenError(self.endpoint, max(retryAfter, 0.0))
+
+    def success(self) -> None:
+
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def failure(self) -> None:
+
+        with self._lock:
+            self.failures += 1
+
+            if self.state == self.HALF_OPEN or self.failures >= self.failureThreshold:
+                self.state = self.OPEN
+                self.openedAt = time.monotonic()
+
+    # a call let through ended without telling whether the endpoint is healthy (e.g. it was cancelled)
+    # a probe gives its turn back, so the next call probes again
+    def abandon(self) -> None:
+
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self.openedAt = time.monotonic() - self.resetTimeout
+
+
+# retry, hedging and circuit breaking of yenepay calls, shared by handlers of a merchant
+# only safe (idempotent) calls, pdt and ipn verification, are retried and hedged
+class CallPolicy:
+
+    def __init__(self, maxAttempts: int = 3, backoff: float = 0.1, maxBackoff: float = 2.0, hedgeDelay: float = None,
+                 failureThreshold: int = 5, resetTimeout: float = 30.0, hedgeWorkers: int = 16) -> None:
+
+        # attempts of a safe call, including the first
+        self.maxAttempts: int = maxAttempts
+
+        # seconds before the first retry, doubled on every attempt, with full jitter
+        self.backoff: float = backoff
+
+        # upper bound of the retry delay
+        self.maxBackoff: float = maxBackoff
+
+        # seconds after which a slow safe call is duplicated and the first response wins, None disables hedging
+        self.hedgeDelay: float = hedgeDelay
+
+        # consecutive failures that open an endpoint's circuit
+        self.failureThreshold: int = failureThreshold
+
+        # seconds an open circuit rejects calls
+        self.resetTimeout: float = resetTimeout
+
+        # threads running hedged requests
+        self.hedgeWorkers: int = hedgeWorkers
+
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._executor: "ThreadPoolExecutor" = None
+        self._lock = threading.Lock()
+
+    # circuit breaker of an endpoint
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+
+        breaker = self._breakers.get(endpoint)
+
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(
+                    endpoint, CircuitBreaker(endpoint, self.failureThreshold, self.resetTimeout)
+                )
+
+        return breaker
+
+    # jittered delay before retry number attempt (1 based)
+    def delay(self, attempt: int) -> float:
+
+        return random.uniform(0, min(self.maxBackoff, self.backoff * 2 ** (attempt - 1)))
+
+    # calls send(timeout) under the policy
+    # server errors and transport errors count as failures and are retried, other responses are returned
+    # a call past its deadline counts as a failure, any other error leaves the breaker as it was
+    # QuotaExceeded (a merchant's own concurrency quota, nothing was sent) is neither retried nor counted,
+    # breakers are shared by every merchant calling the endpoint
+    def call(self, endpoint: str, send: Callable[[float], Response], safe: bool = False, deadline: Deadline = None) -> Response:
+
+        breaker = self.breaker(endpoint)
+        attempts = self.maxAttempts if safe else 1
+        attempt = 0
+
+        while True:
+            attempt += 1
+            timeout = deadline.remaining() if deadline is not None else None
+
+            breaker.before()
+
+            try:
+                if safe and self.hedgeDelay is not None:
+                    response = self._hedged(send, timeout)
+                else:
+                    response = send(timeout)
+
+                if response.status_code >= 500:
+                    raise ServerError(response.status_code, response.content)
+            except QuotaExceeded:
+                breaker.abandon()
+                raise
+            except (TransportError, ServerError) as e:
+                breaker.failure()
+
+                if attempt >= attempts:
+                    raise
+
+                pause = self.delay(attempt)
+
+                if deadline is not None and pause >= deadline.remaining():
+                    raise DeadlineExceeded("Deadline exceeded") from e
+
+                time.sleep(pause)
+                continue
+            except DeadlineExceeded:
+                breaker.failure()
+                raise
+            except BaseException:
+                breaker.abandon()
+                raise
+
+            breaker.success()
+            return response
+
+    # awaits send(timeout) under the policy, the asyncio counterpart of call
+    async def call_async(self, endpoint: str, send, safe: bool = False, deadline: Deadline = None) -> Response:
+
+        import asyncio
+
+        breaker = self.breaker(endpoint)
+        attempts = self.maxAttempts if safe else 1
+        attempt = 0
+
+        while True:
+            attempt += 1
+            timeout = deadline.remaining() if deadline is not None else None
+
+            breaker.before()
+
+            try:
+                if safe and self.hedgeDelay is not None:
+                    response = await self._hedged_async(send, timeout)
+                else:
+                    response = await wait_for(send(timeout), timeout)
+
+                if response.status_code >= 500:
+                    raise ServerError(response.status_code, response.content)
+            except QuotaExceeded:
+                breaker.abandon()
+                raise
+            except (TransportError, ServerError) as e:
+                breaker.failure()
+
+                if attempt >= attempts:
+                    raise
+
+                pause = self.delay(attempt)
+
+                if deadline is not None and pause >= deadline.remaining():
+                    raise DeadlineExceeded("Deadline exceeded") from e
+
+                await asyncio.sleep(pause)
+                continue
+            except DeadlineExceeded:
+                breaker.failure()
+                raise
+            except BaseException:
+                breaker.abandon()
+                raise
+
+            breaker.success()
+            return response
+
+    # runs send, and a second copy if the first is slower than hedgeDelay
+    # returns the first successful response, a server error (5xx) only if no copy succeeds
+    def _hedged(self, send: Callable[[float], Response], timeout: float) -> Response:
+
+        from concurrent.futures import FIRST_COMPLETED, wait
+
+        executor = self._hedge_executor()
+        futures = {executor.submit(send, timeout)}
+
+        done, pending = wait(futures, timeout=self.hedgeDelay)
+
+        if not done:
+            futures.add(executor.submit(send, timeout))
+
+        error = None
+        failed = None
+
+        while futures:
+            done, futures = wait(futures, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                raise DeadlineExceeded("Deadline exceeded")
+
+            for future in done:
+                try:
+                    response = future.result()
+                except TransportError as e:
+                    error = e
+                    continue
+
+                if response.status_code < 500:
+                    return response
+
+                failed = response
+
+        if failed is not None:
+            return failed
+
+        raise error
+
+    async def _hedged_async(self, send, timeout: float) -> Response:
+
+        import asyncio
+
+        tasks = {asyncio.ensure_future(send(timeout))}
+
+        done, _ = await asyncio.wait(tasks, timeout=self.hedgeDelay)
+
+        if not done:
+            tasks.add(asyncio.ensure_future(send(timeout)))
+
+        error = None
+        failed = None
+
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    raise DeadlineExceeded("Deadline exceeded")
+
+                for task in done:
+                    try:
+                        response = task.result()
+                    except TransportError as e:
+                        error = e
+                        continue
+
+                    if response.status_code < 500:
+                        return response
+
+                    failed = response
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if failed is not None:
+            return failed
+
+        raise error
+
+    def _hedge_executor(self) -> "ThreadPoolExecutor":
+
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    from concurrent.futures import ThreadPoolExecutor
+
+                    self._executor = ThreadPoolExecutor(self.hedgeWorkers, thread_name_prefix="yenepay-hedge")
+
+        return self._executor
+
+
+# awaits a coroutine for at most timeout seconds (None waits forever)
+async def wait_for(coroutine, timeout: float):
+
+    import asyncio
+
+    if timeout is None:
+        return await coroutine
+
+    try:
+        return await asyncio.wait_for(coroutine, timeout)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Deadline exceeded") from None
+
+
+# thread safe token bucket limiting calls to rate per second, allowing bursts of burst calls
+class RateLimiter:
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+
+        # calls allowed per second
+        self.rate: float = rate
+
+        # calls allowed at once after a quiet period
+        self.burst: int = burst
+
+        self._tokens: float = burst
+        self._updated: float = time.monotonic()
+        self._lock = threading.Lock()
+
+    # blocks until a call is allowed
+    def acquire(self) -> None:
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait_time = (1 - self._tokens) / self.rate
+
+            time.sleep(wait_time)
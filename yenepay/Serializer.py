@@ -0,0 +1,85 @@
+from yenepay.Models import IPN, PDT
+
+# yenepay payloads are sent as compact json, non-ascii characters escaped as \uXXXX like json.dumps does
+# orjson is used when installed, the standard library otherwise, both give the same bytes
+# the backend is imported when the first payload is encoded (importing orjson takes longer than json),
+# from then on dumps is the backend's encoder
+
+
+# json encoder from the standard library, json.dumps without the whitespace
+def _std_dumps(obj) -> bytes:
+
+    import json
+
+    return json.dumps(obj, separators=(",", ":")).encode("ascii")
+
+
+# orjson encoder, payloads with non-ascii text (which orjson writes as raw UTF-8) are encoded again by
+# _std_dumps, whose C encoder escapes it faster than rewriting orjson's output
+def _orjson_dumps(obj) -> bytes:
+
+    data = _orjson(obj)
+
+    return data if data.isascii() else _std_dumps(obj)
+
+
+# orjson.dumps, None until it is imported
+_orjson = None
+
+
+# the backend's encoder, None until it is imported
+_backend = None
+
+
+# imports the backend and binds dumps and BACKEND to it
+def _load():
+
+    global _backend, _orjson, dumps, BACKEND
+
+    try:
+        import orjson
+    except ImportError:
+        _backend, BACKEND = _std_dumps, "json"
+    else:
+        _orjson = orjson.dumps
+        _backend, BACKEND = _orjson_dumps, "orjson"
+
+    dumps = _backend
+
+    return _backend
+
+
+# encodes obj as compact json
+# replaced by the backend's function on first use, modules that imported it earlier call through here
+def dumps(obj) -> bytes:
+
+    return (_backend or _load())(obj)
+
+
+# name of the json backend, "orjson" or "json"
+def __getattr__(name: str):
+
+    if name == "BACKEND":
+        _load()
+
+        return BACKEND
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# checkout request body (PaymentHandler or Checkout)
+def encode_checkout(handler) -> bytes:
+
+    return dumps(handler.as_dict())
+
+
+# pdt request body
+def encode_pdt(pdt: PDT) -> bytes:
+
+    return dumps(pdt.as_dict())
+
+
+# ipn verification request body
+def encode_ipn(ipn: IPN) -> bytes:
+
+    return dumps(ipn.as_dict())
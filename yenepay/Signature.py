@@ -0,0 +1,167 @@
+import base64
+import binascii
+import os
+import threading
+from typing import Callable, Iterable, List
+
+from yenepay.Models import IPN
+
+# ipn fields covered by the signature, in signing order
+SIGNED_FIELDS = (
+    ("TotalAmount", "totalAmount"),
+    ("BuyerId", "buyerId"),
+    ("MerchantOrderId", "merchantOrderId"),
+    ("MerchantId", "merchantId"),
+    ("MerchantCode", "merchantCode"),
+    ("TransactionId", "transactionId"),
+    ("TransactionCode", "transactionCode"),
+    ("Status", "status"),
+    ("Currency", "currency"),
+)
+
+
+# string the ipn signature is computed over: signed fields as key=value pairs joined by &
+def canonical_string(ipn: IPN) -> bytes:
+
+    parts = []
+
+    for key, attr in SIGNED_FIELDS:
+        value = getattr(ipn, attr)
+        parts.append(f"{key}={'' if value is None else value}")
+
+    return "&".join(parts).encode("utf-8")
+
+
+# loads a PEM encoded public key (requires the optional cryptography package)
+def load_public_key(pem: bytes):
+
+    from cryptography.hazmat.primitives.serialization import load_pem_public_key
+
+    return load_pem_public_key(pem)
+
+
+# base64 RSA-SHA256 signature of an ipn, for tests and local stand-in servers
+def sign_ipn(ipn: IPN, privateKeyPem: bytes, canonicalize: Callable[[IPN], bytes] = canonical_string) -> str:
+
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+    from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+    key = load_pem_private_key(privateKeyPem, password=None)
+    signature = key.sign(canonicalize(ipn), padding.PKCS1v15(), hashes.SHA256())
+
+    return base64.b64encode(signature).decode("ascii")
+
+
+# verifies ipn signatures locally against yenepay's public key(s)
+# several keys can be active at once to support key rotation
+# keys given as a file path are loaded once and reloaded when the file changes
+class SignatureVerifier:
+
+    def __init__(self, publicKeys: Iterable[bytes] = (), keyFile: str = None, remoteFallback: bool = True,
+                 canonicalize: Callable[[IPN], bytes] = canonical_string) -> None:
+
+        # PEM file with one or more public keys, checked for changes on every verification
+        self.keyFile: str = keyFile
+
+        # ask yenepay to verify an ipn whose signature does not match locally
+        self.remoteFallback: bool = remoteFallback
+
+        # builds the signed string of an ipn
+        self.canonicalize: Callable[[IPN], bytes] = canonicalize
+
+        self._keys: List = [load_public_key(pem) for pem in publicKeys]
+        self._fileKeys: List = []
+        self._fileMtime: float = None
+        self._lock = threading.Lock()
+
+        if keyFile is not None:
+            self.refresh()
+
+    # adds a public key, e.g. the next key before yenepay rotates to it
+    def add_key(self, pem: bytes) -> None:
+
+        key = load_public_key(pem)
+
+        with self._lock:
+            self._keys = self._keys + [key]
+
+    # replaces the public keys given in code
+    def set_keys(self, pems: Iterable[bytes]) -> None:
+
+        keys = [load_public_key(pem) for pem in pems]
+
+        with self._lock:
+            self._keys = keys
+
+    # reloads keyFile if it changed since it was last read
+    # once keys were loaded, a file that is missing or unreadable (e.g. while it is being replaced)
+    # keeps the loaded keys, and is read again on the next verification
+    def refresh(self) -> None:
+
+        if self.keyFile is None:
+            return
+
+        try:
+            mtime = os.stat(self.keyFile).st_mtime
+
+            if mtime == self._fileMtime:
+                return
+
+            with open(self.keyFile, "rb") as f:
+                data = f.read()
+
+            keys = [load_public_key(pem) for pem in _split_pem(data)]
+        except (OSError, ValueError):
+            if self._fileMtime is None:
+                raise
+
+            import logging
+            logging.getLogger("yenepay").warning("yenepay public key file %s not reloaded, keeping the loaded keys",
+                                                 self.keyFile, exc_info=True)
+            return
+
+        with self._lock:
+            self._fileKeys = keys
+            self._fileMtime = mtime
+
+    # True if the ipn signature matches one of the public keys
+    def verify(self, ipn: IPN) -> bool:
+
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+
+        if not ipn.signature:
+            return False
+
+        try:
+            signature = base64.b64decode(ipn.signature, validate=True)
+        except (binascii.Error, ValueError):
+            return False
+
+        self.refresh()
+
+        data = self.canonicalize(ipn)
+
+        for key in self._keys + self._fileKeys:
+            try:
+                key.verify(signature, data, padding.PKCS1v15(), hashes.SHA256())
+                return True
+            except InvalidSignature:
+                pass
+
+        return False
+
+
+# splits concatenated PEM blocks
+def _split_pem(data: bytes) -> List[bytes]:
+
+    end = b"-----END PUBLIC KEY-----"
+    blocks = []
+
+    for block in data.split(end):
+        if b"-----BEGIN" in block:
+            blocks.append(block.strip() + b"\n" + end + b"\n")
+
+    return blocks
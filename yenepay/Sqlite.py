@@ -0,0 +1,38 @@
+import threading
+
+
+# opens a sqlite database in WAL mode so several processes can read while one writes
+# sqlite3 is imported on first use, processes without a sqlite backed store don't load it
+def connect(path: str, timeout: float = 5.0) -> "sqlite3.Connection":
+
+    import sqlite3
+
+    connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+
+    return connection
+
+
+# one connection per thread to the same database
+class LocalConnections:
+
+    def __init__(self, path: str, timeout: float = 5.0) -> None:
+
+        # path of the database file
+        self.path: str = path
+
+        # seconds to wait for a lock held by another connection
+        self.timeout: float = timeout
+
+        self._local = threading.local()
+
+    # connection of the calling thread
+    def get(self) -> "sqlite3.Connection":
+
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None:
+            connection = self._local.connection = connect(self.path, self.timeout)
+
+        return connection
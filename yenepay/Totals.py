@@ -0,0 +1,82 @@
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Tuple, Union
+
+# amounts are kept in integer minor units (santim, 1 birr = 100 santim)
+# and tax rates in integer parts per million so running totals never drift
+MINOR_PER_UNIT = 100
+RATE_SCALE = 1000000
+
+
+# converts an amount in birr to santim, rounding half up
+def to_minor(amount: float) -> int:
+
+    return int((Decimal(str(amount)) * MINOR_PER_UNIT).to_integral_value(ROUND_HALF_UP))
+
+
+# converts santim back to birr, whole amounts are returned as int
+def to_major(minor: int) -> Union[int, float]:
+
+    if minor % MINOR_PER_UNIT == 0:
+        return minor // MINOR_PER_UNIT
+
+    return minor / MINOR_PER_UNIT
+
+
+# converts a tax rate (e.g. 0.15 for 15% VAT) to parts per million
+def to_rate(rate: float) -> int:
+
+    if rate is None:
+        return 0
+
+    if rate < 0:
+        raise ValueError(f"Invalid Rate: got negative rate {rate}")
+
+    return int((Decimal(str(rate)) * RATE_SCALE).to_integral_value(ROUND_HALF_UP))
+
+
+# tax in santim for a line of quantity items at price santim each, rounded half up
+def line_tax(price: int, quantity: int, rate: int) -> int:
+
+    return (price * quantity * rate + RATE_SCALE // 2) // RATE_SCALE
+
+
+# vectorized totals for very large carts or many invoices at once (requires numpy)
+# prices are in birr, rates are fractions (scalars or arrays)
+# prices and rates are converted with to_minor and to_rate, so totals match Cart's to the santim
+# returns (subtotal, tax1, tax2) in santim, or arrays of them per invoice when
+# groups (the invoice index of every line, 0 based) is given
+def bulk_totals(prices, quantities, vat_rates=0.0, tot_rates=0.0, groups=None) -> Tuple:
+
+    import numpy as np
+
+    price = _convert(np, prices, to_minor)
+    quantity = np.asarray(quantities, dtype=np.int64)
+    vat = _convert(np, vat_rates, to_rate)
+    tot = _convert(np, tot_rates, to_rate)
+
+    amount = price * quantity
+    tax1 = (amount * vat + RATE_SCALE // 2) // RATE_SCALE
+    tax2 = (amount * tot + RATE_SCALE // 2) // RATE_SCALE
+
+    if groups is None:
+        return int(amount.sum()), int(tax1.sum()), int(tax2.sum())
+
+    groups = np.asarray(groups, dtype=np.int64)
+
+    def per_group(values):
+        totals = np.zeros(groups.max() + 1, dtype=np.int64)
+        np.add.at(totals, groups, values)
+        return totals
+
+    return per_group(amount), per_group(tax1), per_group(tax2)
+
+
+# applies a scalar conversion (to_minor, to_rate) to an array, once per distinct value
+# rounding the binary floats directly (np.rint(x * 100)) rounds 1.005 down and half to even
+def _convert(np, values, convert):
+
+    values = np.asarray(values, dtype=np.float64)
+    distinct, index = np.unique(values, return_inverse=True)
+    converted = np.array([convert(float(value)) for value in distinct], dtype=np.int64)
+
+    return converted[index].reshape(values.shape)
@@ -0,0 +1,165 @@
+import threading
+from typing import Optional, Tuple
+
+from yenepay.Exceptions import QuotaExceeded
+
+
+# yenepay hosts a transport can open connections to ahead of time
+SANDBOX_HOST = "https://testapi.yenepay.com/"
+PROD_HOST = "https://endpoints.yenepay.com/"
+
+
+# minimal http response handed back by transports
+class Response:
+
+    __slots__ = ("status_code", "content", "timings")
+
+    def __init__(self, status_code: int, content: bytes, timings: Tuple[float, float, float] = None) -> None:
+
+        # http status code returned by the server
+        self.status_code: int = status_code
+
+        # raw response body
+        self.content: bytes = content
+
+        # seconds spent on (tcp connect, tls handshake, request and response) if the transport measures them
+        self.timings: Tuple[float, float, float] = timings
+
+    # decoded json body
+    def json(self):
+
+        import json
+
+        return json.loads(self.content)
+
+
+# interface every transport implements
+# swap in a stub (any object with a matching post method) to test without network
+# timeout, when given, caps the seconds the call may take
+# transports raise TransportError when no response is received
+class Transport:
+
+    def post(self, url: str, data: bytes, headers: dict, timeout: float = None) -> Response:
+
+        raise NotImplementedError
+
+    def close(self) -> None:
+
+        pass
+
+
+_default_transport: Optional[Transport] = None
+_default_async_transport: Optional["AsyncTransport"] = None
+_default_lock = threading.Lock()
+
+
+# caps the requests one user (e.g. a merchant) has in flight on a transport shared with others
+# a request waits up to its timeout (or wait seconds without one) for a free slot, then raises QuotaExceeded
+class QuotaTransport(Transport):
+
+    def __init__(self, transport: Transport, maxConcurrent: int, name: str = "transport", wait: float = 1.0) -> None:
+
+        # shared transport the requests are sent through
+        self.transport: Transport = transport
+
+        # most requests in flight at once
+        self.maxConcurrent: int = maxConcurrent
+
+        # label used in errors, e.g. the merchant code
+        self.name: str = name
+
+        # seconds a request without a timeout waits for a slot
+        self.wait: float = wait
+
+        self._slots = threading.BoundedSemaphore(maxConcurrent)
+
+    def post(self, url: str, data: bytes, headers: dict, timeout: float = None) -> Response:
+
+        if not self._slots.acquire(timeout=self.wait if timeout is None else min(self.wait, timeout)):
+            raise QuotaExceeded(self.name, self.maxConcurrent)
+
+        try:
+            if timeout is None:
+                return self.transport.post(url, data, headers)
+
+            return self.transport.post(url, data, headers, timeout)
+        finally:
+            self._slots.release()
+
+    # the shared transport is closed by its owner
+    def close(self) -> None:
+
+        pass
+
+
+# returns the process wide transport shared by handlers that were not given one
+def default_transport() -> Transport:
+
+    global _default_transport
+
+    if _default_transport is None:
+        with _default_lock:
+            if _default_transport is None:
+                from yenepay.HttpTransport import RequestsTransport
+
+                _default_transport = RequestsTransport()
+
+    return _default_transport
+
+
+# replaces the process wide transport (e.g. with a tuned pool or a test stub)
+def set_default_transport(transport: Transport) -> None:
+
+    global _default_transport
+
+    with _default_lock:
+        _default_transport = transport
+
+
+# interface for transports awaited by AsyncPaymentHandler
+class AsyncTransport:
+
+    async def post(self, url: str, data: bytes, headers: dict, timeout: float = None) -> Response:
+
+        raise NotImplementedError
+
+    async def close(self) -> None:
+
+        pass
+
+
+# returns the process wide async transport shared by async handlers that were not given one
+# it keeps a connection pool per event loop
+def default_async_transport() -> AsyncTransport:
+
+    global _default_async_transport
+
+    if _default_async_transport is None:
+        with _default_lock:
+            if _default_async_transport is None:
+                from yenepay.HttpTransport import PerLoopAsyncTransport
+
+                _default_async_transport = PerLoopAsyncTransport()
+
+    return _default_async_transport
+
+
+# replaces the process wide async transport
+def set_default_async_transport(transport: AsyncTransport) -> None:
+
+    global _default_async_transport
+
+    with _default_lock:
+        _default_async_transport = transport
+
+
+# RequestsTransport and the httpx transports live in yenepay.HttpTransport, imported on first use
+# so processes that never send a request don't load requests and urllib3
+def __getattr__(name: str):
+
+    if name in ("RequestsTransport", "HttpxAsyncTransport", "PerLoopAsyncTransport"):
+        from yenepay import HttpTransport
+
+        return getattr(HttpTransport, name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,127 @@
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from yenepay.OrderId import MAX_ORDER_ID_LENGTH
+
+
+# a problem found in a checkout
+class Violation(NamedTuple):
+
+    field: str
+    message: str
+
+
+# what a checkout has to satisfy before it is sent to yenepay
+# immutable, validators are compiled once per distinct rules
+class CheckoutRules(NamedTuple):
+
+    # url fields that must be set
+    requiredUrls: Tuple[str, ...] = ("successUrl", "ipnUrl")
+
+    # longest merchant order id
+    maxOrderIdLength: int = MAX_ORDER_ID_LENGTH
+
+    # most different items in a Cart checkout, None for no limit (yenepay documents none)
+    maxItems: int = None
+
+    # largest expiresAfter in minutes (30 days)
+    maxExpiresAfter: int = 43200
+
+    # largest expiresInDays
+    maxExpiresInDays: int = 30
+
+
+# url fields of a checkout, checked for an http(s) scheme when set
+URL_FIELDS = ("ipnUrl", "successUrl", "cancelUrl", "failureUrl")
+
+# checkout process names (ProcessType values)
+PROCESSES = ("Express", "Cart")
+
+_validators: Dict[CheckoutRules, Callable] = {}
+
+
+# validator for rules, compiled on first use and shared afterwards
+# a validator takes a PaymentHandler and returns every violation found (an empty list if valid)
+def compile_rules(rules: CheckoutRules = None) -> Callable[[object], List[Violation]]:
+
+    if rules is None:
+        rules = CheckoutRules()
+
+    validator = _validators.get(rules)
+
+    if validator is None:
+        validator = _validators[rules] = _compile(rules)
+
+    return validator
+
+
+# generates a validate function with the rules' limits inlined
+def _compile(rules: CheckoutRules) -> Callable:
+
+    body = [
+        "    v = []",
+        "    m = h.merchantId",
+        "    if not (isinstance(m, str) and len(m) >= 4 and m.isdigit()):",
+        "        v.append(Violation('merchantId', 'must be a code of at least 4 digits'))",
+        "    o = h.merchantOrderId",
+        "    if not o or not isinstance(o, str):",
+        "        v.append(Violation('merchantOrderId', 'is required'))",
+        f"    elif len(o) > {rules.maxOrderIdLength}:",
+        f"        v.append(Violation('merchantOrderId', 'is longer than {rules.maxOrderIdLength} characters'))",
+        "    p = h.process",
+        f"    if p not in {PROCESSES!r}:",
+        "        v.append(Violation('process', f'is not one of Express, Cart: {p!r}'))",
+    ]
+
+    for field in URL_FIELDS:
+        body.append(f"    u = h.{field}")
+
+        if field in rules.requiredUrls:
+            body.append("    if not u:")
+            body.append(f"        v.append(Violation({field!r}, 'is required'))")
+            body.append("    elif not (isinstance(u, str) and u.startswith(('http://', 'https://'))):")
+        else:
+            body.append("    if u is not None and not (isinstance(u, str) and u.startswith(('http://', 'https://'))):")
+
+        body.append(f"        v.append(Violation({field!r}, 'must be an http or https url'))")
+
+    body += [
+        "    n = len(h.items)",
+        "    if n == 0:",
+        "        v.append(Violation('items', 'must not be empty'))",
+        "    elif p == 'Express' and n > 1:",
+        "        v.append(Violation('items', f'must be a single item in Express mode, got {n}'))",
+    ]
+
+    if rules.maxItems is not None:
+        body += [
+            f"    elif n > {rules.maxItems}:",
+            f"        v.append(Violation('items', f'must be at most {rules.maxItems} items, got {{n}}'))",
+        ]
+
+    body += [
+        "    for i, d in enumerate(h.items):",
+        "        if not d.get('itemId'):",
+        "            v.append(Violation(f'items[{i}].itemId', 'is required'))",
+        "        if not d.get('itemName'):",
+        "            v.append(Violation(f'items[{i}].itemName', 'is required'))",
+        "        x = d.get('unitPrice')",
+        "        if not isinstance(x, (int, float)) or isinstance(x, bool) or x < 0:",
+        "            v.append(Violation(f'items[{i}].unitPrice', f'must be a non negative amount, got {x!r}'))",
+        "        x = d.get('quantity')",
+        "        if not isinstance(x, int) or isinstance(x, bool) or x < 1:",
+        "            v.append(Violation(f'items[{i}].quantity', f'must be a positive whole number, got {x!r}'))",
+        "    x = h.expiresAfter",
+        f"    if x is not None and not (isinstance(x, int) and 0 < x <= {rules.maxExpiresAfter}):",
+        f"        v.append(Violation('expiresAfter', f'must be 1 to {rules.maxExpiresAfter} minutes, got {{x!r}}'))",
+        "    x = h.expiresInDays",
+        f"    if x is not None and not (isinstance(x, int) and 0 < x <= {rules.maxExpiresInDays}):",
+        f"        v.append(Violation('expiresInDays', f'must be 1 to {rules.maxExpiresInDays} days, got {{x!r}}'))",
+        "    if n and not v and h.total <= 0:",
+        "        v.append(Violation('total', 'must be positive'))",
+        "    return v",
+    ]
+
+    namespace = {"Violation": Violation}
+    exec("def validate(h) -> list:\n" + "\n".join(body), namespace)
+
+    return namespace["validate"]